@@ -0,0 +1,98 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Actor that processes its messages in order in a dedicated thread."""
+
+import queue
+import threading
+from typing import Any, Callable
+
+from absl import logging
+
+# Sentinel to stop the actor thread.
+_STOP = object()
+
+
+class Actor(object):
+  """Executes the functions sent to its mailbox one by one.
+
+  Functions are executed in the order they are sent by a single thread. Hence,
+  they don't need to be synchronized with each other. If a function raises an
+  exception, it is logged and the next one is executed.
+  """
+
+  def __init__(self, name: str = 'actor'):
+    """Creates an Actor.
+
+    Args:
+      name: Name of the actor, used for the thread.
+    """
+    self._mailbox = queue.Queue()
+    self._lock = threading.Lock()
+    self._closed = False
+    self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+    self._thread.start()
+
+  def _run(self):
+    """Executes the functions in the mailbox."""
+    while True:
+      item = self._mailbox.get()
+      if item is _STOP:
+        return
+      fn, args = item
+      try:
+        fn(*args)
+      except Exception:  # pylint: disable=broad-except
+        logging.exception('Actor failed to process the message.')
+
+  def send(self, fn: Callable[..., Any], *args) -> bool:
+    """Adds a function call to the mailbox.
+
+    Args:
+      fn: Function to call.
+      *args: Arguments of the function.
+
+    Returns:
+      True if the call is added, i.e. the actor is not closed.
+    """
+    with self._lock:
+      if self._closed:
+        return False
+      self._mailbox.put((fn, args))
+    return True
+
+  def in_actor_thread(self) -> bool:
+    """Returns true if called from the thread of the actor."""
+    return threading.current_thread() is self._thread
+
+  @property
+  def pending(self) -> int:
+    """Number of messages waiting in the mailbox."""
+    return self._mailbox.qsize()
+
+  def close(self, wait: bool = True):
+    """Stops the actor after the pending messages are processed.
+
+    Args:
+      wait: Whether to wait for the pending messages to be processed. It has no
+        effect if called from the actor thread.
+    """
+    with self._lock:
+      if self._closed:
+        return
+      self._closed = True
+      self._mailbox.put(_STOP)
+    if wait and not self.in_actor_thread():
+      self._thread.join()
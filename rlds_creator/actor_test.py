@@ -0,0 +1,74 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.actor."""
+
+import threading
+
+from absl.testing import absltest
+from rlds_creator import actor
+
+
+class ActorTest(absltest.TestCase):
+
+  def test_send(self):
+    a = actor.Actor()
+    calls = []
+    threads = set()
+
+    def record(value):
+      calls.append(value)
+      threads.add(threading.current_thread())
+
+    for i in range(10):
+      self.assertTrue(a.send(record, i))
+    a.close()
+    # Messages should be processed in order by a single thread.
+    self.assertSequenceEqual(list(range(10)), calls)
+    self.assertLen(threads, 1)
+    self.assertNotIn(threading.current_thread(), threads)
+    self.assertFalse(a.send(record, 10))
+
+  def test_failure(self):
+    a = actor.Actor()
+    calls = []
+
+    def fail():
+      raise ValueError('Failure.')
+
+    a.send(fail)
+    a.send(calls.append, 1)
+    a.close()
+    self.assertSequenceEqual([1], calls)
+
+  def test_close_from_actor_thread(self):
+    a = actor.Actor()
+    done = threading.Event()
+    in_actor_thread = []
+
+    def close():
+      in_actor_thread.append(a.in_actor_thread())
+      # Should not block.
+      a.close()
+      done.set()
+
+    a.send(close)
+    self.assertTrue(done.wait(5))
+    self.assertSequenceEqual([True], in_actor_thread)
+    self.assertFalse(a.in_actor_thread())
+
+
+if __name__ == '__main__':
+  absltest.main()
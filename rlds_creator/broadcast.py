@@ -0,0 +1,107 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fans out the messages of a session to its spectators."""
+
+import abc
+import threading
+from typing import Any, Dict, List
+
+
+class Subscriber(metaclass=abc.ABCMeta):
+  """Receives the messages of a broadcast, e.g. a spectator connection."""
+
+  @abc.abstractmethod
+  def deliver(self, data: bytes, is_frame: bool) -> bool:
+    """Queues a message for sending. It should not block.
+
+    Args:
+      data: Serialized message. The same object is delivered to all the
+        subscribers.
+      is_frame: Whether the message is a frame that can be dropped in favor of
+        a newer one.
+
+    Returns:
+      True if the message is queued, false if the subscriber is closed.
+    """
+
+  @abc.abstractmethod
+  def on_broadcast_end(self):
+    """Called when the broadcast ends, e.g. the session is closed."""
+
+
+class Broadcast(object):
+  """Delivers the serialized messages to a dynamic set of subscribers.
+
+  Messages are serialized once by the publisher and delivered to each
+  subscriber without blocking; a slow subscriber drops its frames, but doesn't
+  slow down the publisher or the other subscribers.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._subscribers: List[Subscriber] = []
+    self._closed = False
+    self._num_published = 0
+
+  def subscribe(self, subscriber: Subscriber) -> bool:
+    """Adds a subscriber. Returns false if the broadcast has ended."""
+    with self._lock:
+      if self._closed:
+        return False
+      self._subscribers.append(subscriber)
+      return True
+
+  def unsubscribe(self, subscriber: Subscriber):
+    """Removes the subscriber, if present."""
+    with self._lock:
+      if subscriber in self._subscribers:
+        self._subscribers.remove(subscriber)
+
+  @property
+  def num_subscribers(self) -> int:
+    return len(self._subscribers)
+
+  def publish(self, data: bytes, is_frame: bool = True):
+    """Delivers the message to the subscribers.
+
+    Args:
+      data: Serialized message.
+      is_frame: Whether the message is a frame that can be dropped by a slow
+        subscriber in favor of a newer one.
+    """
+    with self._lock:
+      subscribers = list(self._subscribers)
+      self._num_published += 1
+    closed = [s for s in subscribers if not s.deliver(data, is_frame)]
+    for subscriber in closed:
+      self.unsubscribe(subscriber)
+
+  def close(self):
+    """Ends the broadcast and notifies the subscribers."""
+    with self._lock:
+      self._closed = True
+      subscribers = self._subscribers
+      self._subscribers = []
+    for subscriber in subscribers:
+      subscriber.on_broadcast_end()
+
+  def stats(self) -> Dict[str, Any]:
+    """Returns the statistics of the broadcast."""
+    with self._lock:
+      return {
+          'num_subscribers': len(self._subscribers),
+          'num_published': self._num_published,
+      }
@@ -0,0 +1,92 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.broadcast."""
+
+from absl.testing import absltest
+from rlds_creator import broadcast
+
+
+class FakeSubscriber(broadcast.Subscriber):
+
+  def __init__(self):
+    self.messages = []
+    self.closed = False
+    self.ended = False
+
+  def deliver(self, data: bytes, is_frame: bool) -> bool:
+    if self.closed:
+      return False
+    self.messages.append((data, is_frame))
+    return True
+
+  def on_broadcast_end(self):
+    self.ended = True
+
+
+class BroadcastTest(absltest.TestCase):
+
+  def test_publish(self):
+    b = broadcast.Broadcast()
+    subscribers = [FakeSubscriber(), FakeSubscriber()]
+    for subscriber in subscribers:
+      self.assertTrue(b.subscribe(subscriber))
+    self.assertEqual(2, b.num_subscribers)
+    data = b'frame'
+    b.publish(data)
+    b.publish(b'config', is_frame=False)
+    for subscriber in subscribers:
+      self.assertEqual([(data, True), (b'config', False)], subscriber.messages)
+      # The same object is delivered to all the subscribers.
+      self.assertIs(data, subscriber.messages[0][0])
+    self.assertEqual({
+        'num_subscribers': 2,
+        'num_published': 2
+    }, b.stats())
+
+  def test_unsubscribe(self):
+    b = broadcast.Broadcast()
+    subscriber = FakeSubscriber()
+    b.subscribe(subscriber)
+    b.unsubscribe(subscriber)
+    # Unsubscribing again is a no-op.
+    b.unsubscribe(subscriber)
+    b.publish(b'frame')
+    self.assertEqual(0, b.num_subscribers)
+    self.assertEmpty(subscriber.messages)
+
+  def test_closed_subscriber(self):
+    b = broadcast.Broadcast()
+    open_subscriber, closed_subscriber = FakeSubscriber(), FakeSubscriber()
+    b.subscribe(open_subscriber)
+    b.subscribe(closed_subscriber)
+    closed_subscriber.closed = True
+    b.publish(b'frame')
+    self.assertEqual(1, b.num_subscribers)
+    self.assertLen(open_subscriber.messages, 1)
+
+  def test_close(self):
+    b = broadcast.Broadcast()
+    subscriber = FakeSubscriber()
+    b.subscribe(subscriber)
+    b.close()
+    self.assertTrue(subscriber.ended)
+    self.assertEqual(0, b.num_subscribers)
+    # New subscribers are rejected after the broadcast ends.
+    self.assertFalse(b.subscribe(FakeSubscriber()))
+
+
+if __name__ == '__main__':
+  absltest.main()
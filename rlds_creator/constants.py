@@ -31,6 +31,8 @@ METADATA_NAMESPACE = 'rlds_creator:'
 METADATA_IMAGE = 'image'
 METADATA_INFO = 'info'
 METADATA_KEYS = 'keys'
+# Number of the action requests that are merged into the step in sync mode.
+METADATA_NUM_ACTIONS = 'num_actions'
 
 
 class EnvType(enum.Enum):
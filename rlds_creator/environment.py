@@ -17,7 +17,7 @@
 
 import abc
 import enum
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Union
 
 import dataclasses
 import dm_env
@@ -26,6 +26,9 @@ import numpy as np
 DMEnv = dm_env.Environment
 TimeStep = dm_env.TimeStep
 Image = np.ndarray
+# Characters and colors of a text screen, i.e. a uint8 array with shape (rows,
+# columns, 2). See text_stream for its encoding.
+TextScreen = np.ndarray
 # Active keys and their values. For digital keys, e.g. a keyboard key, the value
 # will be 1. For analog keys, e.g. from a gamepad, the values are floating point
 # numbers (in the range [-1.0, 1.0] for stick axes and (0, 1.0] for buttons).
@@ -57,6 +60,21 @@ class Camera:
   name: str = ''
 
 
+@dataclasses.dataclass
+class StepResult:
+  """Result of a step taken with the user input."""
+  # Action that the user input is mapped to.
+  action: Any
+  # Timestep after the action is taken. None if the step is skipped.
+  timestep: Optional[TimeStep] = None
+  # Auxiliary information of the step.
+  info: Any = None
+  # Rendered image or text screen after the step. None if it is not rendered.
+  image: Optional[Union[Image, TextScreen]] = None
+  # True if the image is a text screen.
+  is_text: bool = False
+
+
 class Environment(metaclass=abc.ABCMeta):
   """Base class for environments."""
 
@@ -76,6 +94,13 @@ class Environment(metaclass=abc.ABCMeta):
   def render(self) -> Image:
     """Returns the environment as an image."""
 
+  def render_text(self) -> Optional[TextScreen]:
+    """Returns the environment as a text screen or None if it is not text based.
+
+    Text screens can be streamed to the client instead of the rendered images.
+    """
+    return None
+
   def set_camera(self, index: int) -> Optional[Camera]:
     """Sets the camera to render images.
 
@@ -96,3 +121,46 @@ class Environment(metaclass=abc.ABCMeta):
   def step_info(self) -> Any:
     """Returns the auxiliary information of the last step."""
     return None
+
+  def step_with_user_input(self,
+                           user_input: UserInput,
+                           render: bool = True,
+                           render_text: bool = False,
+                           skip_none_action: bool = False) -> StepResult:
+    """Maps the user input to an action, takes the step and renders the result.
+
+    The proxied environments do this in a single exchange with their process.
+
+    Args:
+      user_input: User input.
+      render: Whether to render the environment after the step.
+      render_text: Whether to render the text screen instead of the image if the
+        environment is text based.
+      skip_none_action: If true, then the step is not taken if the user input is
+        mapped to a None action.
+
+    Returns:
+      The result of the step.
+    """
+    action = self.user_input_to_action(user_input)
+    if action is None and skip_none_action:
+      return StepResult(action=None)
+    result = StepResult(
+        action=action, timestep=self.env().step(action), info=self.step_info())
+    if render:
+      if render_text:
+        result.image = self.render_text()
+        result.is_text = result.image is not None
+      if result.image is None:
+        result.image = self.render()
+    return result
+
+  def can_reset_in_background(self) -> bool:
+    """Returns true if the environment can be reset by a background thread.
+
+    If so, the environment is reset while the user confirms saving the last
+    episode, which doesn't need the environment. It is not used by the other
+    threads during the reset. Environments that are not thread-compatible, e.g.
+    the ones that render with a thread-bound context, should keep the default.
+    """
+    return False
@@ -15,8 +15,19 @@
 
 """Environment factory."""
 
+import dataclasses
+import functools
+import importlib
+import multiprocessing
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from absl import logging
+import dm_env
 from rlds_creator import environment
 from rlds_creator import environment_proxy
+from rlds_creator import jobs
+from rlds_creator import scheduler
 from rlds_creator import study_pb2
 
 HAS_PROCO = None
@@ -58,12 +69,410 @@ def _create_local_env_from_spec(
     raise ValueError('Unsupported environment spec.')
 
 
+# Modules of the proxied environments that are imported by their zygotes.
+_PROXIED_ENV_MODULES = {
+    'net_hack': 'rlds_creator.envs.net_hack_env',
+    'robosuite': 'rlds_creator.envs.robosuite_env',
+}
+
+# Whether the proxied environments pass the images and the observations in
+# shared memory.
+_proxy_shared_memory = False
+
+# Zygotes of the proxied environment types.
+_zygotes: Dict[str, environment_proxy.Zygote] = {}
+# Proxied environment types whose zygotes died. They are not restarted, since
+# forking the server at that point would let the new zygote inherit its threads
+# and connections. Their environments are spawned instead.
+_dead_zygotes: Set[str] = set()
+_zygotes_lock = threading.Lock()
+
+
+def set_proxy_shared_memory(enabled: bool):
+  """Sets whether the proxied environments that are created use shared memory.
+
+  See environment_proxy.EnvironmentProxy for details.
+
+  Args:
+    enabled: Whether to use shared memory.
+  """
+  global _proxy_shared_memory
+  _proxy_shared_memory = enabled
+
+
+def start_zygotes(env_types: Optional[List[str]] = None):
+  """Starts the zygotes that fork the proxied environments.
+
+  The zygotes should be started early, before the process opens connections or
+  files that shouldn't be inherited by the environments.
+
+  Args:
+    env_types: Proxied environment types. If None, then all of them.
+  """
+  with _zygotes_lock:
+    for env_type in env_types or PROXIED_ENVS:
+      if env_type not in PROXIED_ENVS:
+        raise ValueError(f'Not a proxied environment: {env_type}')
+      if env_type not in _zygotes:
+        _zygotes[env_type] = _start_zygote(env_type)
+        _dead_zygotes.discard(env_type)
+
+
+def stop_zygotes():
+  """Stops the zygotes. The forked environments keep running."""
+  with _zygotes_lock:
+    for zygote in _zygotes.values():
+      zygote.close()
+    _zygotes.clear()
+    _dead_zygotes.clear()
+
+
+def _start_zygote(env_type: str) -> environment_proxy.Zygote:
+  preload_fn = None
+  if env_type in _PROXIED_ENV_MODULES:
+    preload_fn = functools.partial(importlib.import_module,
+                                   _PROXIED_ENV_MODULES[env_type])
+  return environment_proxy.Zygote(_create_local_env_from_spec, preload_fn)
+
+
+def _get_zygote(env_type: str) -> Optional[environment_proxy.Zygote]:
+  """Returns the zygote of the environment type if it is alive."""
+  with _zygotes_lock:
+    zygote = _zygotes.get(env_type)
+    if zygote and not zygote.is_alive():
+      logging.warning(
+          'Zygote of %s is not alive, its environments will be spawned.',
+          env_type)
+      zygote.close()
+      del _zygotes[env_type]
+      _dead_zygotes.add(env_type)
+      zygote = None
+    return zygote
+
 
 def create_env_from_spec(env_spec: study_pb2.EnvironmentSpec,
                          mp_context=None) -> environment.Environment:
-  """Returns the environment based on the specification."""
+  """Returns the environment based on the specification.
+
+  The proxied environments are forked from their zygotes if they are started,
+  see start_zygotes(). If the zygote died, then they are spawned.
+
+  Args:
+    env_spec: Specification of the environment.
+    mp_context: Multiprocessing context used to start the process of a proxied
+      environment that doesn't have a zygote.
+  """
   env_type = env_spec.WhichOneof('type')
   if env_type in PROXIED_ENVS:
+    zygote = _get_zygote(env_type)
+    if zygote:
+      return zygote.create_env(env_spec, shared_memory=_proxy_shared_memory)
+    if mp_context is None and env_type in _dead_zygotes:
+      mp_context = multiprocessing.get_context('spawn')
     return environment_proxy.create_proxied_env_from_spec(
-        env_spec, _create_local_env_from_spec, mp_context=mp_context)
+        env_spec,
+        _create_local_env_from_spec,
+        mp_context=mp_context,
+        shared_memory=_proxy_shared_memory)
   return _create_local_env_from_spec(env_spec)
+
+
+# Default number of the idle environments that are kept for each specification.
+DEFAULT_POOL_MIN_SIZE = 1
+# Default maximum number of the idle environments for each specification.
+DEFAULT_POOL_MAX_SIZE = 2
+# Idle environments above the minimum are closed after this time.
+DEFAULT_POOL_TTL_SECS = 600.0
+# Number of the environments that are created or recycled in parallel.
+DEFAULT_POOL_MAX_WORKERS = 2
+
+# Fields of the environment specification that don't affect the environment.
+_NON_ENV_FIELDS = ('id', 'name', 'additional_instructions')
+
+
+@dataclasses.dataclass
+class PoolSize:
+  """Number of the idle environments of a specification in the pool."""
+  min_size: int = DEFAULT_POOL_MIN_SIZE
+  max_size: int = DEFAULT_POOL_MAX_SIZE
+
+
+@dataclasses.dataclass
+class _PoolEntry:
+  """Idle environments of a specification."""
+  env_spec: study_pb2.EnvironmentSpec
+  size: PoolSize
+  # Idle environments, oldest first, with the times that they became idle and
+  # their first timesteps after the reset.
+  idle: List[Tuple[float, environment.Environment,
+                   dm_env.TimeStep]] = dataclasses.field(default_factory=list)
+  # Number of the environments that are being created or recycled.
+  num_pending: int = 0
+
+
+def _get_pool_key(env_spec: study_pb2.EnvironmentSpec) -> bytes:
+  """Returns the key of the environments that can be used for the spec."""
+  env_spec = study_pb2.EnvironmentSpec.FromString(env_spec.SerializeToString())
+  for field in _NON_ENV_FIELDS:
+    env_spec.ClearField(field)
+  return env_spec.SerializeToString(deterministic=True)
+
+
+def _close_env(env: environment.Environment):
+  try:
+    env.env().close()
+  except Exception:  # pylint: disable=broad-except
+    logging.exception('Unable to close the environment.')
+
+
+class EnvironmentPool(object):
+  """Keeps created and reset environments ready for each specification.
+
+  Creating some environments takes seconds, e.g. Robosuite and DMLab. The pool
+  creates them in the background, so that they can be checked out immediately
+  when a user selects one. Released environments are reset and returned to the
+  pool while it has room, otherwise they are closed. Idle environments above
+  the minimum size of their specification are closed after a while.
+  """
+
+  def __init__(self,
+               create_env_fn: Callable[[study_pb2.EnvironmentSpec],
+                                       environment.Environment] = (
+                                           create_env_from_spec),
+               default_size: Optional[PoolSize] = None,
+               sizes: Optional[Dict[str, PoolSize]] = None,
+               ttl_secs: float = DEFAULT_POOL_TTL_SECS,
+               max_workers: int = DEFAULT_POOL_MAX_WORKERS):
+    """Creates an EnvironmentPool.
+
+    Args:
+      create_env_fn: Function to create an environment from its specification.
+      default_size: Default size of the specifications in the pool.
+      sizes: Sizes of the specifications in the pool by the environment type,
+        e.g. robosuite. They override the default size.
+      ttl_secs: Time after which the idle environments above the minimum size
+        are closed.
+      max_workers: Number of the environments that are created or recycled in
+        parallel.
+    """
+    self._create_env_fn = create_env_fn
+    self._default_size = default_size or PoolSize()
+    self._sizes = sizes or {}
+    self._ttl_secs = ttl_secs
+    self._executor = jobs.JobExecutor(
+        max_workers=max_workers, name='environment_pool')
+    self._lock = threading.Lock()
+    self._entries: Dict[bytes, _PoolEntry] = {}
+    # Keys of the checked out environments, keyed by their IDs.
+    self._checked_out: Dict[int, bytes] = {}
+    # First timesteps of the checked out environments that were reset by the
+    # pool, keyed by their IDs. See take_reset_timestep().
+    self._reset_timesteps: Dict[int, dm_env.TimeStep] = {}
+    self._closed = False
+    # Statistics.
+    self._num_hits = 0
+    self._num_misses = 0
+    self._num_recycled = 0
+    self._num_evicted = 0
+
+  def _get_entry(self, env_spec: study_pb2.EnvironmentSpec) -> _PoolEntry:
+    """Returns the entry of the spec. Should be called with the lock."""
+    key = _get_pool_key(env_spec)
+    entry = self._entries.get(key)
+    if entry is None:
+      size = self._sizes.get(env_spec.WhichOneof('type'), self._default_size)
+      entry = _PoolEntry(env_spec=env_spec, size=size)
+      self._entries[key] = entry
+    return entry
+
+  def warm(self,
+           env_spec: study_pb2.EnvironmentSpec,
+           size: Optional[PoolSize] = None):
+    """Creates the idle environments of the spec in the background.
+
+    Args:
+      env_spec: Specification of the environments.
+      size: Size of the specification in the pool. If not set, then the size of
+        its type or the default size is used.
+    """
+    with self._lock:
+      entry = self._get_entry(env_spec)
+      if size:
+        entry.size = size
+      self._fill(entry)
+
+  def _fill(self, entry: _PoolEntry):
+    """Creates the environments up to the minimum size. Called with the lock."""
+    while (not self._closed and
+           len(entry.idle) + entry.num_pending < entry.size.min_size):
+      if not self._submit(lambda: self._create(entry), 'create_env'):
+        return
+      entry.num_pending += 1
+
+  def _submit(self, fn: Callable[[], Any], name: str) -> bool:
+    """Executes the function in the background. Returns false on failure."""
+    try:
+      self._executor.submit(jobs.Job(lambda unused_job: fn(), name=name))
+      return True
+    except ValueError:
+      logging.warning('Environment pool is busy.')
+      return False
+
+  def _create(self, entry: _PoolEntry):
+    """Creates and resets an environment, and adds it to the pool."""
+    with self._lock:
+      if self._closed:
+        entry.num_pending -= 1
+        return
+    try:
+      env = self._create_env_fn(entry.env_spec)
+    except Exception:  # pylint: disable=broad-except
+      logging.exception('Unable to create the environment %r.', entry.env_spec)
+      with self._lock:
+        entry.num_pending -= 1
+      return
+    self._reset_and_add(entry, env)
+
+  def _reset_and_add(self, entry: _PoolEntry, env: environment.Environment):
+    """Resets the environment and adds it to the idle ones of the entry."""
+    try:
+      timestep = env.env().reset()
+    except Exception:  # pylint: disable=broad-except
+      logging.exception('Unable to reset the environment.')
+      with self._lock:
+        entry.num_pending -= 1
+      _close_env(env)
+      return
+    with self._lock:
+      entry.num_pending -= 1
+      if not self._closed:
+        entry.idle.append((scheduler.now(), env, timestep))
+        env = None
+    if env:
+      _close_env(env)
+    elif entry.size.max_size > entry.size.min_size:
+      # Checks for the environments to evict once this one expires.
+      scheduler.get_default().call_later(self._ttl_secs, self.evict_expired)
+
+  def acquire(
+      self, env_spec: study_pb2.EnvironmentSpec) -> environment.Environment:
+    """Checks out an environment of the spec.
+
+    An idle environment is returned if there is any, otherwise a new one is
+    created. The pool is refilled in the background.
+
+    Args:
+      env_spec: Specification of the environment.
+
+    Returns:
+      An environment, which should be returned to the pool with release(). If
+      it is an idle one, then it is already reset; see take_reset_timestep().
+    """
+    with self._lock:
+      entry = self._get_entry(env_spec)
+      env, timestep = None, None
+      if entry.idle:
+        _, env, timestep = entry.idle.pop()
+        self._num_hits += 1
+      else:
+        self._num_misses += 1
+      self._fill(entry)
+    if not env:
+      env = self._create_env_fn(env_spec)
+    with self._lock:
+      self._checked_out[id(env)] = _get_pool_key(env_spec)
+      if timestep is not None:
+        self._reset_timesteps[id(env)] = timestep
+    return env
+
+  def take_reset_timestep(
+      self, env: environment.Environment) -> Optional[dm_env.TimeStep]:
+    """Returns the first timestep of the checked out environment, only once.
+
+    Args:
+      env: Environment returned by acquire().
+
+    Returns:
+      The timestep returned by the reset of the environment in the pool or None
+      if it is not reset, i.e. it is created by acquire().
+    """
+    with self._lock:
+      return self._reset_timesteps.pop(id(env), None)
+
+  def release(self, env: environment.Environment):
+    """Returns the checked out environment to the pool.
+
+    The environment is reset and its camera is set to the default one. It is
+    closed if the pool is full or the environment is not from the pool.
+
+    Args:
+      env: Environment to return.
+    """
+    with self._lock:
+      key = self._checked_out.pop(id(env), None)
+      self._reset_timesteps.pop(id(env), None)
+      entry = self._entries.get(key) if key is not None else None
+      recycle = (
+          entry is not None and not self._closed and
+          len(entry.idle) + entry.num_pending < entry.size.max_size and
+          self._submit(lambda: self._recycle(entry, env), 'recycle_env'))
+      if recycle:
+        entry.num_pending += 1
+    if not recycle:
+      _close_env(env)
+
+  def _recycle(self, entry: _PoolEntry, env: environment.Environment):
+    try:
+      env.set_camera(0)
+    except Exception:  # pylint: disable=broad-except
+      logging.exception('Unable to reset the camera of the environment.')
+      with self._lock:
+        entry.num_pending -= 1
+      _close_env(env)
+      return
+    with self._lock:
+      self._num_recycled += 1
+    self._reset_and_add(entry, env)
+
+  def evict_expired(self):
+    """Closes the idle environments above the minimum size that expired."""
+    expired = []
+    deadline = scheduler.now() - self._ttl_secs
+    with self._lock:
+      for entry in self._entries.values():
+        num_evict = len(entry.idle) - entry.size.min_size
+        while num_evict > 0 and entry.idle[0][0] <= deadline:
+          expired.append(entry.idle.pop(0)[1])
+          num_evict -= 1
+      self._num_evicted += len(expired)
+    for env in expired:
+      _close_env(env)
+
+  def close(self):
+    """Closes the idle environments and stops creating new ones.
+
+    The checked out environments are closed when they are released.
+    """
+    with self._lock:
+      self._closed = True
+      idle = [
+          env for entry in self._entries.values() for _, env, _ in entry.idle
+      ]
+      for entry in self._entries.values():
+        entry.idle = []
+    for env in idle:
+      _close_env(env)
+    self._executor.shutdown(wait=False)
+
+  def stats(self) -> Dict[str, Any]:
+    """Returns the statistics of the pool."""
+    with self._lock:
+      return {
+          'num_idle': sum(len(e.idle) for e in self._entries.values()),
+          'num_pending': sum(e.num_pending for e in self._entries.values()),
+          'num_checked_out': len(self._checked_out),
+          'num_hits': self._num_hits,
+          'num_misses': self._num_misses,
+          'num_recycled': self._num_recycled,
+          'num_evicted': self._num_evicted,
+      }
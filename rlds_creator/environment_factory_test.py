@@ -0,0 +1,232 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.environment_factory."""
+
+import os
+import threading
+import time
+
+from absl.testing import absltest
+import mock
+from rlds_creator import environment
+from rlds_creator import environment_factory
+from rlds_creator import environment_proxy
+from rlds_creator import study_pb2
+
+
+def _env_spec(env_id: str = 'env', level: str = 'maze'):
+  return study_pb2.EnvironmentSpec(
+      id=env_id,
+      name=env_id,
+      procgen=study_pb2.EnvironmentSpec.Procgen(id=level))
+
+
+class _ProcessEnvironment(environment.Environment):
+  """Environment that reports the ID of its process as the action."""
+
+  def env(self):
+    return self
+
+  def keys_to_action(self, keys):
+    return os.getpid()
+
+  def render(self):
+    return None
+
+
+def _create_process_env(env_spec: study_pb2.EnvironmentSpec):
+  del env_spec
+  return _ProcessEnvironment()
+
+
+def _wait_for(condition, timeout_secs: float = 5.0):
+  deadline = time.monotonic() + timeout_secs
+  while not condition():
+    if time.monotonic() > deadline:
+      raise TimeoutError('Condition is not satisfied.')
+    time.sleep(0.01)
+
+
+class EnvironmentPoolTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.envs = []
+    self.lock = threading.Lock()
+
+  def create_env(self, env_spec: study_pb2.EnvironmentSpec):
+    env = mock.create_autospec(environment.Environment, instance=True)
+    env.spec = env_spec
+    with self.lock:
+      self.envs.append(env)
+    return env
+
+  def create_pool(self, **kwargs) -> environment_factory.EnvironmentPool:
+    pool = environment_factory.EnvironmentPool(self.create_env, **kwargs)
+    self.addCleanup(pool.close)
+    return pool
+
+  def test_warm(self):
+    pool = self.create_pool()
+    pool.warm(_env_spec(), environment_factory.PoolSize(min_size=2))
+    _wait_for(lambda: pool.stats()['num_idle'] == 2)
+    # The environments are reset before they are checked out.
+    for env in self.envs:
+      env.env().reset.assert_called_once()
+    env = pool.acquire(_env_spec())
+    self.assertIn(env, self.envs)
+    # The pool is refilled.
+    _wait_for(lambda: pool.stats()['num_idle'] == 2)
+    self.assertLen(self.envs, 3)
+    self.assertEqual(1, pool.stats()['num_hits'])
+
+  def test_take_reset_timestep(self):
+    pool = self.create_pool()
+    pool.warm(_env_spec())
+    _wait_for(lambda: pool.stats()['num_idle'] == 1)
+    env = pool.acquire(_env_spec())
+    # The timestep of the reset in the pool is returned only once.
+    self.assertIs(env.env().reset.return_value, pool.take_reset_timestep(env))
+    self.assertIsNone(pool.take_reset_timestep(env))
+    # Created environments are not reset.
+    env = pool.acquire(_env_spec(level='coinrun'))
+    self.assertIsNone(pool.take_reset_timestep(env))
+    env.env().reset.assert_not_called()
+
+  def test_sizes(self):
+    pool = self.create_pool(
+        sizes={'procgen': environment_factory.PoolSize(min_size=0)})
+    pool.warm(_env_spec())
+    self.assertEqual(0, pool.stats()['num_pending'])
+    pool.acquire(_env_spec())
+    self.assertEqual(0, pool.stats()['num_pending'])
+    self.assertLen(self.envs, 1)
+
+  def test_acquire_same_environment(self):
+    pool = self.create_pool()
+    pool.warm(_env_spec())
+    _wait_for(lambda: pool.stats()['num_idle'] == 1)
+    # Environments with a different ID and name in another study are the same.
+    env = pool.acquire(_env_spec(env_id='other'))
+    self.assertIs(self.envs[0], env)
+    # But not the ones with different settings.
+    _wait_for(lambda: pool.stats()['num_idle'] == 1)
+    env = pool.acquire(_env_spec(level='coinrun'))
+    self.assertEqual('coinrun', env.spec.procgen.id)
+    self.assertEqual(1, pool.stats()['num_misses'])
+
+  def test_acquire_empty(self):
+    pool = self.create_pool(
+        default_size=environment_factory.PoolSize(min_size=0))
+    env = pool.acquire(_env_spec())
+    # The environment is created immediately.
+    self.assertEqual([env], self.envs)
+    self.assertEqual(1, pool.stats()['num_checked_out'])
+
+  def test_release(self):
+    pool = self.create_pool(
+        default_size=environment_factory.PoolSize(min_size=0, max_size=1))
+    first, second = pool.acquire(_env_spec()), pool.acquire(_env_spec())
+    pool.release(first)
+    _wait_for(lambda: pool.stats()['num_idle'] == 1)
+    # The released environment is reset for the next user.
+    first.set_camera.assert_called_once_with(0)
+    first.env().reset.assert_called_once()
+    # The pool is full.
+    pool.release(second)
+    second.env().close.assert_called_once()
+    self.assertIs(first, pool.acquire(_env_spec()))
+    self.assertEqual(1, pool.stats()['num_recycled'])
+
+  def test_release_unknown(self):
+    pool = self.create_pool()
+    env = self.create_env(_env_spec())
+    pool.release(env)
+    env.env().close.assert_called_once()
+
+  def test_evict_expired(self):
+    pool = self.create_pool(
+        default_size=environment_factory.PoolSize(min_size=1, max_size=3),
+        ttl_secs=0.1)
+    envs = [pool.acquire(_env_spec()) for _ in range(3)]
+    for env in envs:
+      pool.release(env)
+    # The expired environments are closed in the background, but the minimum
+    # number of environments are kept.
+    _wait_for(lambda: pool.stats()['num_evicted'] == 2)
+    self.assertEqual(1, pool.stats()['num_idle'])
+    # The evicted environments are closed after they are counted.
+    _wait_for(
+        lambda: sum(env.env().close.call_count for env in self.envs) == 3)
+
+  def test_close(self):
+    pool = self.create_pool()
+    pool.warm(_env_spec())
+    _wait_for(lambda: pool.stats()['num_idle'] == 1)
+    env = self.envs[0]
+    pool.close()
+    env.env().close.assert_called_once()
+    self.assertEqual(0, pool.stats()['num_idle'])
+
+
+class ZygoteTest(absltest.TestCase):
+
+  @mock.patch.object(environment_factory, '_PROXIED_ENV_MODULES', {})
+  @mock.patch.object(environment_factory, '_create_local_env_from_spec',
+                     _create_process_env)
+  def test_create_env_from_spec(self):
+    environment_factory.start_zygotes(['net_hack'])
+    self.addCleanup(environment_factory.stop_zygotes)
+    env_spec = study_pb2.EnvironmentSpec(
+        net_hack=study_pb2.EnvironmentSpec.NetHack(id='NetHackScore-v0'))
+    pids = [
+        environment_factory.create_env_from_spec(env_spec).keys_to_action({})
+        for _ in range(2)
+    ]
+    # Each environment is forked from the zygote.
+    self.assertLen(set(pids), 2)
+    self.assertNotIn(os.getpid(), pids)
+
+  @mock.patch.object(environment_factory, '_PROXIED_ENV_MODULES', {})
+  @mock.patch.object(environment_factory, '_create_local_env_from_spec',
+                     _create_process_env)
+  def test_dead_zygote(self):
+    environment_factory.start_zygotes(['net_hack'])
+    self.addCleanup(environment_factory.stop_zygotes)
+    zygote = environment_factory._get_zygote('net_hack')
+    zygote.close()
+    self.assertFalse(zygote.is_alive())
+    env_spec = study_pb2.EnvironmentSpec(
+        net_hack=study_pb2.EnvironmentSpec.NetHack(id='NetHackScore-v0'))
+    create_proxied_env = self.enter_context(
+        mock.patch.object(
+            environment_proxy,
+            'create_proxied_env_from_spec',
+            wraps=environment_proxy.create_proxied_env_from_spec))
+    env = environment_factory.create_env_from_spec(env_spec)
+    # The zygote is not restarted and the environment is spawned instead.
+    self.assertNotEqual(os.getpid(), env.keys_to_action({}))
+    self.assertIsNone(environment_factory._get_zygote('net_hack'))
+    _, kwargs = create_proxied_env.call_args
+    self.assertEqual('spawn', kwargs['mp_context'].get_start_method())
+
+  def test_start_zygotes_invalid_type(self):
+    with self.assertRaises(ValueError):
+      environment_factory.start_zygotes(['procgen'])
+
+
+if __name__ == '__main__':
+  absltest.main()
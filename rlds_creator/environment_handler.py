@@ -17,33 +17,45 @@
 
 import abc
 import base64
+import dataclasses
+import functools
+import hashlib
 import io
 import json
 import os
 import tempfile
 import threading
 import time
-from typing import Any, Dict, Optional, Sequence
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 import uuid
 import zipfile
 
 from absl import logging
-import cv2
 import dm_env
 import humanize
 import numpy as np
 import PIL.Image
+from rlds_creator import actor
 from rlds_creator import client_pb2
 from rlds_creator import constants
 from rlds_creator import environment
 from rlds_creator import environment_wrapper
 from rlds_creator import episode_storage
 from rlds_creator import file_utils
+from rlds_creator import frame_encoder
+from rlds_creator import image_codecs
+from rlds_creator import jobs
 from rlds_creator import merger
+from rlds_creator import pipeline
 from rlds_creator import replay
+from rlds_creator import scheduler
 from rlds_creator import storage as study_storage
+from rlds_creator import stream_controller
 from rlds_creator import study_pb2
+from rlds_creator import text_stream
+from rlds_creator import tile_encoder
 from rlds_creator import utils
+from rlds_creator import video_recorder
 
 from google.protobuf import json_format
 from google.protobuf import message as proto2_message
@@ -70,10 +82,22 @@ _QUALITY_MAPPING = {
     client_pb2.SetQualityRequest.QUALITY_HIGH: 'web_high'
 }
 
+# Maximum JPEG quality of the adaptive stream for the quality settings. These
+# roughly match the presets above.
+_ADAPTIVE_QUALITY_MAPPING = {
+    client_pb2.SetQualityRequest.QUALITY_LOW: 40,
+    client_pb2.SetQualityRequest.QUALITY_MEDIUM: 65,
+    client_pb2.SetQualityRequest.QUALITY_HIGH: 85
+}
+
 # Number of episodes that will be preloaded in the merger when downloading the
 # episodes.
 MERGER_NUM_PRELOADED_EPISODES = 4
 
+# Maximum time to wait for the cancelled jobs of the session when the handler is
+# closed.
+JOBS_CLOSE_TIMEOUT_SECS = 10
+
 
 def _copy_temp_file(temp_file, dest: str):
   """Copies a temporary file to destination path."""
@@ -116,6 +140,14 @@ def _encode_image(im: PIL.Image.Image, **kwargs) -> bytes:
     return output.getvalue()
 
 
+def _get_fingerprint(image: np.ndarray) -> bytes:
+  """Returns a fingerprint of the image to detect unchanged images."""
+  h = hashlib.blake2b(digest_size=16)
+  h.update(str(image.shape).encode())
+  h.update(np.ascontiguousarray(image))
+  return h.digest()
+
+
 def _format_timestamp(timestamp) -> str:
   """Returns the timestamp in human readable format."""
   return timestamp.ToDatetime().isoformat(' ', timespec='seconds')
@@ -175,6 +207,40 @@ def encode_json(data: Any) -> str:
   return json.dumps(data, cls=_CustomJSONEncoder, sort_keys=True)
 
 
+@dataclasses.dataclass
+class _StepFrame:
+  """Data of a step that is processed asynchronously in the pipelined mode."""
+  timestep: dm_env.TimeStep
+  action: Any
+  keys: environment.Keys
+  info: Any
+  # Rendered image of the environment after the action is taken. None if the
+  # step is not streamed to the client.
+  raw_image: Optional[np.ndarray]
+  # In text mode, the rendered image that is recorded instead of the text
+  # screen above.
+  recorded_raw_image: Optional[np.ndarray]
+  episode_index: int
+  episode_steps: int
+  # Time to step the environment and render the image.
+  step_secs: float = 0.0
+  # Encoded rendered image, its full resolution version that is recorded and
+  # the time to encode them. These are set by the encoding stage.
+  image: Optional[bytes] = None
+  recorded_image: Optional[bytes] = None
+  encode_secs: float = 0.0
+
+
+@dataclasses.dataclass
+class _NextEpisode:
+  """Writer and the first timestep of an episode, prepared before it starts."""
+  metadata: Dict[str, Any]
+  episode_dir: tempfile.TemporaryDirectory
+  episode_writer: episode_storage.EpisodeWriter
+  # Timestep after the environment is reset.
+  timestep: dm_env.TimeStep
+
+
 class NoCloseWrapper(environment_wrapper.EnvironmentWrapper):
   """Environment wrapper that ignores the close calls."""
 
@@ -193,7 +259,17 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
                base_log_dir: Optional[str],
                log_flush_probability: float = 0.01,
                record_videos: bool = False,
-               episode_storage_type: str = 'pickle'):
+               episode_storage_type: str = 'pickle',
+               pipelined: bool = False,
+               stream_bounds: Optional[stream_controller.Bounds] = None,
+               use_actor: bool = False,
+               tiled: bool = False,
+               stream_fps: Optional[float] = None,
+               action_window_secs: float = 0.0,
+               text_stream_enabled: bool = False,
+               video_queue_size: int = video_recorder.DEFAULT_MAX_QUEUE_SIZE,
+               video_drop_policy: video_recorder.DropPolicy = (
+                   video_recorder.DropPolicy.BLOCK)):
     """Creates an _EnvironmentEventCallback.
 
     Args:
@@ -206,15 +282,47 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
       record_videos: Enables video recording.
       episode_storage_type: Type of the episode readers and writers. See
         episode_storage_factory.py for the possible options.
+      pipelined: If true, then the steps of the asynchronous environments will
+        be encoded and recorded in separate threads, while the environment
+        advances to the next step.
+      stream_bounds: If set, then the frame rate and the JPEG quality of the
+        stream will be adjusted within these bounds based on the step and
+        encoding times and the send backlog. The step rate of the environment
+        and the recorded images are not affected.
+      use_actor: If true, then the requests and the steps of asynchronous
+        environments will be processed in order by a dedicated thread, instead
+        of the thread that calls handle_request().
+      tiled: If true, then only the changed tiles of the images will be sent to
+        the client, except the periodic keyframes.
+      stream_fps: If set, then the images of the asynchronous environments will
+        be rendered and sent to the client at most at this rate, independent of
+        the step rate of the environment. The other steps are recorded with the
+        last sent image. Otherwise, each step is sent.
+      action_window_secs: If positive, then the gamepad inputs of the
+        synchronous environments that arrive within this window are merged and
+        at most one step is taken per window, with the latest input.
+      text_stream_enabled: If true, then the text screens of the text based
+        environments, e.g. NetHack, will be sent to the client instead of the
+        rendered images. It is ignored if the videos are recorded.
+      video_queue_size: Maximum number of frames waiting to be encoded by the
+        video recorder.
+      video_drop_policy: What to do with a new frame when the queue of the video
+        recorder is full.
     """
     self._storage = storage
     self._user = user
     self._config_json = json.dumps(config)
+    # Token that the client uses to resume the session after a reconnect.
+    self._resume_token = uuid.uuid4().hex
     self._episode_storage_factory = episode_storage_factory
     self._episode_storage_type = episode_storage_type
     self._base_log_dir = base_log_dir
     self._log_flush_probability = log_flush_probability
     self._record_videos = record_videos
+    # Videos need the rendered images.
+    if text_stream_enabled and record_videos:
+      logging.warning('Text stream is disabled as the videos are recorded.')
+    self._text_stream_enabled = text_stream_enabled and not record_videos
 
     # Initially there is no study or environment.
     self._session = None
@@ -225,7 +333,11 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
     self._env_spec = None
     self._env = None
     self._episode_writer = None
-    self._video_writer = None
+    # Videos are encoded in a separate thread.
+    self._video_recorder = None
+    if record_videos:
+      self._video_recorder = video_recorder.VideoRecorder(
+          max_queue_size=video_queue_size, drop_policy=video_drop_policy)
     self._closed = False
     self._replay = None
     self._replay_reader = None
@@ -234,21 +346,117 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
     self._episode_steps = 0
     self._episode_metadata = None
     # For asynchronous environments, the changes to the environment should be
-    # serialized and guarded by this lock.
-    self._env_lock = threading.Lock()
+    # serialized and guarded by this lock. It is reentrant as the environment
+    # may be paused while the lock is held, e.g. at the end of an episode.
+    self._env_lock = threading.RLock()
+    # Step rate of the asynchronous environments, i.e. the control and the
+    # recording rate.
     self._fps = constants.ASYNC_FPS
+    # Frame rate of the stream. If None, then each step is sent to the client.
+    # In the adaptive mode, it is adjusted by the stream controller up to the
+    # step rate and the requested frame rate of the stream.
+    self._stream_fps = stream_fps
+    self._max_stream_fps = stream_fps
+    # Scheduled time of the next step to send to the client.
+    self._stream_deadline = 0.0
+    # Quality of the images sent to the client and the recorded ones. Only the
+    # former is adjusted in the adaptive mode.
     self._quality = _DEFAULT_QUALITY
-    # For asynchronous environments, the timer will be called repeatedly to
-    # advance the steps.
+    self._record_quality = _DEFAULT_QUALITY
+    # For asynchronous environments, the steps are scheduled repeatedly by the
+    # process-wide scheduler. _timer is the handle of the next step and
+    # _step_deadline is its scheduled time. Each scheduled step has an id and
+    # only the one with the latest id is executed; this prevents a step that is
+    # already dispatched from running after the environment is paused.
+    self._scheduler = scheduler.get_default()
     self._timer = None
+    self._step_deadline = None
+    self._step_id = 0
     self._sync = False
+    # In sync mode, the gamepad inputs are merged within the action window.
+    # _next_action_time is the earliest time of the next step, _num_actions is
+    # the number of the action requests merged into it and _action_timer is the
+    # handle of the pending step. Similar to the asynchronous steps, only the
+    # pending step with the latest id is executed.
+    self._action_window_secs = action_window_secs
+    self._next_action_time = 0.0
+    self._num_actions = 0
+    self._action_timer = None
+    self._action_step_id = 0
     # Current keys.
     self._keys: environment.Keys = {}
     # Current image. Images are rendered in the _record_step() method and later
-    # sent to the client (to avoid rendering them multiple times).
+    # sent to the client (to avoid rendering them multiple times). In pipelined
+    # mode, they are updated by the pipeline threads. The current image and the
+    # encoding state below are guarded by _image_lock.
+    self._image_lock = threading.RLock()
     self._raw_image = None
     self._image = None
-    self._pil_image = None
+    # Encoded image at full resolution that is recorded with the steps. Same as
+    # the current image if it is not scaled down for the stream.
+    self._recorded_image = None
+    # Encodes the rendered images and converts them for the video, reusing the
+    # buffers.
+    self._frame_encoder = frame_encoder.FrameEncoder()
+    self._codec_encoder = image_codecs.CodecEncoder(self._frame_encoder)
+    # Name of the image codec of the stream. It is selected based on the
+    # environment type or the first image of each episode.
+    self._codec = None
+    # Maximum width and height of the images sent to the client in device
+    # pixels, i.e. the size of the canvas. Larger images are scaled down before
+    # they are encoded. None if the images are not scaled.
+    self._stream_size = None
+    # Fingerprint, the quality setting, the codec and the stream size of the
+    # last encoded image. If the next image is the same, then the encoded image
+    # will be reused.
+    self._encoded_image_key = None
+    self._encoded_image = None
+    # Similarly, fingerprint and the quality setting of the last recorded image.
+    self._encoded_recorded_image_key = None
+    self._encoded_recorded_image = None
+    # Time to encode the last image; 0 if it was reused.
+    self._encode_secs = 0.0
+    # Adjusts the frame rate and the JPEG quality of the stream.
+    self._stream_controller = None
+    if stream_bounds:
+      self._stream_controller = stream_controller.StreamController(
+          stream_bounds)
+      self._stream_controller.set_max_fps(self._get_max_stream_fps())
+      self._set_stream_settings()
+    # Last image sent to the client. Unchanged images are not sent again.
+    self._sent_image = None
+    # Last image sent to the spectators of the session.
+    self._broadcast_image = None
+    # In tiled mode, encodes the changed tiles of the images.
+    self._tile_encoder = tile_encoder.TileEncoder() if tiled else None
+    # True if the text screens of the current environment are streamed instead
+    # of the images. Only the changed cells of the screens are sent.
+    self._text_mode = False
+    self._text_encoder = text_stream.TextEncoder()
+    # In pipelined mode, the rendered images are encoded in the first stage and
+    # the steps are recorded and sent to the client in the second stage.
+    self._pipeline = None
+    if pipelined:
+      self._pipeline = pipeline.Pipeline(
+          [self._encode_frame, self._persist_frame], name='step_pipeline')
+    # Actor that processes the requests and the scheduled steps.
+    self._actor = actor.Actor(name='session') if use_actor else None
+    # Long running operations, e.g. downloading the episodes, are executed as
+    # background jobs. Running jobs of the session, keyed by their IDs.
+    self._job_executor = jobs.get_default()
+    self._jobs: Dict[str, jobs.Job] = {}
+    # Job that collects the rewards of the episode to replay. It has a
+    # dedicated worker so that it is not queued behind the downloads of the
+    # other sessions.
+    self._replay_executor = jobs.JobExecutor(
+        max_workers=1, max_jobs=2, name='replay')
+    self._replay_job = None
+    # Job that prepares the next episode while the user confirms saving the
+    # current one. The environment is not stepped while it is set. It has a
+    # dedicated worker so that it is not queued behind the other jobs.
+    self._next_episode_executor = jobs.JobExecutor(
+        max_workers=1, max_jobs=1, name='next_episode')
+    self._next_episode_job = None
     self.setup()
 
   def setup(self):
@@ -263,6 +471,28 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
       self, env_spec: study_pb2.EnvironmentSpec) -> environment.Environment:
     """Creates an environment based on the specification."""
 
+  def take_reset_timestep(
+      self, env: environment.Environment) -> Optional[dm_env.TimeStep]:
+    """Returns the first timestep of the environment if it is already reset.
+
+    Args:
+      env: Environment created by create_env_from_spec().
+
+    Returns:
+      The timestep returned by the last reset of the environment, if it is not
+      stepped since then, or None if the environment should be reset.
+    """
+    del env
+    return None
+
+  def release_env(self, env: environment.Environment):
+    """Called when the environment is no longer used by the handler.
+
+    Args:
+      env: Environment created by create_env_from_spec().
+    """
+    env.env().close()
+
   @abc.abstractmethod
   def get_url_for_path(self, path: str) -> Optional[str]:
     """Returns the URL to access the specified file or directory.
@@ -295,17 +525,25 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
 
   def _set_environment(self, env_spec: study_pb2.EnvironmentSpec):
     """Sets the environment based on the spec."""
+    if self._env:
+      self._release_env()
     self._env = self.create_env_from_spec(env_spec)
+    timestep = self.take_reset_timestep(self._env)
     # Changing the environment starts a new run of a sequence of episodes from
     # the chosen environment. Since the session ID is unique, we use a
     # deterministic ID.
     self._run_id += 1
     self._env_spec = env_spec
     self._sync = env_spec.sync
-    self._image = None
-    self._pil_image = None
+    with self._image_lock:
+      self._image = None
+      self._recorded_image = None
+    if self._tile_encoder:
+      self._tile_encoder.reset()
+    self._text_mode = False
+    self._text_encoder.reset()
     self._episode_index = -1
-    self._reset()
+    self._reset(timestep)
     # Send the first frame and metadata about the episode.
     self._send_step()
 
@@ -315,6 +553,8 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
 
   def _maybe_save_episode(self):
     """Saves the episode metadata."""
+    # Make sure that all steps of the episode are recorded.
+    self._flush_pipeline()
     if not self._episode:
       return
     # Signal end of episode to the writer and close it.
@@ -349,10 +589,10 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
     self._episode.end_time.GetCurrentTime()
     threading.Thread(
         target=_copy_temp_dir, args=(self._episode_dir, final_path)).start()
-    if self._video_writer:
-      # Close the video recorder and copy the file to its proper location.
-      self._video_writer.release()
-      self._video_writer = None
+    if self._video_recorder and self._video_recorder.recording:
+      # Wait for the pending frames to be encoded and copy the file to its
+      # proper location.
+      self._video_recorder.finish()
       filename = os.path.join(final_path, 'video.mp4')
       threading.Thread(
           target=_copy_temp_file, args=(self._video_file, filename)).start()
@@ -386,35 +626,137 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
         status=status,
         can_delete=utils.can_delete_episode(episode, self._user.email))
 
-  def _record_step(self,
-                   timestep: dm_env.TimeStep,
-                   action: Optional[Any] = None):
-    """Records a step of the current episode and renders its image."""
-    # Update the current image. This will be the state after the action is
-    # taken.
-    self._raw_image, self._image = self._get_image()
-    metadata = {
-        constants.METADATA_KEYS: self._keys,
-        constants.METADATA_IMAGE: self._image
-    }
-    info = self._env.step_info()
+  def _get_step_metadata(self, keys: environment.Keys, image: bytes,
+                         info: Any) -> Dict[str, Any]:
+    """Returns the metadata of a step to record."""
+    metadata = {constants.METADATA_KEYS: keys, constants.METADATA_IMAGE: image}
     if info is not None:
       metadata[constants.METADATA_INFO] = info
+    if self._sync and self._action_window_secs > 0:
+      metadata[constants.METADATA_NUM_ACTIONS] = self._num_actions
+    return metadata
+
+  def _record_step(self,
+                   timestep: dm_env.TimeStep,
+                   action: Optional[Any] = None,
+                   render: bool = True,
+                   result: Optional[environment.StepResult] = None):
+    """Records a step of the current episode and renders its image.
+
+    Args:
+      timestep: Timestep of the environment.
+      action: Action that is taken.
+      render: If false, then the image is not rendered and the step is recorded
+        with the current image, i.e. the last one sent to the client.
+      result: Result of the step if it is taken with the user input. Its image
+        and step information are used, if available.
+    """
+    if render:
+      # Update the current image. This will be the state after the action is
+      # taken.
+      raw_image, image, recorded_image = self._get_image(
+          result.image if result else None)
+      with self._image_lock:
+        self._raw_image, self._image = raw_image, image
+        self._recorded_image = recorded_image
+    with self._image_lock:
+      image = self._recorded_image
+    info = result.info if result else self._env.step_info()
+    metadata = self._get_step_metadata(self._keys, image, info)
     self._episode_writer.record_step(
         episode_storage.StepData(timestep, action, metadata))
 
-  def _reset(self):
-    """Resets the environment."""
+  def _capture_frame(self, result: environment.StepResult, start: float,
+                     render: bool) -> _StepFrame:
+    """Returns the data of the step to be processed by the pipeline."""
+    raw_image = None
+    recorded_raw_image = None
+    if render:
+      # The environment may reuse the rendered image, e.g. the image
+      # observation, therefore we keep a copy.
+      raw_image = np.array(
+          self._render() if result.image is None else result.image, copy=True)
+      recorded_raw_image = self._render_recorded_image(raw_image)
+      if recorded_raw_image is not raw_image:
+        recorded_raw_image = np.array(recorded_raw_image, copy=True)
+    return _StepFrame(
+        timestep=result.timestep,
+        action=result.action,
+        keys=self._keys,
+        info=result.info,
+        raw_image=raw_image,
+        recorded_raw_image=recorded_raw_image,
+        episode_index=self._episode_index,
+        episode_steps=self._episode_steps,
+        step_secs=time.perf_counter() - start)
+
+  def _encode_frame(self, frame: _StepFrame) -> _StepFrame:
+    """Encodes the image of the step. First stage of the pipeline."""
+    if frame.raw_image is not None:
+      with self._image_lock:
+        frame.image, frame.recorded_image = self._encode_raw_image(
+            frame.raw_image, frame.recorded_raw_image)
+        frame.encode_secs = self._encode_secs
+    return frame
+
+  def _persist_frame(self, frame: _StepFrame) -> None:
+    """Records the step and sends it to the client. Final stage of pipeline."""
+    with self._image_lock:
+      if frame.raw_image is not None:
+        self._raw_image, self._image = frame.raw_image, frame.image
+        self._recorded_image = frame.recorded_image
+      raw_image, image = self._raw_image, self._recorded_image
+    self._episode_writer.record_step(
+        episode_storage.StepData(
+            frame.timestep, frame.action,
+            self._get_step_metadata(frame.keys, image, frame.info)))
+    if frame.raw_image is None:
+      # The step is not streamed.
+      self._write_video_frame(raw_image)
+      return
+    backlog = self.get_send_backlog()
+    self._send_frame(frame.raw_image, frame.image, frame.episode_index,
+                     frame.episode_steps, frame.timestep.reward)
+    self._update_stream(frame.step_secs, frame.encode_secs, frame.image,
+                        backlog)
+
+  def _flush_pipeline(self) -> bool:
+    """Waits until the steps in the pipeline are processed.
+
+    Returns:
+      False if a step couldn't be recorded, in which case the episode is marked
+      as failed.
+    """
+    if self._pipeline:
+      try:
+        self._pipeline.flush()
+      except Exception as e:  # pylint: disable=broad-except
+        self._fail_episode(e)
+        return False
+    return True
+
+  def _fail_episode(self, error: Exception):
+    """Marks the current episode as failed and informs the user."""
+    logging.error('Unable to record the episode: %s', error, exc_info=error)
+    if self._episode:
+      self._episode.state = study_pb2.Episode.STATE_FAILED
+    self._send_error(f'Unable to record the episode: {error}')
+
+  def _reset(self, timestep: Optional[dm_env.TimeStep] = None):
+    """Resets the environment.
+
+    Args:
+      timestep: First timestep of the environment if it is already reset.
+    """
     self._maybe_save_episode()
     # Episode index should be incremented before reset() as it will be added to
     # the episode metadata by the environment writer.
     self._episode_index += 1
     # Create a new episode.
-    episode_id = '{}.{}'.format(self._run_id, self._episode_index)
-    study_id = self._study_spec.id
+    episode_id = self._get_episode_id(self._episode_index)
     self._episode = study_pb2.Episode(
         id=episode_id,
-        study_id=study_id,
+        study_id=self._study_spec.id,
         environment_id=self._env_spec.id,
         user=self._user,
         session_id=self._session.id)
@@ -423,54 +765,262 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
     self._episode.start_time.GetCurrentTime()
     self._episode_steps = 0
     self._episode_total_reward = 0
-    self._episode_metadata = {
-        'agent_id': utils.get_agent_id(study_id, self._user.email),
-        'episode_id': utils.get_public_episode_id(study_id, episode_id),
-        utils.get_metadata_key('env_id'): self._env_spec.id,
-        utils.get_metadata_key('study_id'): study_id
-    }
 
-    # We log each episode separately. The underlying environment persists.
-    self._episode_dir = tempfile.TemporaryDirectory()
-
-    self._episode_writer = self.create_episode_writer(self._env.env(),
-                                                      self._episode_dir.name,
-                                                      self._episode_metadata)
-    # Start the episode and reset the environment.
+    # The environment may be already reset in the background.
+    next_episode = self._take_next_episode()
+    if not next_episode:
+      next_episode = self._prepare_episode(episode_id, timestep)
+    self._episode_metadata = next_episode.metadata
+    self._episode_dir = next_episode.episode_dir
+    self._episode_writer = next_episode.episode_writer
+    # Start the episode. The first image of the episode is always sent to the
+    # client.
+    self._sent_image = None
+    with self._image_lock:
+      self._codec = None
     self._episode_writer.start_episode()
-    self._record_step(self._env.env().reset())
+    self._record_step(next_episode.timestep)
 
     self._keys = {}
     self._user_input = environment.UserInput(keys=self._keys)
+    # Pending input of the previous episode is discarded.
+    with self._env_lock:
+      self._cancel_coalesced_step()
+      self._num_actions = 0
 
     if self._record_videos:
       self._video_file = tempfile.NamedTemporaryFile(suffix='.mp4')
-      raw_image, _ = self._get_image()
-      height, width, _ = raw_image.shape
+      # Image of the first step is already rendered.
+      height, width, _ = self._raw_image.shape
       logging.info('%dx%d video will be recorded to %s.', width, height,
                    self._video_file.name)
-      fcc = cv2.VideoWriter_fourcc(*'avc1')
-      self._video_writer = cv2.VideoWriter(self._video_file.name, fcc,
-                                           self._fps, (width, height))
+      # Each step is added to the video, see _write_video_frame().
+      self._video_recorder.start(self._video_file.name, self._fps,
+                                 (width, height))
     # Async environments are put into paused state so that the user can get
     # ready for the next episode.
     self._pause(not self._sync)
 
-  def _get_image(self):
-    """Returns the image of the environment in raw and JPEG format."""
-    raw_image = self._env.render()
-    if self._pil_image and raw_image.flags['C_CONTIGUOUS']:
-      # Reuse the existing image. The input image should be C-contiguous. In
-      # some environments, e.g. Proco, this may not be the case.
-      self._pil_image.frombytes(raw_image)
-    else:
-      self._pil_image = PIL.Image.fromarray(raw_image)
-    return raw_image, _encode_image(
-        self._pil_image, format='JPEG', quality=self._quality)
+  def _get_episode_id(self, episode_index: int) -> str:
+    """Returns the ID of the episode with the index in the current run."""
+    return '{}.{}'.format(self._run_id, episode_index)
+
+  def _prepare_episode(
+      self,
+      episode_id: str,
+      timestep: Optional[dm_env.TimeStep] = None) -> _NextEpisode:
+    """Creates the writer of the episode and resets the environment.
 
-  def _async_step(self):
-    """Calls step if environment is active and schedules the next step."""
+    Args:
+      episode_id: ID of the episode.
+      timestep: First timestep of the environment if it is already reset.
+    """
+    study_id = self._study_spec.id
+    metadata = {
+        'agent_id': utils.get_agent_id(study_id, self._user.email),
+        'episode_id': utils.get_public_episode_id(study_id, episode_id),
+        utils.get_metadata_key('env_id'): self._env_spec.id,
+        utils.get_metadata_key('study_id'): study_id
+    }
+    # We log each episode separately. The underlying environment persists.
+    episode_dir = tempfile.TemporaryDirectory()
+    episode_writer = self.create_episode_writer(self._env.env(),
+                                                episode_dir.name, metadata)
+    if timestep is None:
+      timestep = self._env.env().reset()
+    return _NextEpisode(
+        metadata=metadata,
+        episode_dir=episode_dir,
+        episode_writer=episode_writer,
+        timestep=timestep)
+
+  def _prepare_next_episode(self):
+    """Starts preparing the next episode in the background.
+
+    The episode writer of the current episode only needs the specs of the
+    environment. Therefore, the environment can be reset while the user
+    confirms saving the current episode.
+    """
+    if self._next_episode_job or not self._env.can_reset_in_background():
+      return
+    episode_id = self._get_episode_id(self._episode_index + 1)
+    job = jobs.Job(
+        lambda unused_job: self._prepare_episode(episode_id),
+        name='prepare_episode')
+    try:
+      self._next_episode_job = self._next_episode_executor.submit(job)
+    except ValueError:
+      # Too many jobs. The episode will be prepared when it starts.
+      logging.warning('Unable to prepare the next episode in the background.')
+
+  def _take_next_episode(self) -> Optional[_NextEpisode]:
+    """Returns the episode prepared in the background, if any."""
+    job, self._next_episode_job = self._next_episode_job, None
+    if not job:
+      return None
+    try:
+      return job.result()
+    except Exception:  # pylint: disable=broad-except
+      logging.exception('Unable to prepare the next episode.')
+      return None
+
+  def _wait_for_next_episode(self):
+    """Waits until the next episode is prepared, if it is in progress."""
+    if self._next_episode_job:
+      try:
+        self._next_episode_job.result()
+      except Exception:  # pylint: disable=broad-except
+        # Reported when the episode starts.
+        pass
+
+  def _discard_next_episode(self):
+    """Discards the episode prepared in the background, if any."""
+    next_episode = self._take_next_episode()
+    if next_episode:
+      next_episode.episode_writer.close()
+      next_episode.episode_dir.cleanup()
+
+  def _get_env_type(self) -> Optional[EnvType]:
+    """Returns the type of the current environment, if any."""
+    env_type = self._env_spec.WhichOneof('type') if self._env_spec else None
+    return EnvType(env_type) if env_type else None
+
+  def _render(self) -> np.ndarray:
+    """Returns the text screen of the environment in text mode or its image."""
+    if self._text_stream_enabled:
+      screen = self._env.render_text()
+      if screen is not None:
+        self._text_mode = True
+        return screen
+    return self._env.render()
+
+  def _render_recorded_image(self, raw_image: np.ndarray) -> np.ndarray:
+    """Returns the image to record for the rendered image or text screen.
+
+    Text screens are only sent to the client; the steps are recorded with the
+    rendered image of the environment.
+
+    Args:
+      raw_image: Rendered image or text screen.
+    """
+    return self._env.render() if self._text_mode else raw_image
+
+  def _get_image(self, raw_image: Optional[np.ndarray] = None):
+    """Returns the image of the environment in raw and encoded format.
+
+    The encoded images are the ones sent to the client and recorded, see
+    _encode_raw_image().
+
+    Args:
+      raw_image: Image or text screen that is already rendered. If None, then
+        the environment is rendered.
+    """
+    if raw_image is None:
+      raw_image = self._render()
+    return (raw_image,) + self._encode_raw_image(
+        raw_image, self._render_recorded_image(raw_image))
+
+  def _encode_raw_image(
+      self,
+      raw_image: np.ndarray,
+      recorded_raw_image: Optional[np.ndarray] = None) -> Tuple[bytes, bytes]:
+    """Returns the rendered image encoded for the stream and the recording.
+
+    Args:
+      raw_image: Rendered image or text screen.
+      recorded_raw_image: Rendered image to record, if different from the
+        above, e.g. in text mode.
+
+    Returns:
+      A tuple of the image that is sent to the client, which is encoded with
+      the codec of the stream and may be scaled down, and the one that is
+      recorded. The latter is always a JPEG image at full resolution.
+    """
+    with self._image_lock:
+      return self._encode_raw_image_locked(raw_image, recorded_raw_image)
+
+  def _encode_raw_image_locked(
+      self, raw_image: np.ndarray,
+      recorded_raw_image: Optional[np.ndarray]) -> Tuple[bytes, bytes]:
+    if recorded_raw_image is raw_image:
+      recorded_raw_image = None
+    # Non-contiguous images, e.g. in Procgen, are copied to the staging array
+    # of the encoder once, both for fingerprinting and encoding.
+    raw_image = self._frame_encoder.get_contiguous(raw_image)
+    if self._codec is None:
+      if self._text_mode:
+        self._codec = image_codecs.TEXT
+      else:
+        self._codec = image_codecs.select_codec(self._get_env_type(),
+                                                self._frame_encoder, raw_image)
+      logging.info('Using %s codec for the images.', self._codec)
+    fingerprint = _get_fingerprint(raw_image)
+    key = (fingerprint, self._quality, self._codec, self._stream_size)
+    self._encode_secs = 0.0
+    start = time.perf_counter()
+    if key != self._encoded_image_key:
+      self._encoded_image = self._encode_stream_image(raw_image)
+      self._encoded_image_key = key
+      self._encode_secs = time.perf_counter() - start
+    if recorded_raw_image is not None:
+      # The staging array is no longer needed for the image of the stream.
+      raw_image = self._frame_encoder.get_contiguous(recorded_raw_image)
+      fingerprint = _get_fingerprint(raw_image)
+    recorded_key = (fingerprint, self._record_quality)
+    if recorded_key != self._encoded_recorded_image_key:
+      # The recorded image is independent of the stream, i.e. its codec, the
+      # adjusted quality and the canvas size.
+      self._encoded_recorded_image = self._frame_encoder.encode(
+          raw_image, format='JPEG', quality=self._record_quality)
+      self._encoded_recorded_image_key = recorded_key
+      self._encode_secs = time.perf_counter() - start
+    # The same objects are returned for unchanged images.
+    return self._encoded_image, self._encoded_recorded_image
+
+  def _encode_stream_image(self, raw_image: np.ndarray) -> bytes:
+    """Encodes the rendered image or the text screen for the stream."""
+    stream_image = raw_image
+    if self._codec != image_codecs.TEXT:
+      # Text screens are drawn by the client at the resolution of the canvas.
+      stream_image = self._scale_image(raw_image, self._frame_encoder)
+    _, image = self._codec_encoder.encode(self._codec, stream_image,
+                                          self._quality)
+    return image
+
+  def _scale_image(self, raw_image: np.ndarray,
+                   encoder: frame_encoder.FrameEncoder) -> np.ndarray:
+    """Scales down the image to fit the stream size, keeping the aspect ratio.
+
+    Only the image sent to the client is scaled; the observations, the recorded
+    image and the video keep the full resolution.
+
+    Args:
+      raw_image: Rendered image.
+      encoder: Frame encoder whose buffer is used for the scaled image.
+
+    Returns:
+      The scaled image or the rendered one if it already fits.
+    """
+    if not self._stream_size:
+      return raw_image
+    height, width = raw_image.shape[:2]
+    max_width, max_height = self._stream_size
+    scale = min(max_width / width, max_height / height)
+    if scale >= 1:
+      return raw_image
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return encoder.resize(raw_image, size)
+
+  def _async_step(self, step_id: Optional[int] = None):
+    """Calls step if environment is active and schedules the next step.
+
+    Args:
+      step_id: Id of the scheduled step. If None, then the steps are started.
+    """
     with self._env_lock:
+      if step_id is not None and step_id != self._step_id:
+        # Step is cancelled.
+        return
       self._timer = None
       if not self._env or self._closed or self._paused:
         # Stop.
@@ -480,56 +1030,131 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
         # User was idle. Pause the environment.
         self._pause()
         return
+      if step_id is None:
+        self._step_deadline = start
+        self._stream_deadline = start
 
       self._step()
-      # Try to match the desired FPS. If the environment is slow, next frame
-      # will be rendered immediately.
-      elapsed = time.perf_counter() - start
-      desired = max(0, (1.0 / self._fps) - elapsed)
-      if not self._paused:
-        self._timer = threading.Timer(desired, self._async_step)
-        self._timer.start()
+      if self._paused:
+        return
+      # Try to match the desired FPS. The next step is scheduled relative to the
+      # deadline of this one to avoid drift. If the environment is slow, next
+      # step will be executed immediately without trying to catch up.
+      self._step_deadline = max(self._step_deadline + 1.0 / self._fps,
+                                scheduler.now())
+      self._step_id += 1
+      self._timer = self._scheduler.call_at(
+          self._step_deadline,
+          functools.partial(self._dispatch, self._async_step, self._step_id))
+
+  def _cancel_async_step(self):
+    """Cancels the next scheduled step. The lock should be held."""
+    self._step_id += 1
+    if self._timer:
+      self._timer.cancel()
+      self._timer = None
 
   def _step(self):
     """Calls step if the environment is not paused and sends the data."""
-    if self._paused:
+    if self._paused or self._next_episode_job:
       return
-    action = self._env.user_input_to_action(self._user_input)
-    if self._sync and action is None:
+    start = time.perf_counter()
+    # The input is mapped to an action, the step is taken and rendered, if it
+    # will be streamed, at once; proxied environments need a single exchange.
+    result = self._env.step_with_user_input(
+        self._user_input,
+        render=self._is_stream_step(start),
+        render_text=self._text_stream_enabled,
+        skip_none_action=self._sync)
+    if result.timestep is None:
       return
-    timestep = self._env.env().step(action)
-    self._record_step(timestep, action)
-    self._episode_steps += 1
+    if result.is_text:
+      self._text_mode = True
+    action, timestep = result.action, result.timestep
+    # The last step of the episode is always sent.
+    stream = timestep.last() or result.image is not None
+    if self._pipeline and not self._sync:
+      # Encoding, recording and sending the step will overlap with the next
+      # step of the environment.
+      self._episode_steps += 1
+      try:
+        self._pipeline.submit(self._capture_frame(result, start, render=stream))
+      except Exception as e:  # pylint: disable=broad-except
+        # A previous step couldn't be recorded.
+        self._fail_episode(e)
+        self._reset()
+        self._send_step()
+        return
+    else:
+      self._record_step(timestep, action, render=stream, result=result)
+      self._episode_steps += 1
+      if stream:
+        step_secs = time.perf_counter() - start - self._encode_secs
+        backlog = self.get_send_backlog()
+        self._send_step(timestep.reward)
+        self._update_stream(step_secs, self._encode_secs, self._image,
+                            backlog)
+      else:
+        with self._image_lock:
+          raw_image = self._raw_image
+        self._write_video_frame(raw_image)
     self._episode_total_reward += timestep.reward
-    self._send_step(timestep.reward)
     # Reset the environment if done.
     if timestep.last():
       self._episode.state = study_pb2.Episode.STATE_COMPLETED
       self._confirm_save()
 
-  def _pause(self, paused=True):
-    """Un(pauses) the environment."""
+  def _is_stream_step(self, now: float) -> bool:
+    """Returns true if the step at the specified time should be sent."""
+    if self._sync or self._stream_fps is None:
+      return True
+    # Steps within half a step period of the deadline are sent to tolerate the
+    # jitter of the step times.
+    if now + 0.5 / self._fps < self._stream_deadline:
+      return False
+    self._stream_deadline = max(self._stream_deadline + 1.0 / self._stream_fps,
+                                now)
+    return True
+
+  def _pause(self, paused=True) -> bool:
+    """Un(pauses) the environment.
+
+    Args:
+      paused: Whether to pause the environment.
+
+    Returns:
+      False if the episode failed while pausing and a new one is started.
+    """
     self._paused = paused
     if not self._sync:
       if not paused:
         self._async_step()
-      elif paused and self._timer:
+      else:
         # async_step() method may be executing, therefore we need to acquire the
-        # lock before cancelling the timer.
+        # lock before cancelling the next step.
         with self._env_lock:
-          if self._timer:
-            logging.info('Cancelling the timer.')
-            self._timer.cancel()
+          self._cancel_async_step()
+          # Steps that are already taken should be sent before the pause
+          # response.
+          if not self._flush_pipeline():
+            # The new episode starts paused.
+            self._reset()
+            self._send_step()
+            return False
     # Inform the user.
     self._send_response(pause=client_pb2.PauseResponse(paused=self._paused))
+    return True
 
   def _confirm_save(self):
     """Pauses the environment and asks confirmation to save the episode."""
-    self._pause()
+    if not self._pause():
+      return
     completed = self._episode.state == study_pb2.Episode.STATE_COMPLETED
     self._send_response(
         confirm_save=client_pb2.ConfirmSaveResponse(
             mark_as_completed=completed))
+    # The next episode starts after the user responds.
+    self._prepare_next_episode()
 
   def _maybe_close_session(self):
     """Closes the current session."""
@@ -539,15 +1164,20 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
     self._session.end_time.GetCurrentTime()
     logging.info('End of session %r', self._session)
     if self._env:
-      with self._env_lock:
-        self._env.env().close()
-        self._env = None
+      self._release_env()
     self._maybe_save_episode()
     # Save the updated session metadata, e.g. with end time.
     self._storage.update_session(self._session)
     self._session = None
     self._episode = None
 
+  def _release_env(self):
+    """Releases the current environment."""
+    self._discard_next_episode()
+    with self._env_lock:
+      self.release_env(self._env)
+      self._env = None
+
   def _create_new_session(self):
     """Creates a new session and closes the existing one if any."""
     self._maybe_close_session()
@@ -567,12 +1197,67 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
     """Called when the interaction is closed."""
     pass
 
+  @property
+  def resume_token(self) -> str:
+    """Token to resume the session after the client reconnects."""
+    return self._resume_token
+
+  def detach(self):
+    """Called when the client disconnects, but may resume the session later.
+
+    The environment is paused, but it is not closed and the current episode is
+    kept open until the session is resumed or closed.
+    """
+    self._dispatch(self._detach)
+
+  def _detach(self):
+    if self._env and not self._sync and not self._paused:
+      self._pause()
+
+  def resume(self):
+    """Called when the client reconnects to resume the session."""
+    self._dispatch(self._resume)
+
+  def _resume(self):
+    # The responses sent while the client was disconnected are lost. The client
+    # keeps its state, except the pause state and the image.
+    self._send_response(pause=client_pb2.PauseResponse(paused=self._paused))
+    with self._image_lock:
+      image = self._image
+    if image is not None:
+      # Client may not have the last image. It is sent as a whole.
+      self._sent_image = None
+      self._send_response(
+          step=self._get_step_response(image, self._episode_index,
+                                       self._episode_steps))
+
   def close(self):
     """Closes the environment."""
+    if self._actor and not self._actor.in_actor_thread():
+      # Pending requests are processed before closing.
+      self._dispatch(self.close)
+      self._actor.close(wait=False)
+      return
     if self._closed:
       return
     self._closed = True
+    for job in list(self._jobs.values()):
+      job.cancel()
+    # The jobs may still be using the session, e.g. its storage.
+    self._wait_for_jobs(JOBS_CLOSE_TIMEOUT_SECS)
     self._maybe_close_session()
+    if self._pipeline:
+      self._pipeline.close()
+    self._next_episode_executor.shutdown(wait=False)
+    self._replay_executor.shutdown(wait=False)
+    if self._video_recorder:
+      self._video_recorder.close()
+      logging.info('Video recorder stats: %r', self._video_recorder.stats())
+    logging.info('Image codec stats: %r', self._codec_encoder.stats())
+    if self._tile_encoder:
+      logging.info('Tile encoder stats: %r', self._tile_encoder.stats())
+    if self._text_mode:
+      logging.info('Text encoder stats: %r', self._text_encoder.stats())
     self.on_close()
 
   @abc.abstractmethod
@@ -604,7 +1289,8 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
   def _send_config(self) -> bool:
     """Sends the config to the client."""
     return self._send_response(
-        config=client_pb2.ConfigResponse(config=self._config_json))
+        config=client_pb2.ConfigResponse(
+            config=self._config_json, resume_token=self._resume_token))
 
   def _set_studies(self):
     """Called to get the studies of the user."""
@@ -710,17 +1396,240 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
         select_environment=client_pb2.SelectEnvironmentResponse(
             study_id=self._study_spec.id, env=self._env_spec))
 
+  def _get_step_response(self,
+                         image: Optional[bytes],
+                         episode_index: int,
+                         episode_steps: int,
+                         raw_image: Optional[np.ndarray] = None,
+                         **kwargs) -> client_pb2.StepResponse:
+    """Returns the step response with the image if it has changed.
+
+    Args:
+      image: Encoded image of the step.
+      episode_index: 0-based index of the episode.
+      episode_steps: Number of steps in the episode.
+      raw_image: Rendered image of the step. In tiled mode, only the changed
+        tiles of the image are sent if it is specified.
+      **kwargs: Values of the other StepResponse fields.
+    """
+    step = client_pb2.StepResponse(
+        episode_index=episode_index + 1, episode_steps=episode_steps, **kwargs)
+    # Unchanged images are encoded only once and we can compare the objects.
+    if image is None:
+      return step
+    mime_type = image_codecs.get_mime_type(image)
+    if mime_type:
+      step.mime_type = mime_type
+    if image is self._sent_image:
+      step.same_image = True
+      return step
+    if self._text_mode:
+      step.image = self._encode_text(image, raw_image)
+    else:
+      tiles = self._encode_tiles(raw_image)
+      if tiles is None:
+        step.image = image
+      elif not tiles:
+        # The image is encoded again, e.g. with a different quality, but the
+        # client already has the same one.
+        step.same_image = True
+      else:
+        for tile in tiles:
+          step.tiles.add(x=tile.x, y=tile.y, image=tile.image)
+    self._sent_image = image
+    return step
+
+  def _encode_text(self, image: bytes, screen: Optional[np.ndarray]) -> bytes:
+    """Returns the changed cells of the text screen or the whole screen.
+
+    Args:
+      image: Text screen encoded as a keyframe.
+      screen: Text screen of the step, if specified.
+    """
+    if screen is None:
+      # The client will have a screen that is unknown to the text encoder.
+      self._text_encoder.reset()
+      return image
+    # Similar to the tiles, keyframes are sent until the client catches up.
+    keyframe = self.get_send_backlog() > 0
+    return self._text_encoder.encode(screen, keyframe=keyframe)
+
+  def _encode_tiles(
+      self,
+      raw_image: Optional[np.ndarray]) -> Optional[List[tile_encoder.Tile]]:
+    """Returns the changed tiles of the image or None to send the whole one."""
+    if not self._tile_encoder:
+      return None
+    if raw_image is None:
+      # The client will have an image that is unknown to the tile encoder.
+      self._tile_encoder.reset()
+      return None
+    encoder = self._tile_encoder.frame_encoder
+    image = self._scale_image(encoder.get_contiguous(raw_image), encoder)
+    # A pending frame may be dropped in favor of the next one, in which case
+    # the tiles would be applied to a different image. Keyframes are sent
+    # until the client catches up.
+    keyframe = self.get_send_backlog() > 0
+    return self._tile_encoder.encode(
+        image, self._codec, self._quality, keyframe=keyframe)
+
   def _send_step(self, reward=0):
     """Sends the step data to the client."""
+    with self._image_lock:
+      raw_image, image = self._raw_image, self._image
+    self._send_frame(raw_image, image, self._episode_index, self._episode_steps,
+                     reward)
+
+  def _send_frame(self, raw_image: np.ndarray, image: bytes,
+                  episode_index: int, episode_steps: int, reward=0):
+    """Sends the image and the step data to the client."""
     self._send_response(
-        step=client_pb2.StepResponse(
-            image=self._image,
-            episode_index=self._episode_index + 1,
-            episode_steps=self._episode_steps,
-            reward=reward))
-    # Also add frame to the video. CV2 expects the image in BGR channel order.
-    if self._video_writer:
-      self._video_writer.write(cv2.cvtColor(self._raw_image, cv2.COLOR_RGB2BGR))
+        step=self._get_step_response(
+            image, episode_index, episode_steps, raw_image, reward=reward))
+    self._broadcast_frame(image, episode_index, episode_steps, reward)
+    self._write_video_frame(raw_image)
+
+  def _write_video_frame(self, raw_image: np.ndarray):
+    """Adds the image to the video, if it is being recorded.
+
+    Each step is added to the video, which has the frame rate of the steps. The
+    steps that are not streamed repeat the last rendered image.
+
+    Args:
+      raw_image: Rendered image of the step.
+    """
+    if self._video_recorder:
+      self._video_recorder.write(raw_image)
+
+  def get_send_backlog(self) -> int:
+    """Returns the number of responses waiting to be sent to the client."""
+    return 0
+
+  def has_spectators(self) -> bool:
+    """Returns true if the session is watched by spectators."""
+    return False
+
+  def broadcast_response(self, response: client_pb2.OperationResponse):
+    """Sends the response to the spectators of the session.
+
+    It should not block, so that the spectators don't slow down the session.
+
+    Args:
+      response: an OperationResponse.
+    """
+
+  def _broadcast_frame(self,
+                       image: Optional[bytes],
+                       episode_index: int,
+                       episode_steps: int,
+                       reward=0,
+                       force: bool = False):
+    """Sends the image to the spectators if it has changed.
+
+    Spectators may drop frames, therefore each frame has the whole image.
+
+    Args:
+      image: Encoded image of the step.
+      episode_index: 0-based index of the episode.
+      episode_steps: Number of steps in the episode.
+      reward: Reward of the step.
+      force: If true, then the image is sent even if it is unchanged, e.g. for a
+        new spectator.
+    """
+    if not self.has_spectators() or image is None:
+      return
+    if image is self._broadcast_image and not force:
+      return
+    self._broadcast_image = image
+    step = client_pb2.StepResponse(
+        image=image,
+        episode_index=episode_index + 1,
+        episode_steps=episode_steps,
+        reward=reward)
+    mime_type = image_codecs.get_mime_type(image)
+    if mime_type:
+      step.mime_type = mime_type
+    self.broadcast_response(client_pb2.OperationResponse(step=step))
+
+  def broadcast_current_frame(self):
+    """Sends the current image to the spectators, e.g. after one joins."""
+    self._dispatch(self._broadcast_current_frame)
+
+  def _broadcast_current_frame(self):
+    with self._image_lock:
+      image = self._image
+    self._broadcast_frame(
+        image, self._episode_index, self._episode_steps, force=True)
+
+  @property
+  def session_id(self) -> Optional[str]:
+    """ID of the current session, if any."""
+    session = self._session
+    return session.id if session else None
+
+  def _update_stream(self, step_secs: float, encode_secs: float, image: bytes,
+                     backlog: int):
+    """Updates the stream settings based on the measurements of a step.
+
+    Args:
+      step_secs: Time to step the environment and render the image.
+      encode_secs: Time to encode the image.
+      image: Encoded image.
+      backlog: Send backlog before the step is sent.
+    """
+    if not self._stream_controller:
+      return
+    if self._stream_controller.record_frame(step_secs, encode_secs, len(image),
+                                            backlog):
+      self._set_stream_settings()
+      logging.info('Stream settings are updated: %r',
+                   self._stream_controller.stats())
+
+  def _get_max_stream_fps(self) -> float:
+    """Returns the maximum frame rate of the adaptive stream."""
+    if self._max_stream_fps is None:
+      return self._fps
+    return min(self._fps, self._max_stream_fps)
+
+  def _set_stream_settings(self):
+    """Updates the stream settings from the stream controller.
+
+    Only the frame rate and the quality of the stream are adjusted; the step
+    rate of the environment and the quality of the recorded images stay the
+    same.
+    """
+    self._stream_fps = min(self._stream_controller.fps,
+                           self._get_max_stream_fps())
+    self._quality = self._stream_controller.quality
+
+  def _set_fps(self, fps: float):
+    """Sets the step rate. It is the upper bound of the adaptive stream.
+
+    Args:
+      fps: Frame rate.
+    """
+    self._fps = fps
+    if self._stream_controller:
+      self._stream_controller.set_max_fps(self._get_max_stream_fps())
+      self._set_stream_settings()
+
+  def _set_canvas_size(self, request: client_pb2.SetCanvasSizeRequest):
+    """Sets the maximum size of the images sent to the client."""
+    ratio = request.device_pixel_ratio or 1.0
+    width = round(request.width * ratio)
+    height = round(request.height * ratio)
+    self._stream_size = (width, height) if width > 0 and height > 0 else None
+
+  def _set_quality(self, quality: int):
+    """Sets the JPEG quality. It is the upper bound in the adaptive mode."""
+    self._record_quality = _QUALITY_MAPPING.get(quality, _DEFAULT_QUALITY)
+    if self._stream_controller:
+      self._stream_controller.set_max_quality(
+          _ADAPTIVE_QUALITY_MAPPING.get(quality,
+                                        self._stream_controller.quality))
+      self._quality = self._stream_controller.quality
+    else:
+      self._quality = self._record_quality
 
   def _send_episodes(self):
     """Sends the metadata of the episodes of the user for the current study."""
@@ -771,48 +1680,73 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
                       episode_id: str) -> None:
     """Initializes the specified episode for replay and sends its metadata.
 
+    The episode is read in a background job, as collecting the rewards
+    requires reading all the steps.
+
     Args:
       study_id: ID of the study.
       session_id: ID of the session.
       episode_id: ID of the episode.
     """
+    # Only the last requested episode is replayed.
+    if self._replay_job:
+      self._replay_job.cancel()
+    self._replay_job = self._submit_job(
+        self._create_job(
+            functools.partial(self._load_replay, study_id, session_id,
+                              episode_id),
+            name='replay_episode'),
+        executor=self._replay_executor)
+
+  def _load_replay(self, study_id: str, session_id: str, episode_id: str,
+                   job: jobs.Job) -> None:
+    """Loads the episode to replay and sends its metadata. Runs as a job."""
+    replay_reader = None
     if study_id == 'file.pickle':
       path = os.path.join(session_id, episode_id)
-      self._replay_reader = self._episode_storage_factory.create_reader(
+      replay_reader = self._episode_storage_factory.create_reader(
           study_pb2.Episode.Storage(
               pickle=study_pb2.Episode.Storage.Pickle(path=path)))
-      self._replay = replay.StaticReplay(
-          self._replay_reader.steps,
-          session_id=session_id,
-          episode_id=episode_id)
+      episode_replay = replay.StaticReplay(
+          replay_reader.steps, session_id=session_id, episode_id=episode_id)
     if study_id == 'file':
-      self._replay_reader = self._episode_storage_factory.create_reader(
+      replay_reader = self._episode_storage_factory.create_reader(
           study_pb2.Episode.Storage(
               environment_logger=study_pb2.Episode.Storage.EnvironmentLogger(
                   tag_directory=session_id, index=int(episode_id))))
-      self._replay = replay.StaticReplay(
-          self._replay_reader.steps,
-          session_id=session_id,
-          episode_id=episode_id)
+      episode_replay = replay.StaticReplay(
+          replay_reader.steps, session_id=session_id, episode_id=episode_id)
     else:
-      self._replay_reader = None
-      self._replay = replay.StorageReplay(self._episode_storage_factory,
-                                          self._storage, study_id, session_id,
-                                          episode_id)
-    episode = self._replay.episode
-    episode_metadata = self._get_episode_metadata(self._replay.study_spec,
-                                                  self._replay.env_spec,
+      replay_reader = None
+      episode_replay = replay.StorageReplay(self._episode_storage_factory,
+                                            self._storage, study_id,
+                                            session_id, episode_id)
+    episode = episode_replay.episode
+    episode_metadata = self._get_episode_metadata(episode_replay.study_spec,
+                                                  episode_replay.env_spec,
                                                   episode)
     # Collect step rewards. Some values may be None, e.g. for the first step, we
     # replace them by 0.
     step_rewards = []
     for i in range(episode.num_steps + 1):  # Include the final reward.
-      step = self._replay.get_step(i)
+      job.check_cancelled()
+      step = episode_replay.get_step(i)
       step_rewards.append(step.timestep.reward
                           if step and step.timestep.reward is not None else 0)
-    self._send_response(
-        replay_episode=client_pb2.ReplayEpisodeResponse(
-            episode=episode_metadata, step_rewards=step_rewards))
+    self._dispatch(self._start_replay, job, episode_replay, replay_reader,
+                   client_pb2.ReplayEpisodeResponse(
+                       episode=episode_metadata, step_rewards=step_rewards))
+
+  def _start_replay(self, job: jobs.Job, episode_replay: replay.Replay,
+                    replay_reader: Optional[episode_storage.EpisodeReader],
+                    response: client_pb2.ReplayEpisodeResponse) -> None:
+    """Sets the loaded episode as the current replay."""
+    if job.cancelled():
+      # Another episode is requested in the meantime.
+      return
+    self._replay = episode_replay
+    self._replay_reader = replay_reader
+    self._send_response(replay_episode=response)
 
   def _send_replay_step(self, index: int) -> None:
     """Sends the data for the specified step of the current replay.
@@ -856,10 +1790,12 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
     step_metadata = self._replay.episode.step_metadata
     if index in step_metadata:
       tags = [tag.label for tag in step_metadata[index].tags]
+    image = step.custom_data.get(constants.METADATA_IMAGE)
     self._send_response(
         replay_step=client_pb2.ReplayStepResponse(
             index=index,
-            image=step.custom_data.get(constants.METADATA_IMAGE),
+            image=image,
+            mime_type=image_codecs.get_mime_type(image) if image else None,
             keys=step.custom_data.get(constants.METADATA_KEYS),
             reward=step.timestep.reward,
             observation=observation,
@@ -918,7 +1854,7 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
             index=request.index, tag=request.tag, success=success))
 
   def _download_episodes(self, request: client_pb2.DownloadEpisodesRequest):
-    """Merges a set of episodes in a downloadable form."""
+    """Merges a set of episodes in a downloadable form in a background job."""
     study_id = None
     environment_id = None
     episodes = []
@@ -937,7 +1873,19 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
         raise ValueError('Episodes must be from the same environment.')
       episodes.append(episode)
 
-    # Merge the episodes.
+    job = self._create_job(
+        functools.partial(self._merge_episodes, request, episodes),
+        name='download_episodes')
+    # The client receives the ID of the job before its progress.
+    self._send_response(
+        download_episodes=client_pb2.DownloadEpisodesResponse(
+            job_id=job.id, progress=0))
+    self._submit_job(job)
+
+  def _merge_episodes(self, request: client_pb2.DownloadEpisodesRequest,
+                      episodes: Sequence[study_pb2.Episode],
+                      job: jobs.Job) -> None:
+    """Merges the episodes and sends the download URL. Runs as a job."""
     env = merger.Merger(
         episodes,
         self._episode_storage_factory,
@@ -974,6 +1922,13 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
     num_episodes = len(episodes)
     processed_episodes = 0
     while not env.done:
+      try:
+        job.check_cancelled()
+      except jobs.JobCancelledError:
+        writer.close()
+        if not request.archive:
+          file_utils.delete_recursively(tag_dir)
+        raise
       action = env.next_action()
       timestep = env.step(action)
       writer.record_step(
@@ -987,10 +1942,10 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
           start_episode()
           processed_episodes += 1
           # Update the progress.
-          progress = 100.0 * processed_episodes / num_episodes
+          job.set_progress(100.0 * processed_episodes / num_episodes)
           self._send_response(
               download_episodes=client_pb2.DownloadEpisodesResponse(
-                  progress=progress))
+                  job_id=job.id, progress=job.progress))
 
     writer.close()
 
@@ -1000,9 +1955,82 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
       url = self.get_url_for_path(archive_path)
     else:
       url = self.get_url_for_path(tag_dir)
+    job.set_progress(100)
     self._send_response(
         download_episodes=client_pb2.DownloadEpisodesResponse(
-            url=url, progress=100))
+            job_id=job.id, url=url, progress=job.progress))
+
+  def _create_job(self, fn: Callable[[jobs.Job], None],
+                  name: str) -> jobs.Job:
+    """Returns a job that reports its failure or cancellation to the client."""
+    return jobs.Job(functools.partial(self._run_job, fn), name=name)
+
+  def _run_job(self, fn: Callable[[jobs.Job], None], job: jobs.Job) -> None:
+    """Executes the function of the job."""
+    try:
+      fn(job)
+    except jobs.JobCancelledError:
+      self._report_cancelled(job)
+    except Exception as e:  # pylint: disable=broad-except
+      logging.exception('Job %s (%s) failed.', job.id, job.name)
+      self._send_error(f'Request failed: {e}')
+
+  def _report_cancelled(self, job: jobs.Job) -> None:
+    """Reports the cancellation of the job to the client."""
+    logging.info('Job %s (%s) is cancelled.', job.id, job.name)
+    if job.name == 'download_episodes':
+      self._send_response(
+          download_episodes=client_pb2.DownloadEpisodesResponse(
+              job_id=job.id, cancelled=True))
+
+  def _on_job_done(self, job: jobs.Job) -> None:
+    """Called when the job finishes or is cancelled before starting."""
+    self._jobs.pop(job.id, None)
+    if job.cancelled_before_start():
+      self._report_cancelled(job)
+
+  def _submit_job(self,
+                  job: jobs.Job,
+                  executor: Optional[jobs.JobExecutor] = None) -> jobs.Job:
+    """Submits the job of the session to the executor.
+
+    Args:
+      job: Job to submit.
+      executor: Executor of the job. Defaults to the shared job executor.
+
+    Returns:
+      The job.
+    """
+    self._jobs[job.id] = job
+    try:
+      (executor or self._job_executor).submit(job)
+    except ValueError:
+      del self._jobs[job.id]
+      raise
+    job.add_done_callback(self._on_job_done)
+    return job
+
+  def _cancel_job(self, job_id: str) -> None:
+    """Cancels the job of the session with the specified ID."""
+    job = self._jobs.get(job_id)
+    if job:
+      job.cancel()
+
+  def _wait_for_jobs(self, timeout: Optional[float] = None) -> None:
+    """Waits for the jobs of the session to finish.
+
+    Args:
+      timeout: Maximum number of seconds to wait for all the jobs.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for job in list(self._jobs.values()):
+      remaining = None
+      if deadline is not None:
+        remaining = max(0, deadline - time.monotonic())
+      try:
+        job.result(remaining)
+      except Exception:  # pylint: disable=broad-except
+        pass
 
   def _handle_action(self, request: client_pb2.ActionRequest):
     """Handles the user action."""
@@ -1035,9 +2063,7 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
     # _step() method.
     self._user_input = environment.UserInput(
         keys=self._keys, controller=controller)
-    env_type = (
-        EnvType(self._env_spec.WhichOneof('type')) if self._env_spec else None)
-    is_procgen = env_type == EnvType.PROCGEN
+    is_procgen = self._get_env_type() == EnvType.PROCGEN
     if PAUSE_KEY in self._keys:
       self._pause(not self._paused)
     elif 'Return' in self._keys and not is_procgen:
@@ -1046,13 +2072,63 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
       self._episode.state = study_pb2.Episode.STATE_CANCELLED
       self._confirm_save()
     elif self._sync:
+      # Gamepads send their state repeatedly, e.g. the analog axes at the poll
+      # rate of the controller. Key presses are never merged.
+      gamepad_input = request.gamepad_input
+      self._step_sync(coalesce=bool(gamepad_input.buttons or
+                                    gamepad_input.axes))
+
+  def _step_sync(self, coalesce: bool):
+    """Takes a step in sync mode, unless it is merged with the next ones.
+
+    Args:
+      coalesce: If true and there was a step in the current action window, then
+        the step is taken at the end of the window with the latest input.
+    """
+    with self._env_lock:
+      self._num_actions += 1
+      if (coalesce and self._action_window_secs > 0 and
+          scheduler.now() < self._next_action_time):
+        if not self._action_timer:
+          self._action_timer = self._scheduler.call_at(
+              self._next_action_time,
+              functools.partial(self._dispatch, self._step_coalesced,
+                                self._action_step_id))
+        return
+      self._step_coalesced()
+
+  def _step_coalesced(self, step_id: Optional[int] = None):
+    """Takes a step with the latest input of the merged action requests.
+
+    Args:
+      step_id: Id of the pending step. If None, then the step is taken
+        immediately.
+    """
+    with self._env_lock:
+      if step_id is not None and step_id != self._action_step_id:
+        # Step is cancelled.
+        return
+      self._cancel_coalesced_step()
+      if not self._env or self._closed or not self._num_actions:
+        return
+      self._next_action_time = scheduler.now() + self._action_window_secs
       self._step()
+      self._num_actions = 0
+
+  def _cancel_coalesced_step(self):
+    """Cancels the pending step in sync mode. The lock should be held."""
+    self._action_step_id += 1
+    if self._action_timer:
+      self._action_timer.cancel()
+      self._action_timer = None
 
   def _set_camera(self, request: client_pb2.SetCameraRequest):
     """Sets the camera used for rendering images."""
     if not self._env:
       # The client will not wait for a response.
       return
+    # The environment may be being reset in the background.
+    self._wait_for_next_episode()
     camera_info = self._env.set_camera(request.index)
     if not camera_info:
       return
@@ -1063,18 +2139,36 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
       # Update the image if the environment is paused or in sync mode. The
       # reward will be 0, but this is a cosmetic issue. In async mode, it will
       # be updated with the next step.
-      _, self._image = self._get_image()
+      _, image, recorded_image = self._get_image()
+      with self._image_lock:
+        self._image, self._recorded_image = image, recorded_image
       self._send_response(
-          step=client_pb2.StepResponse(
-              image=self._image,
-              episode_index=self._episode_index + 1,
-              episode_steps=self._episode_steps))
+          step=self._get_step_response(image, self._episode_index,
+                                       self._episode_steps))
+      self._broadcast_frame(image, self._episode_index, self._episode_steps)
+
+  def _dispatch(self, fn: Callable[..., Any], *args):
+    """Calls the function, in the actor thread if there is one."""
+    if self._actor:
+      self._actor.send(fn, *args)
+    else:
+      fn(*args)
 
   def handle_request(self, request: client_pb2.OperationRequest):
-    """Handles the operation request."""
+    """Handles the operation request.
+
+    If there is an actor, then the request is processed asynchronously.
+
+    Args:
+      request: Request received from the client.
+    """
+    self._dispatch(self._handle_request_safely, request)
+
+  def _handle_request_safely(self, request: client_pb2.OperationRequest):
+    """Handles the request and sends an error response if it fails."""
     try:
       self._handle_request(request)
-    except Exception as e:
+    except Exception as e:  # pylint: disable=broad-except
       logging.exception('Request failed.')
       self._send_error(f'Request failed: {e}')
 
@@ -1108,10 +2202,11 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
     elif op == 'set_camera':
       self._set_camera(request.set_camera)
     elif op == 'set_fps':
-      self._fps = request.set_fps.fps
+      self._set_fps(request.set_fps.fps)
+    elif op == 'set_canvas_size':
+      self._set_canvas_size(request.set_canvas_size)
     elif op == 'set_quality':
-      self._quality = _QUALITY_MAPPING.get(request.set_quality.quality,
-                                           _DEFAULT_QUALITY)
+      self._set_quality(request.set_quality.quality)
     elif op == 'action' and self._env:
       self._handle_action(request.action)
     elif op == 'replay_episode':
@@ -1131,3 +2226,5 @@ class EnvironmentHandler(metaclass=abc.ABCMeta):
       self._remove_step_tag(request.remove_step_tag)
     elif op == 'download_episodes':
       self._download_episodes(request.download_episodes)
+    elif op == 'cancel_job':
+      self._cancel_job(request.cancel_job.job_id)
@@ -16,11 +16,13 @@
 """Tests for rlds_creator.environment_handler."""
 
 import datetime
+import io
 import json
 import os
 import statistics
+import threading
 import time
-from typing import Optional
+from typing import Any, Dict, Optional
 import zipfile
 
 from absl.testing import absltest
@@ -35,10 +37,14 @@ from rlds_creator import environment
 from rlds_creator import environment_handler
 from rlds_creator import episode_storage
 from rlds_creator import episode_storage_factory
+from rlds_creator import image_codecs
+from rlds_creator import jobs
 from rlds_creator import replay
 from rlds_creator import storage
+from rlds_creator import stream_controller
 from rlds_creator import study_pb2
 from rlds_creator import test_utils
+from rlds_creator import text_stream
 from rlds_creator.envs import procgen_env
 
 USER_EMAIL = test_utils.USER_EMAIL
@@ -58,6 +64,13 @@ def encode_image(image, fmt='PNG', **kwargs):
       PIL.Image.fromarray(image), format=fmt, **kwargs)
 
 
+def encode_stream_image(handler, image) -> Dict[str, Any]:
+  """Returns the image and MIME type fields of the step response."""
+  _, data = image_codecs.CodecEncoder().encode(handler._codec, image,
+                                               handler._quality)
+  return dict(image=data, mime_type=image_codecs.get_mime_type(data))
+
+
 def create_response(**kwargs) -> client_pb2.OperationResponse:
   """Returns the response with specified fields."""
   return client_pb2.OperationResponse(**kwargs)
@@ -145,13 +158,18 @@ class EnvironmentHandlerTest(parameterized.TestCase):
     self.episode_storage_factory = (
         episode_storage_factory.EpisodeStorageFactory())
 
+    self._create_handler()
+
+  def _create_handler(self, **kwargs):
+    """Creates the environment handler with the specified arguments."""
+    kwargs.setdefault('record_videos', True)
     self.handler = EnvironmentHandler(
         self.storage,
         study_pb2.User(email=USER_EMAIL),
         CONFIG,
         self.episode_storage_factory,
         self.base_log_dir,
-        record_videos=True)
+        **kwargs)
     self.handler.send_response = self.enter_context(
         mock.patch.object(self.handler, 'send_response'))
     # Make sure that mocks do not have any expectations set.
@@ -185,7 +203,9 @@ class EnvironmentHandlerTest(parameterized.TestCase):
     self.storage.get_studies.assert_called_once_with(email=USER_EMAIL)
     self.assert_responses([
         response_call(
-            config=client_pb2.ConfigResponse(config=json.dumps(CONFIG))),
+            config=client_pb2.ConfigResponse(
+                config=json.dumps(CONFIG),
+                resume_token=self.handler.resume_token)),
         response_call(
             set_studies=client_pb2.SetStudiesResponse(studies=studies))
     ])
@@ -334,6 +354,7 @@ class EnvironmentHandlerTest(parameterized.TestCase):
         response_call(
             step=client_pb2.StepResponse(
                 image=self.handler._image,
+                mime_type=image_codecs.get_mime_type(self.handler._image),
                 episode_index=1,
                 episode_steps=0,
                 reward=0)),
@@ -367,15 +388,49 @@ class EnvironmentHandlerTest(parameterized.TestCase):
         select_environment=client_pb2.SelectEnvironmentRequest(env_id=env_id))
     self._reset_mocks()
 
+  def test_release_env(self):
+    self._select_environment(sample_study_spec_with_env())
+    env = self.handler._env
+    release_env = self.enter_context(
+        mock.patch.object(self.handler, 'release_env'))
+    # Selecting the environment again replaces the current one.
+    self.send_request(
+        select_environment=client_pb2.SelectEnvironmentRequest(env_id='env'))
+    release_env.assert_called_once_with(env)
+    release_env.reset_mock()
+    env = self.handler._env
+    self.handler.close()
+    release_env.assert_called_once_with(env)
+    self.assertIsNone(self.handler._env)
+
+  def test_select_environment_already_reset(self):
+    env = procgen_env.ProcgenEnvironment(sample_env_spec())
+    timestep = env.env().reset()
+    self.enter_context(
+        mock.patch.object(
+            self.handler, 'create_env_from_spec', return_value=env))
+    self.enter_context(
+        mock.patch.object(
+            self.handler, 'take_reset_timestep', return_value=timestep))
+    reset = self.enter_context(mock.patch.object(env.env(), 'reset'))
+    self._select_environment(sample_study_spec_with_env())
+    # The first timestep of the environment is recorded without a reset.
+    reset.assert_not_called()
+    self.assertIs(timestep, self.handler._episode_writer._steps[0].timestep)
+
   def test_action(self):
     self._select_environment(sample_study_spec_with_env())
+    # Make sure that the rendered image differs from the initial one.
+    self.enter_context(
+        mock.patch.object(
+            self.handler._env, 'render', return_value=SAMPLE_IMAGE))
 
     self.send_request(action=client_pb2.ActionRequest(keys=['ArrowUp']))
 
     # New state of the environment should be sent. Step should be 1.
     self.assert_response(
         step=client_pb2.StepResponse(
-            image=self.handler._image,
+            **encode_stream_image(self.handler, SAMPLE_IMAGE),
             episode_index=1,
             episode_steps=1,
             reward=0))
@@ -384,6 +439,139 @@ class EnvironmentHandlerTest(parameterized.TestCase):
     self.assertEqual(
         environment.UserInput(keys={'Up': 1}), self.handler._user_input)
 
+  def test_action_steps_with_user_input(self):
+    self._select_environment(sample_study_spec_with_env())
+    env = self.handler._env
+    step_with_user_input = self.enter_context(
+        mock.patch.object(
+            env, 'step_with_user_input', wraps=env.step_with_user_input))
+    render = self.enter_context(
+        mock.patch.object(env, 'render', return_value=SAMPLE_IMAGE))
+
+    self.send_request(action=client_pb2.ActionRequest(keys=['ArrowUp']))
+
+    # The step is taken and rendered at once.
+    step_with_user_input.assert_called_once_with(
+        environment.UserInput(keys={'Up': 1}),
+        render=True,
+        render_text=False,
+        skip_none_action=True)
+    render.assert_called_once()
+    self.assertEqual(1, self.handler._episode_steps)
+
+  def test_set_canvas_size(self):
+    self._select_environment(sample_study_spec_with_env())
+    image = np.tile(SAMPLE_IMAGE, (32, 16, 1))
+    self.enter_context(
+        mock.patch.object(self.handler._env, 'render', return_value=image))
+
+    # Canvas is 32x32 in device pixels.
+    self.send_request(
+        set_canvas_size=client_pb2.SetCanvasSizeRequest(
+            width=16, height=16, device_pixel_ratio=2))
+    self.send_request(action=client_pb2.ActionRequest(keys=['ArrowUp']))
+
+    # Image should be scaled down to fit the canvas, keeping the aspect ratio.
+    response = self.handler.send_response.call_args[0][0]
+    sent_image = PIL.Image.open(io.BytesIO(response.step.image))
+    self.assertEqual((16, 32), sent_image.size)
+    # But the recorded image has the full resolution.
+    step = self.handler._episode_writer._steps[-1]
+    recorded_image = PIL.Image.open(
+        io.BytesIO(step.custom_data[constants.METADATA_IMAGE]))
+    self.assertEqual((32, 64), recorded_image.size)
+
+  def test_tiled(self):
+    self._create_handler(tiled=True)
+    self._select_environment(sample_study_spec_with_env())
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+    render = self.enter_context(
+        mock.patch.object(self.handler._env, 'render', return_value=image))
+
+    self.send_request(action=client_pb2.ActionRequest(keys=['ArrowUp']))
+    # The whole image is sent as it differs from the initial one.
+    self.assertTrue(
+        self.handler.send_response.call_args[0][0].step.HasField('image'))
+
+    changed_image = image.copy()
+    changed_image[40, 40] = 255
+    render.return_value = changed_image
+    self.send_request(action=client_pb2.ActionRequest(keys=['ArrowDown']))
+    # Only the changed tile is sent.
+    step = self.handler.send_response.call_args[0][0].step
+    self.assertFalse(step.HasField('image'))
+    self.assertLen(step.tiles, 1)
+    self.assertEqual((32, 32), (step.tiles[0].x, step.tiles[0].y))
+
+    # The image is encoded again with the new quality, but it is not changed.
+    self.send_request(
+        set_quality=client_pb2.SetQualityRequest(
+            quality=client_pb2.SetQualityRequest.QUALITY_HIGH))
+    self.send_request(action=client_pb2.ActionRequest(keys=['ArrowUp']))
+    step = self.handler.send_response.call_args[0][0].step
+    self.assertTrue(step.same_image)
+    self.assertEmpty(step.tiles)
+
+  def test_text_stream(self):
+    self._create_handler(text_stream_enabled=True, record_videos=False)
+    screen = np.zeros((24, 80, 2), dtype=np.uint8)
+    screen[..., 0] = ord(' ')
+    render_text = self.enter_context(
+        mock.patch.object(
+            procgen_env.ProcgenEnvironment, 'render_text',
+            return_value=screen))
+    self._select_study(sample_study_spec_with_env())
+    self.send_request(
+        select_environment=client_pb2.SelectEnvironmentRequest(env_id='env'))
+    # The whole screen is sent first.
+    step = self.handler.send_response.call_args_list[0][0][0].step
+    self.assertEqual(text_stream.MIME_TYPE, step.mime_type)
+    np.testing.assert_array_equal(screen, text_stream.decode(step.image))
+
+    changed_screen = screen.copy()
+    changed_screen[10, 20, 0] = ord('@')
+    render_text.return_value = changed_screen
+    self.send_request(action=client_pb2.ActionRequest(keys=['ArrowUp']))
+    # Only the changed cell is sent.
+    step = self.handler.send_response.call_args[0][0].step
+    self.assertLess(len(step.image), 20)
+    np.testing.assert_array_equal(changed_screen,
+                                  text_stream.decode(step.image, screen))
+    # The rendered image is recorded instead of the text screen.
+    steps = self.handler._episode_writer._steps
+    recorded_image = PIL.Image.open(
+        io.BytesIO(steps[-1].custom_data[constants.METADATA_IMAGE]))
+    self.assertEqual('JPEG', recorded_image.format)
+
+  def test_action_same_image(self):
+    self._select_environment(sample_study_spec_with_env())
+    self.enter_context(
+        mock.patch.object(
+            self.handler._env, 'render', return_value=SAMPLE_IMAGE))
+
+    self.send_request(action=client_pb2.ActionRequest(keys=['ArrowUp']))
+    self.send_request(action=client_pb2.ActionRequest(keys=['ArrowDown']))
+
+    # Image should not be sent again if it is not changed.
+    self.assert_responses([
+        response_call(
+            step=client_pb2.StepResponse(
+                **encode_stream_image(self.handler, SAMPLE_IMAGE),
+                episode_index=1,
+                episode_steps=1,
+                reward=0)),
+        response_call(
+            step=client_pb2.StepResponse(
+                same_image=True,
+                mime_type=image_codecs.get_mime_type(self.handler._image),
+                episode_index=1,
+                episode_steps=2,
+                reward=0)),
+    ])
+    # The encoded image should be reused in the step metadata.
+    steps = self.handler._episode_writer._steps
+    self.assertIs(steps[1].custom_data['image'], steps[2].custom_data['image'])
+
   def test_action_sync_no_keys(self):
     self._select_environment(sample_study_spec_with_env())
     self.send_request(action=client_pb2.ActionRequest(keys=[]))
@@ -414,6 +602,38 @@ class EnvironmentHandlerTest(parameterized.TestCase):
                 mark_as_completed=True)),
     ])
 
+  def test_prepare_next_episode(self):
+    self._select_environment(sample_study_spec_with_env())
+    dm_env = self.handler._env.env()
+    reset = self.enter_context(
+        mock.patch.object(dm_env, 'reset', wraps=dm_env.reset))
+    # End of the episode.
+    self.handler._episode.state = study_pb2.Episode.STATE_COMPLETED
+    self.handler._confirm_save()
+    # Environment should be reset in the background while the user confirms
+    # saving the episode.
+    next_episode = self.handler._next_episode_job.result()
+    reset.assert_called_once()
+
+    self.send_request(
+        save_episode=client_pb2.SaveEpisodeRequest(
+            accept=True, mark_as_completed=False))
+    # The prepared episode should be used without resetting again.
+    reset.assert_called_once()
+    self.assertIsNone(self.handler._next_episode_job)
+    self.assertIs(next_episode.episode_writer, self.handler._episode_writer)
+    self.assertEqual('1.1', self.handler._episode.id)
+
+  def test_prepare_next_episode_not_supported(self):
+    self._select_environment(sample_study_spec_with_env())
+    self.enter_context(
+        mock.patch.object(
+            self.handler._env, 'can_reset_in_background', return_value=False))
+    self.handler._episode.state = study_pb2.Episode.STATE_COMPLETED
+    self.handler._confirm_save()
+    # The environment is reset when the next episode starts.
+    self.assertIsNone(self.handler._next_episode_job)
+
   def test_action_pause_async(self):
     self._select_environment(sample_study_spec_with_async_env())
     # Environment will be initially in paused state. Unpause.
@@ -428,6 +648,34 @@ class EnvironmentHandlerTest(parameterized.TestCase):
     self.handler.send_response.assert_has_calls(
         [response_call(pause=client_pb2.PauseResponse(paused=True))])
 
+  def test_detach_and_resume(self):
+    self._select_environment(sample_study_spec_with_async_env())
+    # Unpause the environment.
+    self.send_request(
+        action=client_pb2.ActionRequest(keys=[environment_handler.PAUSE_KEY]))
+    time.sleep(0.2)
+    env = self.handler._env
+    episode = self.handler._episode
+
+    self.handler.detach()
+    # Environment should be paused, but not closed.
+    self.assertTrue(self.handler._paused)
+    self.assertIs(env, self.handler._env)
+    self.assertIs(episode, self.handler._episode)
+
+    self._reset_mocks()
+    self.handler.resume()
+    # Pause state and the whole image should be sent again.
+    self.assert_responses([
+        response_call(pause=client_pb2.PauseResponse(paused=True)),
+        response_call(
+            step=client_pb2.StepResponse(
+                episode_index=self.handler._episode_index + 1,
+                episode_steps=self.handler._episode_steps,
+                image=self.handler._image,
+                mime_type=image_codecs.get_mime_type(self.handler._image)))
+    ])
+
   def test_action_gamepad(self):
     self._select_environment(sample_study_spec_with_env())
     self.send_request(
@@ -455,7 +703,39 @@ class EnvironmentHandlerTest(parameterized.TestCase):
     # Controller ID should be set in the episode.
     self.assertEqual('my_controller', self.handler._episode.controller_id)
 
-  def test_async_env(self):
+  def test_action_gamepad_coalesced(self):
+    self._create_handler(action_window_secs=0.2)
+    self._select_environment(sample_study_spec_with_env())
+    writer = self.handler._episode_writer
+    record_step = self.enter_context(
+        mock.patch.object(writer, 'record_step', wraps=writer.record_step))
+
+    def send_gamepad_input(value):
+      self.send_request(
+          action=client_pb2.ActionRequest(
+              gamepad_input=client_pb2.GamepadInput(axes={0: value})))
+
+    # The first input is applied immediately and the next ones are merged.
+    for value in [0.125, 0.25, 0.5, 0.75]:
+      send_gamepad_input(value)
+    self.assertEqual(1, record_step.call_count)
+    time.sleep(0.3)
+    # The merged inputs are applied at the end of the window with the latest
+    # input.
+    self.assertEqual(2, record_step.call_count)
+    self.assertEqual({'Axis0': 0.75}, self.handler._keys)
+    num_actions = [
+        call[0][0].custom_data[constants.METADATA_NUM_ACTIONS]
+        for call in record_step.call_args_list
+    ]
+    self.assertEqual([1, 3], num_actions)
+    # Key presses are not merged.
+    self.send_request(action=client_pb2.ActionRequest(keys=['ArrowUp']))
+    self.assertEqual(3, record_step.call_count)
+
+  @parameterized.named_parameters(('default', False), ('pipelined', True))
+  def test_async_env(self, pipelined):
+    self._create_handler(pipelined=pipelined)
     self._select_environment(sample_study_spec_with_async_env())
     # Async environment should be in paused state.
     self.assertTrue(self.handler._paused)
@@ -485,6 +765,89 @@ class EnvironmentHandlerTest(parameterized.TestCase):
     latency = [timestamps[i] - timestamps[i - 1] for i in range(1, num_steps)]
     self.assertBetween(statistics.mean(latency), 0.09, 0.11)
 
+  @parameterized.named_parameters(('default', False), ('pipelined', True))
+  def test_async_env_stream_fps(self, pipelined):
+    self._create_handler(pipelined=pipelined, stream_fps=5)
+    self._select_environment(sample_study_spec_with_async_env())
+    # Environment steps at 20 FPS, but only every 4th step is streamed.
+    self.send_request(set_fps=client_pb2.SetFpsRequest(fps=20))
+    writer = self.handler._episode_writer
+    record_step = self.enter_context(
+        mock.patch.object(writer, 'record_step', wraps=writer.record_step))
+    recorder = self.handler._video_recorder
+    write_video_frame = self.enter_context(
+        mock.patch.object(recorder, 'write', wraps=recorder.write))
+    steps = []
+
+    def send_fn(request: client_pb2.OperationResponse):
+      if request.WhichOneof('type') == 'step':
+        steps.append(request.step.episode_steps)
+      return True
+
+    self.handler.send_response.side_effect = send_fn
+    self.send_request(
+        action=client_pb2.ActionRequest(keys=[environment_handler.PAUSE_KEY]))
+    time.sleep(1)
+    self.send_request(
+        action=client_pb2.ActionRequest(keys=[environment_handler.PAUSE_KEY]))
+    # All the steps are recorded, each with an image.
+    self.assertBetween(record_step.call_count, 18, 22)
+    for call in record_step.call_args_list:
+      self.assertIsNotNone(call[0][0].custom_data[constants.METADATA_IMAGE])
+    self.assertBetween(len(steps), 4, 7)
+    self.assertEqual(1, steps[0])
+    # The video has a frame for each step.
+    self.assertGreaterEqual(write_video_frame.call_count,
+                            record_step.call_count)
+
+  def test_async_env_pipelined_pause(self):
+    self._create_handler(pipelined=True)
+    self._select_environment(sample_study_spec_with_async_env())
+    steps = []
+
+    def send_fn(request: client_pb2.OperationResponse):
+      steps.append(request.WhichOneof('type'))
+      return True
+
+    self.handler.send_response.side_effect = send_fn
+    # Unpause and pause the environment.
+    self.send_request(
+        action=client_pb2.ActionRequest(keys=[environment_handler.PAUSE_KEY]))
+    time.sleep(0.5)
+    self.send_request(
+        action=client_pb2.ActionRequest(keys=[environment_handler.PAUSE_KEY]))
+    # All steps should be sent before the pause response and the number of
+    # recorded steps should match.
+    self.assertEqual(['pause'] + ['step'] * self.handler._episode_steps +
+                     ['pause'], steps)
+    self.assertLen(self.handler._episode_writer._steps,
+                   self.handler._episode_steps + 1)
+
+  def test_async_env_pipelined_failure(self):
+    self._create_handler(pipelined=True)
+    self._select_environment(sample_study_spec_with_async_env())
+    self.enter_context(
+        mock.patch.object(
+            self.handler._episode_writer,
+            'record_step',
+            side_effect=IOError('disk full')))
+    errors = []
+
+    def send_fn(request: client_pb2.OperationResponse):
+      if request.WhichOneof('type') == 'error':
+        errors.append(request.error.mesg)
+      return True
+
+    self.handler.send_response.side_effect = send_fn
+    self.send_request(
+        action=client_pb2.ActionRequest(keys=[environment_handler.PAUSE_KEY]))
+    time.sleep(0.5)
+    # The episode is saved as failed and a new one is started in paused state.
+    self.assertEqual(['Unable to record the episode: disk full'], errors)
+    (episode,), _ = self.storage.create_episode.call_args
+    self.assertEqual(study_pb2.Episode.STATE_FAILED, episode.state)
+    self.assertTrue(self.handler._paused)
+
   @parameterized.named_parameters(
       ('accept_completed', True, True, study_pb2.Episode.STATE_COMPLETED),
       ('accept_not_completed', True, False, study_pb2.Episode.STATE_CANCELLED),
@@ -549,6 +912,7 @@ class EnvironmentHandlerTest(parameterized.TestCase):
         response_call(
             step=client_pb2.StepResponse(
                 image=self.handler._image,
+                mime_type=image_codecs.get_mime_type(self.handler._image),
                 episode_index=2,
                 episode_steps=0,
                 reward=0)),
@@ -598,6 +962,38 @@ class EnvironmentHandlerTest(parameterized.TestCase):
             quality=client_pb2.SetQualityRequest.QUALITY_HIGH))
     self.assertEqual('web_high', self.handler._quality)
 
+  def test_actor(self):
+    self._create_handler(use_actor=True)
+    self.send_request(set_fps=client_pb2.SetFpsRequest(fps=5))
+    # Request is processed asynchronously by the actor. Closing it waits for
+    # the pending requests.
+    self.handler._actor.close()
+    self.assertEqual(5, self.handler._fps)
+
+  def test_adaptive_stream(self):
+    self._create_handler(
+        stream_bounds=stream_controller.Bounds(
+            min_fps=5, max_fps=20, min_quality=20, max_quality=80))
+    # The stream is bounded by the step rate.
+    self.assertEqual(constants.ASYNC_FPS, self.handler._fps)
+    self.assertEqual(constants.ASYNC_FPS, self.handler._stream_fps)
+    self.assertEqual(80, self.handler._quality)
+    # Requested frame rate and quality are the upper bounds.
+    self.send_request(set_fps=client_pb2.SetFpsRequest(fps=10))
+    self.send_request(
+        set_quality=client_pb2.SetQualityRequest(
+            quality=client_pb2.SetQualityRequest.QUALITY_MEDIUM))
+    self.assertEqual(10, self.handler._stream_fps)
+    self.assertEqual(65, self.handler._quality)
+    # Large send backlog should reduce the quality and the frame rate of the
+    # stream, but not the step rate or the quality of the recorded images.
+    for _ in range(100):
+      self.handler._update_stream(0.001, 0.001, b'image', backlog=10)
+    self.assertEqual(10, self.handler._fps)
+    self.assertLess(self.handler._stream_fps, 10)
+    self.assertLess(self.handler._quality, 65)
+    self.assertEqual('web_medium', self.handler._record_quality)
+
   @parameterized.named_parameters(('paused_sync', True, True),
                                   ('paused_async', True, False),
                                   ('unpaused_sync', False, True))
@@ -616,8 +1012,7 @@ class EnvironmentHandlerTest(parameterized.TestCase):
         # Image should also be updated.
         response_call(
             step=client_pb2.StepResponse(
-                image=encode_image(
-                    SAMPLE_IMAGE, fmt='JPEG', quality=self.handler._quality),
+                **encode_stream_image(self.handler, SAMPLE_IMAGE),
                 episode_index=0,
                 episode_steps=0)),
     ])
@@ -749,6 +1144,8 @@ class EnvironmentHandlerTest(parameterized.TestCase):
         replay_episode=client_pb2.ReplayEpisodeRequest(
             ref=client_pb2.EpisodeRef(
                 study_id='study', session_id='session', episode_id='episode')))
+    # Episode is loaded in a background job.
+    self.handler._wait_for_jobs()
 
     # Store replay object should be created with the episode reference.
     storage_replay.assert_called_once_with(self.episode_storage_factory,
@@ -949,17 +1346,27 @@ class EnvironmentHandlerTest(parameterized.TestCase):
         download_episodes=client_pb2.DownloadEpisodesRequest(
             refs=refs, archive=archive,
             end_of_episode_tags=end_of_episode_tags))
+    # Episodes are merged in a background job.
+    self.handler._wait_for_jobs()
 
-    # There should be two download responses.
-    ((response1,), _), ((response2,), _) = (
+    # There should be three download responses; the first one has the ID of the
+    # job.
+    ((response0,), _), ((response1,), _), ((response2,), _) = (
         self.handler.send_response.call_args_list)
 
+    job_id = response0.download_episodes.job_id
+    self.assertNotEmpty(job_id)
     self.assertEqual(
         create_response(
-            download_episodes=client_pb2.DownloadEpisodesResponse(progress=50)),
-        response1)
+            download_episodes=client_pb2.DownloadEpisodesResponse(
+                job_id=job_id, progress=0)), response0)
+    self.assertEqual(
+        create_response(
+            download_episodes=client_pb2.DownloadEpisodesResponse(
+                job_id=job_id, progress=50)), response1)
 
     download_episodes = response2.download_episodes
+    self.assertEqual(job_id, download_episodes.job_id)
     self.assertTrue(download_episodes.url.startswith(URL_PREFIX))
     self.assertEqual(100, download_episodes.progress)
 
@@ -1002,6 +1409,71 @@ class EnvironmentHandlerTest(parameterized.TestCase):
           ],
           r.metadata)
 
+  def test_cancel_job(self):
+    started = threading.Event()
+
+    def run(job):
+      started.set()
+      while True:
+        job.check_cancelled()
+        time.sleep(0.01)
+
+    job = self.handler._submit_job(
+        self.handler._create_job(run, name='download_episodes'))
+    self.assertTrue(started.wait(5))
+    self.send_request(cancel_job=client_pb2.CancelJobRequest(job_id=job.id))
+    self.handler._wait_for_jobs()
+    self.assert_response(
+        download_episodes=client_pb2.DownloadEpisodesResponse(
+            job_id=job.id, cancelled=True))
+
+  def test_cancel_pending_job(self):
+    event = threading.Event()
+    executor = jobs.JobExecutor(max_workers=1)
+    self.addCleanup(executor.shutdown)
+    self.addCleanup(event.set)
+    self.handler._submit_job(
+        self.handler._create_job(lambda job: event.wait(), name='job'),
+        executor=executor)
+    job = self.handler._submit_job(
+        self.handler._create_job(lambda job: None, name='download_episodes'),
+        executor=executor)
+    self.send_request(cancel_job=client_pb2.CancelJobRequest(job_id=job.id))
+    # The job is never started, but its cancellation is still reported.
+    self.assertTrue(job.cancelled_before_start())
+    self.assertNotIn(job.id, self.handler._jobs)
+    self.assert_response(
+        download_episodes=client_pb2.DownloadEpisodesResponse(
+            job_id=job.id, cancelled=True))
+
+  def test_close_cancels_jobs(self):
+    started = threading.Event()
+    stopped = threading.Event()
+
+    def run(job):
+      started.set()
+      try:
+        while True:
+          job.check_cancelled()
+          time.sleep(0.01)
+      finally:
+        stopped.set()
+
+    self.handler._submit_job(self.handler._create_job(run, name='job'))
+    self.assertTrue(started.wait(5))
+    self.handler.close()
+    # The job is cancelled and finished before the handler is closed.
+    self.assertTrue(stopped.is_set())
+
+  def test_job_failure(self):
+
+    def run(unused_job):
+      raise ValueError('Failure.')
+
+    self.handler._submit_job(self.handler._create_job(run, name='job'))
+    self.handler._wait_for_jobs()
+    self.assert_error_response('Request failed: Failure.')
+
   def test_download_episodes_different_study(self):
     self.storage.get_episode.return_value = study_pb2.Episode()
     self.send_request(
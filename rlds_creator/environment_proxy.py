@@ -15,21 +15,40 @@
 
 """Proxied environment that runs in a separate process."""
 
+import collections
+from concurrent import futures
 import enum
 import multiprocessing
 import multiprocessing.connection
+from multiprocessing import reduction
+import os
+import signal
+import socket
+import struct
 import threading
-from typing import Callable, Optional
+import time
+import weakref
+from typing import Any, Callable, Optional
 
 from absl import logging
 import dm_env
+import numpy as np
 from rlds_creator import environment
+from rlds_creator import shared_ring
 from rlds_creator import study_pb2
 
 # Timeout for receiving data in the environment proxy.
 PROXY_RECV_TIMEOUT_SECS = 60
 # Timeout for terminating the child process of the environment proxy.
 PROXY_TERMINATION_TIMEOUT_SECS = 10
+# Maximum number of the commands that are sent to the child process before
+# their responses are received. Sending more commands waits for the oldest
+# response; otherwise both processes could block on the full connection.
+PROXY_MAX_PENDING_COMMANDS = 4
+# Maximum size of a serialized environment specification sent to a zygote.
+_MAX_ZYGOTE_MESSAGE_SIZE = 1 << 20
+# Process ID of a forked child.
+_PID = struct.Struct('<i')
 
 
 class Cmd(enum.Enum):
@@ -38,50 +57,144 @@ class Cmd(enum.Enum):
   KEYS_TO_ACTION = 1
   USER_INPUT_TO_ACTION = 11
   RENDER = 2
+  RENDER_TEXT = 13
   SET_CAMERA = 12
   METADATA = 3
+  STEP_INFO = 15
+  # Maps the user input to an action, takes the step and renders the result.
+  STEP_AND_RENDER = 14
   # dm_env.Environment methods.
   RESET = 4
   STEP = 5
   OBSERVATION_SPEC = 6
   ACTION_SPEC = 7
+  REWARD_SPEC = 16
+  DISCOUNT_SPEC = 17
   CLOSE = 8
   # Used internally.
   INIT = 9
   QUIT = 10
 
 
+# Commands whose responses may have large arrays, e.g. images.
+_SHARED_MEMORY_CMDS = (Cmd.RENDER, Cmd.RESET, Cmd.STEP, Cmd.STEP_AND_RENDER)
+
+
 class EnvironmentProxy(environment.Environment, dm_env.Environment):
   """Proxy environment.
 
   This class implements both environment.Environment and DM Environment
   interfaces and sends the method invocations to the handler that executes them
   in a separate process.
+
+  If shared memory is enabled, then the large arrays of the rendered images and
+  the time steps are passed in a ring of shared memory slots instead of the
+  connection. A slot is reused after its views are garbage collected. The
+  rendered images, which are usually encoded and dropped, are returned as
+  read-write views of the slots. The other arrays, e.g. the observations that
+  the episode writers keep, are copied out of the slots so that they don't pin
+  them.
+
+  The commands can also be sent asynchronously, e.g. to take the next step
+  while the previous one is being processed. The child process executes them in
+  order and each response is tagged with the ID of its command. Responses are
+  received when the result of a future, or of a later command, is requested;
+  the callbacks of the futures are invoked then.
   """
 
-  def __init__(self, conn: multiprocessing.connection.Connection,
-               process: multiprocessing.Process):
+  def __init__(self,
+               conn: multiprocessing.connection.Connection,
+               process: multiprocessing.Process,
+               shared_memory: bool = False):
     self._conn = conn
     self._process = process
-    # Used to serialize the method invocations.
+    self._ring_reader = shared_ring.RingReader()
+    # Specs of the environment, retrieved once.
+    self._specs = {}
+    # IDs and futures of the commands whose responses are not received yet, in
+    # the order that they are sent.
+    self._pending = collections.deque()
+    self._next_id = 0
+    # Used to serialize sending the commands and receiving the responses.
     self._lock = threading.Lock()
-    self._send(Cmd.INIT)
+    self._recv_lock = threading.RLock()
+    self._send(Cmd.INIT, shared_memory and shared_ring.is_supported())
+
+  def send_async(self, cmd: Cmd, args=None) -> futures.Future:
+    """Sends the command to the child process without waiting for it.
+
+    Args:
+      cmd: Command to send.
+      args: Arguments of the command.
+
+    Returns:
+      Future of the response. Its result is the value returned by the command
+      or the exception raised by it.
+    """
+    # Exceptions raised in send and recv calls will be handled upstream.
+    with self._recv_lock:
+      while len(self._pending) >= PROXY_MAX_PENDING_COMMANDS:
+        self._receive_until(self._pending[0][1])
+    with self._lock:
+      logging.debug('Sending command %s', cmd)
+      future = _ProxyFuture(self._receive_until)
+      self._pending.append((self._next_id, future))
+      self._conn.send([self._next_id, cmd, args])
+      self._next_id += 1
+    return future
 
   def _send(self, cmd: Cmd, args=None):
     """Sends the command to the child process and returns the response."""
-    with self._lock:
-      logging.debug('Sending command %s', cmd)
-      # Exceptions raised in send and recv calls will be handled upstream.
-      self._conn.send([cmd, args])
-      if not self._conn.poll(PROXY_RECV_TIMEOUT_SECS):
-        raise IOError('Environment proxy timed-out.')
-      resp = self._conn.recv()
-      if isinstance(resp, Exception):
-        raise resp
-      return resp
+    return self.send_async(cmd, args).result()
+
+  def _receive_until(self, future: futures.Future,
+                     timeout: Optional[float] = None):
+    """Receives the responses until the future is done.
+
+    Args:
+      future: Future of a sent command.
+      timeout: Maximum number of seconds to wait for each response. If None,
+        then the proxy timeout is used.
+
+    Raises:
+      futures.TimeoutError: If the timeout is specified and expires.
+      IOError: If the proxy times out.
+    """
+    with self._recv_lock:
+      while not future.done():
+        if not self._conn.poll(
+            PROXY_RECV_TIMEOUT_SECS if timeout is None else timeout):
+          if timeout is not None:
+            raise futures.TimeoutError()
+          raise IOError('Environment proxy timed-out.')
+        resp = self._conn.recv()
+        if isinstance(resp, shared_ring.RingInfo):
+          # The next response is preceded by a new ring and its file
+          # descriptor.
+          self._ring_reader.attach(resp, reduction.recv_handle(self._conn))
+          continue
+        request_id, resp = resp
+        expected_id, pending_future = self._pending.popleft()
+        if request_id != expected_id:
+          raise IOError(f'Unexpected response {request_id} to command '
+                        f'{expected_id}.')
+        if isinstance(resp, shared_ring.SharedValue):
+          # Converted before the next ring is attached.
+          resp = _copy_retained_arrays(self._ring_reader.receive(resp))
+        if isinstance(resp, Exception):
+          pending_future.set_exception(resp)
+        else:
+          pending_future.set_result(resp)
+
+  def _get_spec(self, cmd: Cmd):
+    """Returns the spec of the environment. Specs are immutable."""
+    if cmd not in self._specs:
+      self._specs[cmd] = self._send(cmd)
+    return self._specs[cmd]
 
   def __del__(self):
-    # Signal termination to the child process and wait for some time.
+    # Signal termination to the child process and wait for some time. Pending
+    # commands are received first.
     try:
       self._send(Cmd.QUIT)
     finally:
@@ -105,12 +218,37 @@ class EnvironmentProxy(environment.Environment, dm_env.Environment):
   def render(self) -> environment.Image:
     return self._send(Cmd.RENDER)
 
+  def render_text(self) -> Optional[environment.TextScreen]:
+    return self._send(Cmd.RENDER_TEXT)
+
   def set_camera(self, index: int) -> Optional[environment.Camera]:
     return self._send(Cmd.SET_CAMERA, index)
 
   def metadata(self) -> environment.Metadata:
     return self._send(Cmd.METADATA)
 
+  def step_info(self) -> Any:
+    return self._send(Cmd.STEP_INFO)
+
+  def step_with_user_input(
+      self,
+      user_input: environment.UserInput,
+      render: bool = True,
+      render_text: bool = False,
+      skip_none_action: bool = False) -> environment.StepResult:
+    return self.step_with_user_input_async(user_input, render, render_text,
+                                           skip_none_action).result()
+
+  def step_with_user_input_async(
+      self,
+      user_input: environment.UserInput,
+      render: bool = True,
+      render_text: bool = False,
+      skip_none_action: bool = False) -> futures.Future:
+    """Asynchronous version of step_with_user_input()."""
+    return self.send_async(Cmd.STEP_AND_RENDER,
+                           (user_input, render, render_text, skip_none_action))
+
   # dm_env.Environment methods.
 
   def reset(self) -> dm_env.TimeStep:
@@ -119,11 +257,21 @@ class EnvironmentProxy(environment.Environment, dm_env.Environment):
   def step(self, action) -> dm_env.TimeStep:
     return self._send(Cmd.STEP, action)
 
+  def step_async(self, action) -> futures.Future:
+    """Asynchronous version of step()."""
+    return self.send_async(Cmd.STEP, action)
+
   def observation_spec(self):
-    return self._send(Cmd.OBSERVATION_SPEC)
+    return self._get_spec(Cmd.OBSERVATION_SPEC)
 
   def action_spec(self):
-    return self._send(Cmd.ACTION_SPEC)
+    return self._get_spec(Cmd.ACTION_SPEC)
+
+  def reward_spec(self):
+    return self._get_spec(Cmd.REWARD_SPEC)
+
+  def discount_spec(self):
+    return self._get_spec(Cmd.DISCOUNT_SPEC)
 
   def close(self):
     # TODO(sertan): We may want to free resources is the underlying environment
@@ -131,6 +279,53 @@ class EnvironmentProxy(environment.Environment, dm_env.Environment):
     self._send(Cmd.CLOSE)
 
 
+class _ProxyFuture(futures.Future):
+  """Future of a proxy command that receives the responses when waited on.
+
+  It refers to the proxy weakly; the futures, e.g. the ones that hold an
+  exception and its traceback, shouldn't delay closing the proxy.
+  """
+
+  def __init__(self, receive_until_fn: Callable[
+      [futures.Future, Optional[float]], None]):
+    super().__init__()
+    self._receive_until_fn = weakref.WeakMethod(receive_until_fn)
+
+  def _receive(self, timeout: Optional[float]):
+    if self.done():
+      return
+    receive_until_fn = self._receive_until_fn()
+    if receive_until_fn is None:
+      raise IOError('Environment proxy is closed.')
+    receive_until_fn(self, timeout)
+
+  def result(self, timeout: Optional[float] = None) -> Any:
+    self._receive(timeout)
+    try:
+      return super().result(0)
+    finally:
+      # Breaks the reference cycle with the raised exception, as in the base
+      # class.
+      self = None  # pylint: disable=self-cls-assignment
+
+  def exception(self, timeout: Optional[float] = None) -> Optional[Exception]:
+    self._receive(timeout)
+    return super().exception(0)
+
+
+def _copy_retained_arrays(value: Any) -> Any:
+  """Returns the value with its arrays, except the rendered images, copied."""
+  if isinstance(value, environment.StepResult):
+    image, value.image = value.image, None
+    value = shared_ring.map_arrays(np.copy, value)
+    value.image = image
+    return value
+  if isinstance(value, np.ndarray):
+    # Rendered image.
+    return value
+  return shared_ring.map_arrays(np.copy, value)
+
+
 def _execute_cmd(env: environment.Environment, cmd: Cmd, args):
   """Executes the specified environment command and returns the result."""
   denv = env.env()
@@ -140,10 +335,16 @@ def _execute_cmd(env: environment.Environment, cmd: Cmd, args):
     return env.user_input_to_action(args)
   elif cmd == Cmd.RENDER:
     return env.render()
+  elif cmd == Cmd.RENDER_TEXT:
+    return env.render_text()
   elif cmd == Cmd.SET_CAMERA:
     return env.set_camera(args)
   elif cmd == Cmd.METADATA:
     return env.metadata()
+  elif cmd == Cmd.STEP_INFO:
+    return env.step_info()
+  elif cmd == Cmd.STEP_AND_RENDER:
+    return env.step_with_user_input(*args)
   elif cmd == Cmd.RESET:
     return denv.reset()
   elif cmd == Cmd.STEP:
@@ -152,6 +353,10 @@ def _execute_cmd(env: environment.Environment, cmd: Cmd, args):
     return denv.observation_spec()
   elif cmd == Cmd.ACTION_SPEC:
     return denv.action_spec()
+  elif cmd == Cmd.REWARD_SPEC:
+    return denv.reward_spec()
+  elif cmd == Cmd.DISCOUNT_SPEC:
+    return denv.discount_spec()
   elif cmd == Cmd.CLOSE:
     return denv.close()
   raise ValueError(f'Unknown command {cmd}.')
@@ -161,20 +366,62 @@ def _execute_cmd(env: environment.Environment, cmd: Cmd, args):
 CreateEnvFn = Callable[[study_pb2.EnvironmentSpec], environment.Environment]
 
 
+class _SharedMemorySender(object):
+  """Sends the responses with large arrays through a shared memory ring."""
+
+  def __init__(self, conn: multiprocessing.connection.Connection,
+               spec_size: int):
+    self._conn = conn
+    # Size of the observations, used to size the slots.
+    self._spec_size = spec_size
+    self._ring = None
+
+  def send(self, request_id: int, resp):
+    """Sends the response, moving its large arrays to the ring."""
+    size = shared_ring.get_array_size(resp)
+    if size:
+      if not self._ring or size > self._ring.info.slot_size:
+        self._create_ring(size)
+      shared_value = self._ring.share(resp)
+      if shared_value:
+        resp = shared_value
+    self._conn.send([request_id, resp])
+
+  def _create_ring(self, size: int):
+    """Replaces the ring with one that has larger slots."""
+    ring_id, slot_size = 0, max(size, self._spec_size)
+    if self._ring:
+      ring_id = self._ring.info.ring_id + 1
+      slot_size = max(slot_size, self._ring.info.slot_size)
+      self._ring.close()
+    self._ring = shared_ring.RingWriter(ring_id, slot_size)
+    self._conn.send(self._ring.info)
+    reduction.send_handle(self._conn, self._ring.fileno(), None)
+
+  def close(self):
+    if self._ring:
+      self._ring.close()
+
+
 def _proxy_handler(conn: multiprocessing.connection.Connection,
                    env_spec: study_pb2.EnvironmentSpec,
                    create_env_fn: CreateEnvFn):
   """Proxy handler in the child process."""
   env = None
+  sender = None
   try:
     while True:
-      cmd, args = conn.recv()
+      request_id, cmd, args = conn.recv()
       logging.debug('Received command %s.', cmd)
       if cmd == Cmd.QUIT:
         break
       try:
         if cmd == Cmd.INIT:
           env = create_env_fn(env_spec)
+          # Arguments specify whether to use shared memory.
+          if args:
+            sender = _SharedMemorySender(
+                conn, shared_ring.get_spec_size(env.env().observation_spec()))
           resp = True
         elif not env:
           resp = ValueError('Environment is not initialized.')
@@ -183,18 +430,26 @@ def _proxy_handler(conn: multiprocessing.connection.Connection,
       except Exception as e:
         # Exceptions due to command executions.
         resp = e
-      conn.send(resp)
-    conn.send(True)  # Acknowledges QUIT.
+      if (sender and cmd in _SHARED_MEMORY_CMDS and
+          not isinstance(resp, Exception)):
+        sender.send(request_id, resp)
+      else:
+        conn.send([request_id, resp])
+    conn.send([request_id, True])  # Acknowledges QUIT.
   except Exception:
     # Exceptions due to send or recv calls.
     logging.exception('Proxy handler exception')
   finally:
+    if sender:
+      sender.close()
     conn.close()
 
 
-def create_proxied_env_from_spec(env_spec: study_pb2.EnvironmentSpec,
-                                 create_env_fn: CreateEnvFn,
-                                 mp_context=None) -> environment.Environment:
+def create_proxied_env_from_spec(
+    env_spec: study_pb2.EnvironmentSpec,
+    create_env_fn: CreateEnvFn,
+    mp_context=None,
+    shared_memory: bool = False) -> environment.Environment:
   """Creates a proxied environment that runs in a separate process.
 
   Args:
@@ -203,6 +458,8 @@ def create_proxied_env_from_spec(env_spec: study_pb2.EnvironmentSpec,
     mp_context: Multiprocessing context used to create the child process and the
       communication pipe. If None, then the default multiprocessing library will
       be used.
+    shared_memory: If true, then the images and the observations are passed in
+      shared memory.
 
   Returns:
     A proxied environment.
@@ -216,4 +473,191 @@ def create_proxied_env_from_spec(env_spec: study_pb2.EnvironmentSpec,
     p = multiprocessing.Process(
         target=_proxy_handler, args=(child_conn, env_spec, create_env_fn))
   p.start()
-  return EnvironmentProxy(parent_conn, p)
+  return EnvironmentProxy(parent_conn, p, shared_memory=shared_memory)
+
+
+class _ForkedProcess(object):
+  """Process that is forked directly, i.e. a zygote or its children.
+
+  It has the subset of the multiprocessing.Process interface that is used by the
+  environment proxy and the zygote. The children of a zygote are reaped by the
+  zygote and their actual exit codes are not known.
+  """
+
+  def __init__(self, pid: int):
+    self.pid = pid
+    self._exitcode = None
+
+  def is_alive(self) -> bool:
+    if self._exitcode is not None:
+      return False
+    try:
+      pid, status = os.waitpid(self.pid, os.WNOHANG)
+    except ChildProcessError:
+      # Not a child of this process, e.g. forked by a zygote.
+      try:
+        os.kill(self.pid, 0)
+        return True
+      except ProcessLookupError:
+        self._exitcode = 0
+        return False
+    if not pid:
+      return True
+    self._exitcode = os.waitstatus_to_exitcode(status)
+    return False
+
+  @property
+  def exitcode(self) -> Optional[int]:
+    return None if self.is_alive() else self._exitcode
+
+  def join(self, timeout: Optional[float] = None):
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while self.is_alive():
+      if deadline is not None and time.monotonic() >= deadline:
+        return
+      time.sleep(0.01)
+
+  def terminate(self):
+    try:
+      os.kill(self.pid, signal.SIGTERM)
+    except ProcessLookupError:
+      pass
+
+
+def _zygote_main(control: socket.socket, create_env_fn: CreateEnvFn,
+                 preload_fn: Optional[Callable[[], None]]):
+  """Forks a proxy handler for each environment specification it receives.
+
+  It stops when it receives an empty message or the control socket is closed.
+  """
+  if preload_fn:
+    preload_fn()
+  # Exited children are reaped automatically.
+  signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+  while True:
+    try:
+      data, fds, _, _ = socket.recv_fds(control, _MAX_ZYGOTE_MESSAGE_SIZE, 1)
+    except OSError:
+      break
+    if not data or not fds:
+      # The zygote is stopped.
+      break
+    env_spec = study_pb2.EnvironmentSpec.FromString(data)
+    pid = os.fork()
+    if pid == 0:
+      # The child inherits the imported modules of the zygote.
+      control.close()
+      signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+      try:
+        _proxy_handler(
+            multiprocessing.connection.Connection(fds[0]), env_spec,
+            create_env_fn)
+      finally:
+        # Skips the cleanup of the zygote, e.g. the multiprocessing handlers.
+        os._exit(0)  # pylint: disable=protected-access
+    os.close(fds[0])
+    control.send(_PID.pack(pid))
+  control.close()
+
+
+# Running zygotes. Their control sockets are closed in the zygotes that are
+# started later.
+_running_zygotes = weakref.WeakSet()
+
+
+class Zygote(object):
+  """Forks the processes of the proxied environments from a warm process.
+
+  Starting a process and importing the modules of some environments, e.g.
+  Robosuite, takes seconds. A zygote imports them once and forks a child for
+  each proxied environment, which inherits the imported modules copy-on-write.
+  The environments themselves are created in the children, as their native
+  states, e.g. the OpenGL contexts, can't be shared by forking.
+
+  The zygote is forked directly instead of being a multiprocessing.Process;
+  joining the latter would also wait for the forked environments, which inherit
+  its sentinel.
+  """
+
+  def __init__(self,
+               create_env_fn: CreateEnvFn,
+               preload_fn: Optional[Callable[[], None]] = None):
+    """Starts the zygote process.
+
+    Args:
+      create_env_fn: Function to create the local environment in the children.
+      preload_fn: Function that is called by the zygote before forking the
+        children, e.g. to import the modules of the environments.
+    """
+    # Message boundaries are preserved by the sequenced packets.
+    self._control, child_control = socket.socketpair(socket.AF_UNIX,
+                                                     socket.SOCK_SEQPACKET)
+    self._control.settimeout(PROXY_RECV_TIMEOUT_SECS)
+    pid = os.fork()
+    if pid == 0:
+      try:
+        # The inherited ends of the parent are closed, so that the zygotes see
+        # when the parent closes them or exits.
+        for zygote in list(_running_zygotes) + [self]:
+          zygote._control.close()  # pylint: disable=protected-access
+        _zygote_main(child_control, create_env_fn, preload_fn)
+      except Exception:  # pylint: disable=broad-except
+        logging.exception('Zygote exception')
+      finally:
+        # Skips the cleanup of the parent, e.g. the atexit handlers.
+        os._exit(0)  # pylint: disable=protected-access
+    child_control.close()
+    self._process = _ForkedProcess(pid)
+    # Used to serialize the requests.
+    self._lock = threading.Lock()
+    _running_zygotes.add(self)
+
+  def is_alive(self) -> bool:
+    return self._process.is_alive()
+
+  def create_env(self,
+                 env_spec: study_pb2.EnvironmentSpec,
+                 shared_memory: bool = False) -> environment.Environment:
+    """Forks a child that runs the environment and returns its proxy.
+
+    Args:
+      env_spec: Specification of the environment.
+      shared_memory: If true, then the images and the observations are passed
+        in shared memory.
+
+    Raises:
+      IOError: If the zygote doesn't respond.
+    """
+    parent_socket, child_socket = socket.socketpair()
+    try:
+      with self._lock:
+        socket.send_fds(self._control, [env_spec.SerializeToString()],
+                        [child_socket.fileno()])
+        try:
+          data = self._control.recv(_PID.size)
+        except socket.timeout as e:
+          raise IOError('Zygote timed-out.') from e
+      if len(data) != _PID.size:
+        raise IOError('Zygote is closed.')
+    finally:
+      child_socket.close()
+    (pid,) = _PID.unpack(data)
+    conn = multiprocessing.connection.Connection(parent_socket.detach())
+    return EnvironmentProxy(
+        conn, _ForkedProcess(pid), shared_memory=shared_memory)
+
+  def close(self):
+    """Stops the zygote. The forked environments keep running."""
+    _running_zygotes.discard(self)
+    with self._lock:
+      try:
+        # The socket may be inherited by other processes; an empty message
+        # stops the zygote regardless.
+        self._control.send(b'')
+      except OSError:
+        # Already closed or stopped.
+        pass
+      self._control.close()
+    self._process.join(PROXY_TERMINATION_TIMEOUT_SECS)
+    if self._process.exitcode is None:
+      self._process.terminate()
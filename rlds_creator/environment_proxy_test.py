@@ -17,8 +17,13 @@
 
 from absl.testing import absltest
 import gym
+import mock
+import numpy as np
 from rlds_creator import environment
 from rlds_creator import environment_proxy
+from rlds_creator import episode_storage
+from rlds_creator import pickle_episode_storage
+from rlds_creator import shared_ring
 from rlds_creator import study_pb2
 from rlds_creator.envs import procgen_env
 
@@ -50,6 +55,8 @@ class EnvironmentProxyTest(absltest.TestCase):
 
     image = env.render()
     self.assertEqual(image.shape, (512, 512, 3))
+    # Procgen environments are not text based.
+    self.assertIsNone(env.render_text())
 
     # dm_env.Environment methods. Reset is checked above.
     self.assertEqual(dm_env.observation_spec().shape, (64, 64, 3))
@@ -63,6 +70,113 @@ class EnvironmentProxyTest(absltest.TestCase):
 
     dm_env.close()
 
+  def test_step_with_user_input(self):
+    env = environment_proxy.create_proxied_env_from_spec(
+        study_pb2.EnvironmentSpec(
+            procgen=study_pb2.EnvironmentSpec.Procgen(id='coinrun')),
+        create_env_fn)
+    env.env().reset()
+    result = env.step_with_user_input(
+        environment.UserInput(keys={'Up': 1}), render_text=True)
+    self.assertEqual(5, result.action)
+    self.assertTrue(result.timestep.mid())
+    self.assertEqual((512, 512, 3), result.image.shape)
+    # Procgen environments are not text based.
+    self.assertFalse(result.is_text)
+    self.assertEqual(env.step_info(), result.info)
+    result = env.step_with_user_input(
+        environment.UserInput(keys={}), render=False)
+    self.assertIsNone(result.image)
+
+  def test_send_async(self):
+    env = environment_proxy.create_proxied_env_from_spec(
+        study_pb2.EnvironmentSpec(
+            procgen=study_pb2.EnvironmentSpec.Procgen(id='coinrun')),
+        create_env_fn)
+    env.env().reset()
+    step_futures = [env.step_async(5) for _ in range(3)]
+    # Keys should be a dictionary.
+    invalid_future = env.send_async(environment_proxy.Cmd.KEYS_TO_ACTION, 1)
+    render_future = env.send_async(environment_proxy.Cmd.RENDER)
+    # Waiting for the last command receives the responses of the previous ones
+    # in order.
+    self.assertEqual(render_future.result().shape, (512, 512, 3))
+    for future in step_futures + [invalid_future]:
+      self.assertTrue(future.done())
+    for future in step_futures:
+      self.assertTrue(future.result().mid())
+    self.assertIsNotNone(invalid_future.exception())
+    # Synchronous calls wait for the pending commands.
+    future = env.step_with_user_input_async(
+        environment.UserInput(keys={'Up': 1}))
+    self.assertEqual(env.keys_to_action({'Up': 1}), 5)
+    self.assertTrue(future.done())
+    self.assertEqual(future.result().action, 5)
+    env.env().close()
+
+  def test_specs(self):
+    env = environment_proxy.create_proxied_env_from_spec(
+        study_pb2.EnvironmentSpec(
+            procgen=study_pb2.EnvironmentSpec.Procgen(id='coinrun')),
+        create_env_fn)
+    dm_env = env.env()
+    self.assertEqual(dm_env.observation_spec().shape, (64, 64, 3))
+    self.assertEqual(dm_env.reward_spec().shape, ())
+    self.assertEqual(dm_env.discount_spec().name, 'discount')
+    # Specs are retrieved once.
+    with mock.patch.object(env, '_send', autospec=True) as mock_send:
+      self.assertEqual(dm_env.observation_spec().shape, (64, 64, 3))
+      self.assertEqual(dm_env.reward_spec().shape, ())
+      mock_send.assert_not_called()
+
+  def test_create_with_shared_memory(self):
+    env = environment_proxy.create_proxied_env_from_spec(
+        study_pb2.EnvironmentSpec(
+            procgen=study_pb2.EnvironmentSpec.Procgen(id='coinrun')),
+        create_env_fn,
+        shared_memory=True)
+    dm_env = env.env()
+    timestep = dm_env.reset()
+    self.assertTrue(timestep.first())
+    self.assertEqual(timestep.observation.shape, (64, 64, 3))
+    images = [env.render() for _ in range(2)]
+    for image in images:
+      self.assertEqual(image.shape, (512, 512, 3))
+    # Images are views of different slots.
+    self.assertFalse(np.shares_memory(images[0], images[1]))
+    timestep = dm_env.step(5)
+    self.assertTrue(timestep.mid())
+    dm_env.close()
+
+  def test_record_with_shared_memory(self):
+    env = environment_proxy.create_proxied_env_from_spec(
+        study_pb2.EnvironmentSpec(
+            procgen=study_pb2.EnvironmentSpec.Procgen(id='coinrun')),
+        create_env_fn,
+        shared_memory=True)
+    dm_env = env.env()
+    writer = pickle_episode_storage.PickleEpisodeWriter(
+        dm_env, self.create_tempdir().full_path)
+    writer.start_episode()
+    writer.record_step(episode_storage.StepData(dm_env.reset(), None))
+    receive = self.enter_context(
+        mock.patch.object(
+            shared_ring.RingReader,
+            'receive',
+            autospec=True,
+            side_effect=shared_ring.RingReader.receive))
+    num_steps = 2 * shared_ring.DEFAULT_NUM_SLOTS
+    for _ in range(num_steps):
+      result = env.step_with_user_input(environment.UserInput(keys={'Up': 1}))
+      writer.record_step(
+          episode_storage.StepData(result.timestep, result.action))
+    # The recorded observations are copied out of the slots, therefore all the
+    # steps are passed in the ring.
+    self.assertEqual(num_steps, receive.call_count)
+    self.assertEqual((512, 512, 3), result.image.shape)
+    writer.close()
+    dm_env.close()
+
   def test_create_failure(self):
     with self.assertRaises(
         gym.error.UnregisteredEnv,
@@ -72,6 +186,39 @@ class EnvironmentProxyTest(absltest.TestCase):
               procgen=study_pb2.EnvironmentSpec.Procgen(id='invalid')),
           create_env_fn)
 
+  def test_zygote(self):
+    zygote = environment_proxy.Zygote(create_env_fn)
+    self.addCleanup(zygote.close)
+    env_spec = study_pb2.EnvironmentSpec(
+        procgen=study_pb2.EnvironmentSpec.Procgen(id='coinrun'))
+    envs = [zygote.create_env(env_spec) for _ in range(2)]
+    # Each environment runs in its own forked process.
+    self.assertNotEqual(envs[0]._process.pid, envs[1]._process.pid)
+    for env in envs:
+      self.assertTrue(env.env().reset().first())
+      self.assertEqual(env.render().shape, (512, 512, 3))
+    process = envs[0]._process
+    envs[0].env().close()
+    del envs[0]
+    process.join(environment_proxy.PROXY_TERMINATION_TIMEOUT_SECS)
+    self.assertFalse(process.is_alive())
+    # Closing the zygote doesn't affect the forked environments.
+    zygote.close()
+    self.assertTrue(envs[1].env().step(5).mid())
+
+  def test_zygote_create_failure(self):
+    zygote = environment_proxy.Zygote(create_env_fn)
+    self.addCleanup(zygote.close)
+    with self.assertRaises(gym.error.UnregisteredEnv):
+      zygote.create_env(
+          study_pb2.EnvironmentSpec(
+              procgen=study_pb2.EnvironmentSpec.Procgen(id='invalid')))
+    # The zygote can fork other environments.
+    env = zygote.create_env(
+        study_pb2.EnvironmentSpec(
+            procgen=study_pb2.EnvironmentSpec.Procgen(id='coinrun')))
+    self.assertTrue(env.env().reset().first())
+
 
 if __name__ == '__main__':
   absltest.main()
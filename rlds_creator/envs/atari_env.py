@@ -54,3 +54,6 @@ class AtariEnvironment(gym_utils.GymEnvironment):
     keys = tuple(
         sorted([_KEY_MAPPING[key] for key in keys if key in _KEY_MAPPING]))
     return self._keys_to_action.get(keys, 0)
+
+  def can_reset_in_background(self) -> bool:
+    return True
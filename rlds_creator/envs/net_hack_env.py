@@ -31,6 +31,27 @@ import nle
 
 _MARGIN = 5  # Margin for the rendered images.
 
+# Observations of the environment. These are the defaults of NLE, but they are
+# set explicitly so that the terminal can be looked up in the observations.
+_OBSERVATION_KEYS = (
+    'glyphs',
+    'chars',
+    'colors',
+    'specials',
+    'blstats',
+    'message',
+    'inv_glyphs',
+    'inv_strs',
+    'inv_letters',
+    'inv_oclasses',
+    'screen_descriptions',
+    'tty_chars',
+    'tty_colors',
+    'tty_cursor',
+)
+_TTY_CHARS_INDEX = _OBSERVATION_KEYS.index('tty_chars')
+_TTY_COLORS_INDEX = _OBSERVATION_KEYS.index('tty_colors')
+
 
 class NetHackEnvironment(gym_utils.GymEnvironment):
   """A NetHack environment."""
@@ -39,7 +60,9 @@ class NetHackEnvironment(gym_utils.GymEnvironment):
     # Default max episode steps in NLE is 5000.
     max_episode_steps = env_spec.max_episode_steps or 5000
     self._net_hack_env = gym.make(
-        env_spec.net_hack.id, max_episode_steps=max_episode_steps)
+        env_spec.net_hack.id,
+        max_episode_steps=max_episode_steps,
+        observation_keys=_OBSERVATION_KEYS)
     self._font = ImageFont.load_default()
     # Image size is set on first render() call.
     self._img_size = None
@@ -68,6 +91,14 @@ class NetHackEnvironment(gym_utils.GymEnvironment):
                                        spacing=0)
     return np.array(img)
 
+  def render_text(self) -> environment.TextScreen:
+    env = self._net_hack_env
+    # The terminal has the message and the status lines as well as the map.
+    observation = env.last_observation
+    chars = observation[_TTY_CHARS_INDEX]
+    colors = observation[_TTY_COLORS_INDEX]
+    return np.stack([chars, colors], axis=-1).astype(np.uint8)
+
   def keys_to_action(self, keys: environment.Keys) -> Optional[int]:
     keys = input_utils.get_mapped_keys(keys, input_utils.DEFAULT_BUTTON_MAPPING)
     for key in keys:
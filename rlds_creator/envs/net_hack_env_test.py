@@ -16,6 +16,7 @@
 """Tests for net_hack_env."""
 
 from absl.testing import absltest
+import numpy as np
 from rlds_creator import study_pb2
 from rlds_creator.envs import net_hack_env
 
@@ -52,6 +53,9 @@ class NetHackEnvTest(absltest.TestCase):
     dm_env.reset()
     image = env.render()
     self.assertEqual(image.shape, (263, 484, 3))
+    screen = env.render_text()
+    self.assertEqual(screen.shape, (24, 80, 2))
+    self.assertEqual(screen.dtype, np.uint8)
 
     # Sanity check. Movement keys.
     keys = {'l': 2, 'k': 1, 'j': 3, 'h': 4}
@@ -98,3 +98,6 @@ class ProcgenEnvironment(gym_utils.GymEnvironment):
 
   def metadata(self) -> environment.Metadata:
     return self._metadata
+
+  def can_reset_in_background(self) -> bool:
+    return True
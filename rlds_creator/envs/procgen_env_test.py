@@ -88,6 +88,7 @@ class ProcgenTest(absltest.TestCase):
     for keys, action in key_mapping:
       self.assertEqual(env.keys_to_action(keys), action)
 
+    self.assertTrue(env.can_reset_in_background())
     dm_env.reset()
     image = env.render()
     self.assertEqual(image.shape, (512, 512, 3))
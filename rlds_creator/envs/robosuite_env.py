@@ -42,6 +42,9 @@ macros.IMAGE_CONVENTION = 'opencv'
 CAMERA_WIDTH = 256
 CAMERA_HEIGHT = 256
 
+# Control frequency of the environments in Hz.
+CONTROL_FREQ = 20
+
 # Default maximum number of steps in an episode.
 DEFAULT_HORIZON = 1000
 
@@ -106,6 +109,13 @@ class _CameraObsWrapper(camera_observation_wrapper.CameraObservationWrapper):
     # similation. We invert it.
     return image[::-1]
 
+  def invalidate_image(self):
+    """Renders the next image instead of using the last observation.
+
+    This is needed if the camera observation may be out of date.
+    """
+    self._image = None
+
 
 # This is a modified version of Keyboard class in
 # third_party/py/robosuite/devices/keyboard.py. Due to (missing) dependencies,
@@ -263,7 +273,7 @@ class RobosuiteEnvironment(environment.Environment):
         'camera_names': self._cameras,
         'camera_widths': CAMERA_WIDTH,
         'controller_configs': controller_config,
-        'control_freq': 20,
+        'control_freq': CONTROL_FREQ,
         'env_name': args.id,
         'horizon': env_spec.max_episode_steps or DEFAULT_HORIZON,
         'reward_shaping': True,
@@ -281,6 +291,8 @@ class RobosuiteEnvironment(environment.Environment):
         'rot_sensitivity': args.rot_sensitivity
     }
     self._metadata.update(config)
+    if self._get_camera_obs_stride() > 1:
+      self._metadata['camera_obs_stride'] = args.camera_obs_stride
 
     self._robosuite_env = robosuite.make(
         **config,
@@ -295,6 +307,7 @@ class RobosuiteEnvironment(environment.Environment):
         DMEnvWrapper(
             visualization_wrapper.VisualizationWrapper(self._robosuite_env)),
         self._robosuite_env, self._cameras[0])
+    self._set_camera_obs_rates(self._cameras[0])
     self._keyboard = Keyboard(
         pos_sensitivity=args.pos_sensitivity,
         rot_sensitivity=args.rot_sensitivity)
@@ -306,6 +319,32 @@ class RobosuiteEnvironment(environment.Environment):
     """Returns the DM environment."""
     return self._env
 
+  def _get_camera_obs_stride(self) -> int:
+    """Returns the stride of the cameras that are not displayed."""
+    return self._args.camera_obs_stride if self._args.use_camera_obs else 1
+
+  def _set_camera_obs_rates(self, displayed_camera: str):
+    """Sets the sampling rates of the camera observations.
+
+    The displayed camera is rendered at each step and the others at every
+    camera_obs_stride steps. Robosuite renders the camera observations only
+    when they are sampled.
+
+    Args:
+      displayed_camera: Name of the displayed camera.
+    """
+    stride = self._get_camera_obs_stride()
+    if stride <= 1:
+      return
+    for camera in self._cameras:
+      rate = CONTROL_FREQ
+      if camera != displayed_camera:
+        rate /= stride
+      self._robosuite_env.modify_observable(
+          observable_name=self._env.get_camera_observation_key(camera),
+          attribute='sampling_rate',
+          modifier=rate)
+
   def keys_to_action(self, keys: environment.Keys):
     """Maps the pressed keys to an action in the environment."""
     return self.user_input_to_action(environment.UserInput(keys=keys))
@@ -334,6 +373,10 @@ class RobosuiteEnvironment(environment.Environment):
       return None
     camera = self._cameras[index]
     self._env.set_camera(camera)
+    if self._get_camera_obs_stride() > 1:
+      self._set_camera_obs_rates(camera)
+      # The last observation of the camera may be out of date.
+      self._env.invalidate_image()
     return environment.Camera(index=index, name=camera)
 
   def metadata(self) -> environment.Metadata:
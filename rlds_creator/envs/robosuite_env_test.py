@@ -187,6 +187,32 @@ class RobosuiteTest(absltest.TestCase):
     # Third camera is not present.
     self.assertIsNone(env.set_camera(2))
 
+  def test_camera_obs_stride(self):
+    env = robosuite_env.RobosuiteEnvironment(
+        study_pb2.EnvironmentSpec(
+            robosuite=study_pb2.EnvironmentSpec.Robosuite(
+                id='Lift',
+                robots=['Panda'],
+                config='single-arm-opposed',
+                use_camera_obs=True,
+                cameras=['agentview', 'frontview'],
+                camera_obs_stride=4)))
+    self.assertEqual(4, env.metadata()['camera_obs_stride'])
+
+    dm_env = env.env()
+    timestep = dm_env.reset()
+    frontview = timestep.observation['frontview_image']
+    # Move the robot arm.
+    timestep = dm_env.step(env.keys_to_action({'r': 1}))
+    # The other camera is not rendered and has the previous image.
+    npt.assert_equal(frontview, timestep.observation['frontview_image'])
+
+    # Displayed camera is rendered again after switching.
+    self.assertEqual(environment.Camera(1, 'frontview'), env.set_camera(1))
+    image = env.render()
+    self.assertEqual((256, 256, 3), image.shape)
+    self.assertFalse(np.array_equal(frontview, image))
+
   def test_max_episode_steps(self):
     max_episode_steps = 10
     env = robosuite_env.RobosuiteEnvironment(
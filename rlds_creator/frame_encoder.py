@@ -0,0 +1,131 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Encodes the rendered frames reusing the intermediate buffers."""
+
+import io
+from typing import Tuple
+
+import cv2
+import numpy as np
+import PIL.Image
+
+
+class FrameEncoder(object):
+  """Encodes the rendered RGB images of an environment.
+
+  The intermediate buffers, i.e. the contiguous staging array, the scaled image,
+  the PIL image and the output buffer of the encoder, are allocated once and
+  reused as long as the shape of the images stays the same. Only the encoded
+  bytes are allocated for each frame.
+
+  An encoder should not be used concurrently.
+  """
+
+  def __init__(self):
+    # Contiguous copy of the image, used if the rendered image is not
+    # C-contiguous, e.g. in Procgen.
+    self._staging = None
+    self._scaled = None
+    self._pil_image = None
+    # Output buffer of the encoder. It grows to the largest encoded image and is
+    # never truncated.
+    self._buffer = io.BytesIO()
+    # Number of times the intermediate buffers are (re)allocated.
+    self.num_allocations = 0
+
+  def get_contiguous(self, image: np.ndarray) -> np.ndarray:
+    """Returns the image or its contiguous copy in the staging array.
+
+    The staging array is reused by the next call.
+
+    Args:
+      image: A numpy array.
+    """
+    if image.flags['C_CONTIGUOUS']:
+      return image
+    if (self._staging is None or self._staging.shape != image.shape or
+        self._staging.dtype != image.dtype):
+      self._staging = np.empty(image.shape, dtype=image.dtype)
+      self.num_allocations += 1
+    np.copyto(self._staging, image)
+    return self._staging
+
+  def resize(self, image: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Returns the image scaled down to the specified size.
+
+    Area interpolation is used, which avoids the aliasing of the other filters
+    when downscaling. The returned array is reused by the next call.
+
+    Args:
+      image: A contiguous image.
+      size: Width and height of the scaled image.
+    """
+    width, height = size
+    shape = (height, width) + image.shape[2:]
+    if (self._scaled is None or self._scaled.shape != shape or
+        self._scaled.dtype != image.dtype):
+      self._scaled = np.empty(shape, dtype=image.dtype)
+      self.num_allocations += 1
+    cv2.resize(image, size, dst=self._scaled, interpolation=cv2.INTER_AREA)
+    return self._scaled
+
+  def get_pil_image(self, image: np.ndarray) -> PIL.Image.Image:
+    """Returns the PIL image with the contents of the numpy image.
+
+    The PIL image is reused by the next call.
+
+    Args:
+      image: An RGB or grayscale image with uint8 values.
+    """
+    image = self.get_contiguous(image)
+    size = image.shape[1::-1]
+    mode = 'RGB' if image.ndim == 3 else 'L'
+    if (self._pil_image is None or self._pil_image.size != size or
+        self._pil_image.mode != mode):
+      self._pil_image = PIL.Image.new(mode, size)
+      self.num_allocations += 1
+    # Decodes directly from the memory of the array.
+    self._pil_image.frombytes(image)
+    return self._pil_image
+
+  def encode(self, image: np.ndarray, **kwargs) -> bytes:
+    """Encodes the image.
+
+    Args:
+      image: An RGB or grayscale image with uint8 values.
+      **kwargs: Arguments of PIL.Image.save(), e.g. format and quality.
+
+    Returns:
+      Encoded image.
+    """
+    return self.save(self.get_pil_image(image), **kwargs)
+
+  def save(self, pil_image: PIL.Image.Image, **kwargs) -> bytes:
+    """Encodes the PIL image using the output buffer.
+
+    Args:
+      pil_image: A PIL image, e.g. a palette image derived from the one returned
+        by get_pil_image().
+      **kwargs: Arguments of PIL.Image.save(), e.g. format and quality.
+
+    Returns:
+      Encoded image.
+    """
+    self._buffer.seek(0)
+    pil_image.save(self._buffer, **kwargs)
+    size = self._buffer.tell()
+    with self._buffer.getbuffer() as view:
+      return view[:size].tobytes()
@@ -0,0 +1,93 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.frame_encoder."""
+
+import io
+import tracemalloc
+
+from absl.testing import absltest
+from absl.testing import parameterized
+import numpy as np
+import PIL.Image
+from rlds_creator import frame_encoder
+
+
+def _random_image(height: int, width: int) -> np.ndarray:
+  return np.random.RandomState(0).randint(
+      0, 255, size=(height, width, 3), dtype=np.uint8)
+
+
+def _encode(image: np.ndarray, **kwargs) -> bytes:
+  buffer = io.BytesIO()
+  PIL.Image.fromarray(np.ascontiguousarray(image)).save(buffer, **kwargs)
+  return buffer.getvalue()
+
+
+class FrameEncoderTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(('contiguous', False),
+                                  ('non_contiguous', True))
+  def test_encode(self, flip):
+    encoder = frame_encoder.FrameEncoder()
+    for height, width in [(32, 48), (32, 48), (16, 16)]:
+      image = _random_image(height, width)
+      if flip:
+        image = image[:, ::-1]
+      self.assertEqual(
+          _encode(image, format='JPEG', quality=50),
+          encoder.encode(image, format='JPEG', quality=50))
+    # Smaller images should not include the remaining bytes of the larger ones
+    # in the output buffer.
+    self.assertEqual(
+        _encode(image, format='PNG'), encoder.encode(image, format='PNG'))
+
+  def test_resize(self):
+    encoder = frame_encoder.FrameEncoder()
+    image = _random_image(32, 48)
+    scaled = encoder.resize(image, (24, 16))
+    self.assertEqual((16, 24, 3), scaled.shape)
+    # Each pixel is the average of a 2x2 block.
+    np.testing.assert_allclose(
+        image.reshape(16, 2, 24, 2, 3).mean(axis=(1, 3)), scaled, atol=1)
+    # Buffer is reused.
+    self.assertIs(scaled, encoder.resize(_random_image(32, 48), (24, 16)))
+
+  def test_allocations(self):
+    encoder = frame_encoder.FrameEncoder()
+    # A non-contiguous image, e.g. as in Procgen.
+    image = _random_image(256, 256)[:, ::-1]
+    encoder.encode(image, format='JPEG', quality=50)
+    # Staging array and PIL image.
+    self.assertEqual(2, encoder.num_allocations)
+
+    tracemalloc.start()
+    try:
+      baseline, _ = tracemalloc.get_traced_memory()
+      tracemalloc.reset_peak()
+      for _ in range(50):
+        encoder.encode(image, format='JPEG', quality=50)
+      current, peak = tracemalloc.get_traced_memory()
+    finally:
+      tracemalloc.stop()
+    # Buffers should be reused. Only the encoded bytes, which are much smaller
+    # than the image, are allocated for each frame.
+    self.assertEqual(2, encoder.num_allocations)
+    self.assertLess(peak - baseline, image.nbytes)
+    self.assertLess(current - baseline, image.nbytes)
+
+
+if __name__ == '__main__':
+  absltest.main()
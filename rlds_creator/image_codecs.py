@@ -0,0 +1,222 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Image codecs of the live stream, selected based on the content."""
+
+import dataclasses
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import PIL.Image
+from rlds_creator import constants
+from rlds_creator import frame_encoder
+from rlds_creator import text_stream
+
+JPEG = 'jpeg'
+PNG = 'png'
+WEBP = 'webp'
+# Text screens, see text_stream.
+TEXT = 'text'
+
+# Maximum number of colors of an image to be encoded as a palette PNG.
+MAX_PALETTE_COLORS = 256
+
+# Encodes an image with the specified quality (0-100). Returns None if the codec
+# can't encode the image, e.g. it has too many colors for a palette.
+EncodeFn = Callable[[frame_encoder.FrameEncoder, np.ndarray, int],
+                    Optional[bytes]]
+
+
+@dataclasses.dataclass(frozen=True)
+class Codec:
+  """An image codec."""
+  name: str
+  mime_type: str
+  encode: EncodeFn
+  # Returns true if the encoded data is in the format of the codec.
+  matches: Callable[[bytes], bool]
+
+
+_CODECS: Dict[str, Codec] = {}
+
+# Codecs of the environments with known content. The codecs of the other
+# environments are selected by probing their images.
+_ENV_TYPE_CODECS = {
+    # Text with a few colors. Lossless WebP is much faster to encode than PNG at
+    # a similar size for the large text frames.
+    constants.EnvType.NET_HACK: WEBP,
+    # Pixel-art with a small palette.
+    constants.EnvType.ATARI: PNG,
+}
+
+
+def register_codec(codec: Codec):
+  """Registers a codec, replacing the existing one with the same name."""
+  _CODECS[codec.name] = codec
+
+
+def get_codec(name: str) -> Codec:
+  """Returns the codec with the specified name.
+
+  Args:
+    name: Name of the codec.
+
+  Raises:
+    ValueError: If the codec is not registered.
+  """
+  codec = _CODECS.get(name)
+  if codec is None:
+    raise ValueError(f'Unknown image codec {name}.')
+  return codec
+
+
+def get_mime_type(data: bytes) -> Optional[str]:
+  """Returns the MIME type of the encoded image or None if it is unknown."""
+  for codec in _CODECS.values():
+    if codec.matches(data):
+      return codec.mime_type
+  return None
+
+
+def _encode_jpeg(encoder: frame_encoder.FrameEncoder, image: np.ndarray,
+                 quality: int) -> bytes:
+  return encoder.encode(image, format='JPEG', quality=quality)
+
+
+def _encode_png(encoder: frame_encoder.FrameEncoder, image: np.ndarray,
+                unused_quality: int) -> Optional[bytes]:
+  """Encodes the image as a palette PNG if it has few colors."""
+  pil_image = encoder.get_pil_image(image)
+  if pil_image.mode == 'RGB':
+    if pil_image.getcolors(MAX_PALETTE_COLORS) is None:
+      return None
+    # Median cut keeps the colors of the image exactly if there are at most
+    # 256 of them.
+    pil_image = pil_image.quantize(
+        colors=MAX_PALETTE_COLORS,
+        method=PIL.Image.Quantize.MEDIANCUT,
+        dither=PIL.Image.Dither.NONE)
+  # Favor speed over size; the size difference is small for simple images.
+  return encoder.save(pil_image, format='PNG', compress_level=1)
+
+
+def _encode_webp(encoder: frame_encoder.FrameEncoder, image: np.ndarray,
+                 unused_quality: int) -> bytes:
+  # Lossless with the fastest method.
+  return encoder.encode(image, format='WEBP', lossless=True, method=0)
+
+
+register_codec(
+    Codec(
+        name=JPEG,
+        mime_type='image/jpeg',
+        encode=_encode_jpeg,
+        matches=lambda data: data[:3] == b'\xff\xd8\xff'))
+register_codec(
+    Codec(
+        name=PNG,
+        mime_type='image/png',
+        encode=_encode_png,
+        matches=lambda data: data[:8] == b'\x89PNG\r\n\x1a\n'))
+register_codec(
+    Codec(
+        name=WEBP,
+        mime_type='image/webp',
+        encode=_encode_webp,
+        matches=lambda data: data[:4] == b'RIFF' and data[8:12] == b'WEBP'))
+register_codec(
+    Codec(
+        name=TEXT,
+        mime_type=text_stream.MIME_TYPE,
+        encode=lambda unused_encoder, screen, unused_quality: (
+            text_stream.encode_keyframe(screen)),
+        matches=text_stream.is_text_payload))
+
+
+def select_codec(env_type: Optional[constants.EnvType],
+                 encoder: frame_encoder.FrameEncoder,
+                 image: np.ndarray) -> str:
+  """Returns the name of the codec for the images of an environment.
+
+  Args:
+    env_type: Type of the environment, if known.
+    encoder: Frame encoder.
+    image: A representative image of the environment, e.g. the first image of
+      an episode. It is used to select the codec if the environment type doesn't
+      have one.
+  """
+  if env_type in _ENV_TYPE_CODECS:
+    return _ENV_TYPE_CODECS[env_type]
+  # Images with a small palette, e.g. from the pixel-art games, are encoded
+  # losslessly. Photorealistic ones have many more colors.
+  pil_image = encoder.get_pil_image(image)
+  if pil_image.getcolors(MAX_PALETTE_COLORS) is not None:
+    return PNG
+  return JPEG
+
+
+@dataclasses.dataclass
+class CodecStats:
+  """Statistics of the images encoded by a codec."""
+  num_images: int = 0
+  encode_secs: float = 0.0
+  num_bytes: int = 0
+
+
+class CodecEncoder(object):
+  """Encodes the images with the registered codecs and keeps their stats.
+
+  If the selected codec can't encode an image, then it is encoded in JPEG
+  format.
+  """
+
+  def __init__(self, encoder: Optional[frame_encoder.FrameEncoder] = None):
+    self._encoder = encoder or frame_encoder.FrameEncoder()
+    self._stats: Dict[str, CodecStats] = {}
+
+  def encode(self, codec_name: str, image: np.ndarray,
+             quality: int) -> Tuple[str, bytes]:
+    """Encodes the image.
+
+    Args:
+      codec_name: Name of the codec to use.
+      image: An RGB or grayscale image with uint8 values.
+      quality: Quality of the lossy codecs (0-100).
+
+    Returns:
+      A tuple of the name of the codec that is used and the encoded image.
+    """
+    start = time.perf_counter()
+    codec = get_codec(codec_name)
+    data = codec.encode(self._encoder, image, quality)
+    if data is None:
+      codec = get_codec(JPEG)
+      data = codec.encode(self._encoder, image, quality)
+    stats = self._stats.setdefault(codec.name, CodecStats())
+    stats.num_images += 1
+    stats.encode_secs += time.perf_counter() - start
+    stats.num_bytes += len(data)
+    return codec.name, data
+
+  def stats(self) -> Dict[str, Dict[str, float]]:
+    """Returns the number of images, average encode time and size per codec."""
+    return {
+        name: {
+            'num_images': stats.num_images,
+            'avg_encode_ms': 1000 * stats.encode_secs / stats.num_images,
+            'avg_bytes': stats.num_bytes / stats.num_images,
+        } for name, stats in self._stats.items()
+    }
@@ -0,0 +1,103 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.image_codecs."""
+
+import io
+
+from absl.testing import absltest
+from absl.testing import parameterized
+import numpy as np
+import PIL.Image
+from rlds_creator import constants
+from rlds_creator import frame_encoder
+from rlds_creator import image_codecs
+
+
+def _palette_image(num_colors: int) -> np.ndarray:
+  random_state = np.random.RandomState(0)
+  palette = random_state.randint(0, 255, size=(num_colors, 3), dtype=np.uint8)
+  return palette[random_state.randint(0, num_colors, size=(48, 64))]
+
+
+def _decode(data: bytes) -> np.ndarray:
+  return np.asarray(PIL.Image.open(io.BytesIO(data)).convert('RGB'))
+
+
+class ImageCodecsTest(parameterized.TestCase):
+
+  @parameterized.parameters(image_codecs.PNG, image_codecs.WEBP)
+  def test_lossless(self, codec_name):
+    image = _palette_image(200)
+    encoder = image_codecs.CodecEncoder()
+    name, data = encoder.encode(codec_name, image, quality=50)
+    self.assertEqual(codec_name, name)
+    np.testing.assert_array_equal(image, _decode(data))
+    self.assertEqual(
+        image_codecs.get_codec(codec_name).mime_type,
+        image_codecs.get_mime_type(data))
+
+  def test_png_fallback(self):
+    # Too many colors for a palette.
+    image = _palette_image(4096)
+    encoder = image_codecs.CodecEncoder()
+    name, data = encoder.encode(image_codecs.PNG, image, quality=50)
+    self.assertEqual(image_codecs.JPEG, name)
+    self.assertEqual('image/jpeg', image_codecs.get_mime_type(data))
+
+  def test_select_codec(self):
+    encoder = frame_encoder.FrameEncoder()
+    small_palette = _palette_image(16)
+    large_palette = _palette_image(4096)
+    self.assertEqual(
+        image_codecs.WEBP,
+        image_codecs.select_codec(constants.EnvType.NET_HACK, encoder,
+                                  large_palette))
+    self.assertEqual(
+        image_codecs.PNG,
+        image_codecs.select_codec(constants.EnvType.ROBOSUITE, encoder,
+                                  small_palette))
+    self.assertEqual(
+        image_codecs.JPEG,
+        image_codecs.select_codec(None, encoder, large_palette))
+
+  def test_text(self):
+    screen = np.zeros((2, 3, 2), dtype=np.uint8)
+    screen[..., 0] = ord('@')
+    encoder = image_codecs.CodecEncoder()
+    name, data = encoder.encode(image_codecs.TEXT, screen, quality=50)
+    self.assertEqual(image_codecs.TEXT, name)
+    self.assertEqual('application/x-rlds-text',
+                     image_codecs.get_mime_type(data))
+
+  def test_stats(self):
+    encoder = image_codecs.CodecEncoder()
+    image = _palette_image(16)
+    for _ in range(2):
+      encoder.encode(image_codecs.PNG, image, quality=50)
+    encoder.encode(image_codecs.JPEG, image, quality=50)
+    stats = encoder.stats()
+    self.assertCountEqual([image_codecs.PNG, image_codecs.JPEG], stats.keys())
+    self.assertEqual(2, stats[image_codecs.PNG]['num_images'])
+    self.assertGreater(stats[image_codecs.PNG]['avg_bytes'], 0)
+
+  def test_unknown_codec(self):
+    with self.assertRaisesRegex(ValueError, 'Unknown image codec'):
+      image_codecs.get_codec('gif')
+    self.assertIsNone(image_codecs.get_mime_type(b'GIF89a'))
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,186 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Executor for the long running jobs, e.g. downloading the episodes."""
+
+from concurrent import futures
+import threading
+from typing import Any, Callable, Optional
+import uuid
+
+# Default maximum number of jobs that are executed in parallel.
+DEFAULT_MAX_WORKERS = 2
+# Default maximum number of running and pending jobs.
+DEFAULT_MAX_JOBS = 16
+
+
+class JobCancelledError(Exception):
+  """Raised by a job when it is cancelled."""
+
+
+class Job(object):
+  """A job that is executed in the background.
+
+  The function of the job receives the job as its argument. Cancellation is
+  cooperative; a long running function should call check_cancelled()
+  periodically.
+  """
+
+  def __init__(self, fn: Callable[['Job'], Any], name: str = 'job'):
+    """Creates a Job.
+
+    Args:
+      fn: Function to execute.
+      name: Name of the job, e.g. the operation.
+    """
+    self.id = uuid.uuid4().hex
+    self.name = name
+    self.progress = 0.0
+    self._fn = fn
+    self._cancelled = threading.Event()
+    self._future = None
+
+  def cancel(self):
+    """Requests the job to be cancelled.
+
+    A job that is still pending is removed from the queue and never executed.
+    """
+    self._cancelled.set()
+    if self._future is not None:
+      self._future.cancel()
+
+  def cancelled(self) -> bool:
+    """Returns true if the job is requested to be cancelled."""
+    return self._cancelled.is_set()
+
+  def check_cancelled(self):
+    """Raises JobCancelledError if the job is requested to be cancelled."""
+    if self.cancelled():
+      raise JobCancelledError(f'Job {self.id} is cancelled.')
+
+  def set_progress(self, progress: float):
+    """Sets the percentage of progress (0-100)."""
+    self.progress = progress
+
+  def done(self) -> bool:
+    """Returns true if the job is finished."""
+    return self._future is not None and self._future.done()
+
+  def cancelled_before_start(self) -> bool:
+    """Returns true if the job is cancelled before it is started."""
+    return self._future is not None and self._future.cancelled()
+
+  def add_done_callback(self, fn: Callable[['Job'], None]):
+    """Calls fn with the job when it finishes or is cancelled before starting.
+
+    Args:
+      fn: Function to call, possibly in the thread that executed the job.
+
+    Raises:
+      ValueError: If the job is not submitted.
+    """
+    if self._future is None:
+      raise ValueError('Job is not submitted.')
+    self._future.add_done_callback(lambda unused_future: fn(self))
+
+  def result(self, timeout: Optional[float] = None) -> Any:
+    """Waits for the job to finish and returns its result.
+
+    Args:
+      timeout: Maximum number of seconds to wait.
+
+    Returns:
+      Return value of the function.
+
+    Raises:
+      ValueError: If the job is not submitted.
+      Exception: Raised by the function.
+    """
+    if self._future is None:
+      raise ValueError('Job is not submitted.')
+    return self._future.result(timeout)
+
+  def _run(self) -> Any:
+    return self._fn(self)
+
+
+class JobExecutor(object):
+  """Executes the jobs in a bounded pool of worker threads."""
+
+  def __init__(self,
+               max_workers: int = DEFAULT_MAX_WORKERS,
+               max_jobs: int = DEFAULT_MAX_JOBS,
+               name: str = 'jobs'):
+    """Creates a JobExecutor.
+
+    Args:
+      max_workers: Maximum number of jobs that are executed in parallel.
+      max_jobs: Maximum number of running and pending jobs.
+      name: Name of the executor, used for the worker threads.
+    """
+    self._executor = futures.ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix=name)
+    self._max_jobs = max_jobs
+    self._lock = threading.Lock()
+    self._num_jobs = 0
+
+  def submit(self, job: Job) -> Job:
+    """Submits a job for execution.
+
+    Args:
+      job: Job to execute.
+
+    Returns:
+      The job.
+
+    Raises:
+      ValueError: If there are too many jobs.
+    """
+    with self._lock:
+      if self._num_jobs >= self._max_jobs:
+        raise ValueError('There are too many jobs, please try again later.')
+      self._num_jobs += 1
+
+    def on_done(unused_future):
+      with self._lock:
+        self._num_jobs -= 1
+
+    # The count is released by a done callback, instead of by the worker, so
+    # that jobs cancelled while pending are accounted for as well.
+    future = self._executor.submit(job._run)  # pylint: disable=protected-access
+    future.add_done_callback(on_done)
+    job._future = future  # pylint: disable=protected-access
+    return job
+
+  @property
+  def num_jobs(self) -> int:
+    """Number of running and pending jobs."""
+    return self._num_jobs
+
+  def shutdown(self, wait: bool = True):
+    self._executor.shutdown(wait=wait)
+
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+
+def get_default() -> JobExecutor:
+  """Returns the process-wide job executor."""
+  global _default_executor
+  with _default_executor_lock:
+    if _default_executor is None:
+      _default_executor = JobExecutor()
+    return _default_executor
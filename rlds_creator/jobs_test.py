@@ -0,0 +1,104 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.jobs."""
+
+import threading
+
+from absl.testing import absltest
+from rlds_creator import jobs
+
+
+class JobsTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.executor = jobs.JobExecutor(max_workers=1, max_jobs=2)
+
+  def tearDown(self):
+    self.executor.shutdown()
+    super().tearDown()
+
+  def test_submit(self):
+
+    def run(job):
+      job.set_progress(50)
+      return 'result'
+
+    job = self.executor.submit(jobs.Job(run))
+    self.assertEqual('result', job.result(5))
+    self.assertTrue(job.done())
+    self.assertEqual(50, job.progress)
+    self.assertEqual(0, self.executor.num_jobs)
+
+  def test_failure(self):
+
+    def run(unused_job):
+      raise ValueError('Failure.')
+
+    job = self.executor.submit(jobs.Job(run))
+    with self.assertRaisesRegex(ValueError, 'Failure.'):
+      job.result(5)
+
+  def test_cancel(self):
+    started = threading.Event()
+
+    def run(job):
+      started.set()
+      while True:
+        job.check_cancelled()
+
+    job = self.executor.submit(jobs.Job(run))
+    self.assertTrue(started.wait(5))
+    job.cancel()
+    self.assertTrue(job.cancelled())
+    with self.assertRaises(jobs.JobCancelledError):
+      job.result(5)
+
+  def test_cancel_pending(self):
+    event = threading.Event()
+    ran = threading.Event()
+    job1 = self.executor.submit(jobs.Job(lambda job: event.wait()))
+    job2 = self.executor.submit(jobs.Job(lambda job: ran.set()))
+    done = []
+    job2.add_done_callback(done.append)
+    job2.cancel()
+    self.assertTrue(job2.cancelled_before_start())
+    self.assertEqual([job2], done)
+    event.set()
+    job1.result(5)
+    self.assertFalse(ran.is_set())
+    self.assertEqual(0, self.executor.num_jobs)
+
+  def test_max_jobs(self):
+    event = threading.Event()
+    job1 = self.executor.submit(jobs.Job(lambda job: event.wait()))
+    job2 = self.executor.submit(jobs.Job(lambda job: event.wait()))
+    with self.assertRaisesRegex(ValueError, 'too many jobs'):
+      self.executor.submit(jobs.Job(lambda job: None))
+    event.set()
+    job1.result(5)
+    job2.result(5)
+
+  def test_result_before_submit(self):
+    with self.assertRaisesRegex(ValueError, 'not submitted'):
+      jobs.Job(lambda job: None).result()
+
+  def test_get_default(self):
+    self.assertIs(jobs.get_default(), jobs.get_default())
+
+
+if __name__ == '__main__':
+  absltest.main()
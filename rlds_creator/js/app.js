@@ -22,6 +22,7 @@ const AddEpisodeTagRequest = goog.require('proto.rlds_creator.client.AddEpisodeT
 const AddEpisodeTagResponse = goog.require('proto.rlds_creator.client.AddEpisodeTagResponse');
 const AddStepTagRequest = goog.require('proto.rlds_creator.client.AddStepTagRequest');
 const AddStepTagResponse = goog.require('proto.rlds_creator.client.AddStepTagResponse');
+const CancelJobRequest = goog.require('proto.rlds_creator.client.CancelJobRequest');
 const ConfirmSaveResponse = goog.require('proto.rlds_creator.client.ConfirmSaveResponse');
 const Data = goog.require('proto.rlds_creator.client.Data');
 const DeleteEpisodeRequest = goog.require('proto.rlds_creator.client.DeleteEpisodeRequest');
@@ -60,6 +61,7 @@ const SelectStudyRequest = goog.require('proto.rlds_creator.client.SelectStudyRe
 const SelectStudyResponse = goog.require('proto.rlds_creator.client.SelectStudyResponse');
 const SetCameraRequest = goog.require('proto.rlds_creator.client.SetCameraRequest');
 const SetCameraResponse = goog.require('proto.rlds_creator.client.SetCameraResponse');
+const SetCanvasSizeRequest = goog.require('proto.rlds_creator.client.SetCanvasSizeRequest');
 const SetFpsRequest = goog.require('proto.rlds_creator.client.SetFpsRequest');
 const SetQualityRequest = goog.require('proto.rlds_creator.client.SetQualityRequest');
 const SetStudiesRequest = goog.require('proto.rlds_creator.client.SetStudiesRequest');
@@ -77,6 +79,7 @@ const events = goog.require('goog.events');
 const style = goog.require('goog.style');
 const {ConfirmDialog} = goog.require('rlds_creator.confirmDialog');
 const {StudyEditor} = goog.require('rlds_creator.studyEditor');
+const {TEXT_MIME_TYPE, TextScreen} = goog.require('rlds_creator.textScreen');
 const {checkCheckbox, createIcon, createNonNumericCell, createNumericCell, createSelect, createSwitch, getElement, hideElement, isChecked, setTextContent, setTextField, showElement} = goog.require('rlds_creator.utils');
 
 const Quality = SetQualityRequest.Quality;
@@ -143,24 +146,41 @@ function switchToTab(id) {
  *
  * @param {?HTMLCanvasElement} canvas A canvas.
  * @param {!Uint8Array} encoded_image An encoded image.
+ * @param {string=} mimeType MIME type of the image, if known.
  */
-function displayImage(canvas, encoded_image) {
+function displayImage(canvas, encoded_image, mimeType) {
   if (!canvas) {
     return;
   }
+  if (mimeType == TEXT_MIME_TYPE) {
+    const screen = new TextScreen();
+    screen.update(encoded_image);
+    const frame = dom.createDom(dom.TagName.CANVAS);
+    screen.draw(frame);
+    drawScaledImage(canvas, frame);
+    return;
+  }
+  const blob = new Blob([encoded_image], {type: mimeType || ''});
+  createImageBitmap(blob).then(img => drawScaledImage(canvas, img));
+}
+
+/**
+ * Draws the image scaled to fit the (square) canvas.
+ *
+ * @param {!HTMLCanvasElement} canvas A canvas.
+ * @param {!ImageBitmap|!HTMLCanvasElement} img Image to draw.
+ */
+function drawScaledImage(canvas, img) {
   const ctx = dom.getCanvasContext2D(canvas);
-  createImageBitmap(new Blob([encoded_image])).then(function(img) {
-    // Scale the image to fit the (square) canvas.
-    const s = img.width / img.height;
-    let w = canvas.width;
-    let h = canvas.height;
-    if (img.width > img.height) {
-      h = Math.round(w / s);
-    } else {
-      w = Math.round(h * s);
-    }
-    ctx.drawImage(img, 0, 0, w, h);
-  });
+  const s = img.width / img.height;
+  let w = canvas.width;
+  let h = canvas.height;
+  if (img.width > img.height) {
+    h = Math.round(w / s);
+  } else {
+    w = Math.round(h * s);
+  }
+  ctx.drawImage(img, 0, 0, w, h);
 }
 
 /**
@@ -663,7 +683,8 @@ class App {
     setTextContent('replay-keys', response.getKeysList().join(', '));
     const reward = response.hasReward() ? response.getReward() : '(none)';
     setTextContent('replay-reward', reward);
-    displayImage(this.replayCanvas_, response.getImage_asU8());
+    displayImage(
+        this.replayCanvas_, response.getImage_asU8(), response.getMimeType());
     this.displayData_(
         response.getObservation(), dom.getElement('replay-observation'));
     this.displayData_(response.getAction(), dom.getElement('replay-action'));
@@ -960,9 +981,10 @@ class App {
     this.downloadProgress_.MaterialProgress.setBuffer(87);
     showElement(this.downloadProgress_);
     hideElement('download-link-container');
-    // TODO(sertan): Add support for cancalling the operation. Currently, we
-    // hide the buttons.
+    // The operation can be cancelled until the dataset is ready.
+    this.downloadJobId_ = '';
     hideElement('download-actions');
+    showElement('download-cancel-actions');
     this.downloadDialog_.showModal();
     this.sendRequest(new OperationRequest().setDownloadEpisodes(request));
   }
@@ -976,6 +998,14 @@ class App {
    * @private
    */
   setDownloadProgress_(response) {
+    if (response.getJobId()) {
+      this.downloadJobId_ = response.getJobId();
+    }
+    if (response.getCancelled()) {
+      this.downloadDialog_.close();
+      this.showMessage_('Download is cancelled.');
+      return;
+    }
     const url = response.getUrl();
     if (!url) {
       // The dataset is not ready yet, only update the progress.
@@ -988,9 +1018,21 @@ class App {
     dom.appendChild(dom.getElement('download-link'), anchor);
     hideElement(this.downloadProgress_);
     showElement('download-link-container');
+    hideElement('download-cancel-actions');
     showElement('download-actions');
   }
 
+  /**
+   * Handles the event to cancel downloading the episodes.
+   * @private
+   */
+  handleCancelDownload_() {
+    if (this.downloadJobId_) {
+      this.sendRequest(new OperationRequest().setCancelJob(
+          new CancelJobRequest().setJobId(this.downloadJobId_)));
+    }
+  }
+
   /**
    * Adds the list of studies to the select box.
    *
@@ -1129,10 +1171,29 @@ class App {
       dom.getCanvasContext2D(this.canvas_)
           .clearRect(0, 0, this.canvas_.width, this.canvas_.height);
     }
+    // The images of the environment will be scaled to the canvas.
+    this.sendCanvasSize_();
     this.sendRequest(new OperationRequest().setSelectEnvironment(
         new SelectEnvironmentRequest().setEnvId(id)));
   }
 
+  /**
+   * Sends the size of the canvas, so that the server doesn't send images that
+   * are larger than what can be displayed.
+   *
+   * @private
+   */
+  sendCanvasSize_() {
+    if (!this.canvas_ || !this.isConnected()) {
+      return;
+    }
+    this.sendRequest(new OperationRequest().setSetCanvasSize(
+        new SetCanvasSizeRequest()
+            .setWidth(this.canvas_.clientWidth)
+            .setHeight(this.canvas_.clientHeight)
+            .setDevicePixelRatio(window.devicePixelRatio || 1)));
+  }
+
   /**
    * Populates the list of studies.
    *
@@ -1261,7 +1322,70 @@ class App {
     setTextContent('episode-index', response.getEpisodeIndex());
     setTextContent('episode-step', response.getEpisodeSteps());
     setTextContent('reward', response.getReward());
-    displayImage(this.canvas_, response.getImage_asU8());
+    // Unchanged images are not sent again and only the changed tiles of the
+    // images may be sent.
+    const tiles = response.getTilesList();
+    if (response.getMimeType() == TEXT_MIME_TYPE) {
+      if (!response.getSameImage()) {
+        this.updateTextFrame_(response.getImage_asU8());
+      }
+    } else if (tiles.length) {
+      this.updateFrame_(
+          tiles.map(tile => [tile.getX(), tile.getY(), tile.getImage_asU8()]),
+          response.getMimeType(), false);
+    } else if (!response.getSameImage()) {
+      this.updateFrame_(
+          [[0, 0, response.getImage_asU8()]], response.getMimeType(), true);
+    }
+  }
+
+  /**
+   * Draws the images over the current frame and displays it in the canvas.
+   *
+   * The images are decoded in parallel, but the updates are applied in order.
+   *
+   * @param {!Array<!Array<number|!Uint8Array>>} images The x, y coordinates and
+   *     the encoded image of each update.
+   * @param {string} mimeType MIME type of the images.
+   * @param {boolean} keyframe Whether the image replaces the whole frame.
+   * @private
+   */
+  updateFrame_(images, mimeType, keyframe) {
+    const bitmaps = Promise.all(images.map(
+        ([x, y, image]) =>
+            createImageBitmap(new Blob([image], {type: mimeType}))));
+    this.frameUpdate_ = this.frameUpdate_.then(() => bitmaps).then(decoded => {
+      const frame = this.frame_;
+      if (keyframe) {
+        // Also clears the frame.
+        frame.width = decoded[0].width;
+        frame.height = decoded[0].height;
+      }
+      const ctx = dom.getCanvasContext2D(frame);
+      decoded.forEach(
+          (img, i) => ctx.drawImage(img, images[i][0], images[i][1]));
+      drawScaledImage(this.canvas_, frame);
+    }).catch(e => {
+      // A failed update should not block the next ones.
+    });
+  }
+
+  /**
+   * Applies the text screen payload and displays the screen in the canvas.
+   *
+   * @param {!Uint8Array} data Keyframe or delta of the text screen.
+   * @private
+   */
+  updateTextFrame_(data) {
+    // Applied in order with the image updates.
+    this.frameUpdate_ = this.frameUpdate_.then(() => {
+      // A delta that doesn't match the screen is ignored until the next
+      // keyframe.
+      if (this.textScreen_.update(data)) {
+        this.textScreen_.draw(this.frame_);
+        drawScaledImage(this.canvas_, this.frame_);
+      }
+    });
   }
 
   /**
@@ -1590,6 +1714,15 @@ class App {
     const canvas = /** @type {!HTMLCanvasElement} */ (dom.getElement('canvas'));
     /** @private @const @type {!HTMLCanvasElement} */
     this.canvas_ = canvas;
+    // Current frame of the environment at its original size. The updates of the
+    // frame are drawn on it and it is scaled to the canvas.
+    /** @private @const @type {!HTMLCanvasElement} */
+    this.frame_ = dom.createDom(dom.TagName.CANVAS);
+    /** @private @type {!Promise} */
+    this.frameUpdate_ = Promise.resolve();
+    // Current text screen of the text based environments.
+    /** @private @const @type {!TextScreen} */
+    this.textScreen_ = new TextScreen();
     canvas.addEventListener('keydown', e => this.handleKeyDown_(e));
     canvas.addEventListener('keyup', e => this.handleKeyUp_(e));
 
@@ -1678,6 +1811,14 @@ class App {
     this.downloadProgress_ =
         /** @type {!MDLProgressElement} */ (
             dom.getElement('download-progress'));
+    /**
+     * ID of the background job that merges the episodes to download.
+     * @private @type {string}
+     */
+    this.downloadJobId_ = '';
+    events.listen(
+        dom.getElement('download-cancel'), events.EventType.CLICK,
+        e => this.handleCancelDownload_());
 
     // Frames/sec slider.
     const fps = dom.getElement('fps-slider');
@@ -1762,6 +1903,13 @@ class App {
     window.addEventListener('gamepadconnected', e => this.connectGamepad_(e));
     window.addEventListener(
         'gamepaddisconnected', e => this.disconnectGamepad_(e));
+
+    // Size of the canvas may change with the window, e.g. with the zoom level.
+    events.listen(window, events.EventType.RESIZE, e => {
+      if (this.currentEnv_) {
+        this.sendCanvasSize_();
+      }
+    });
   }
 
   /**
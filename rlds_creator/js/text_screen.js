@@ -0,0 +1,140 @@
+// Copyright 2021 RLDSCreator Authors.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+/**
+ * @fileoverview Text screens of the terminal based environments, e.g. NetHack.
+ * See text_stream.py for the format of the payloads.
+ */
+goog.module('rlds_creator.textScreen');
+
+const dom = goog.require('goog.dom');
+
+/** MIME type of the text screen payloads. */
+const TEXT_MIME_TYPE = 'application/x-rlds-text';
+
+/** Size of the payload header. */
+const HEADER_SIZE = 9;
+/** Size of the header of a run of cells. */
+const RUN_SIZE = 6;
+/** Kinds of the payloads. */
+const KEYFRAME = 0;
+const DELTA = 1;
+
+/** Font of the characters and the size of the cells in pixels. */
+const FONT = '14px monospace';
+const CELL_WIDTH = 8;
+const CELL_HEIGHT = 16;
+/** Character code of the space. */
+const SPACE = 32;
+
+/**
+ * Terminal colors, i.e. the 8 normal colors followed by the bright ones. Black
+ * is drawn in dark gray to be visible on the background.
+ */
+const COLORS = [
+  '#555555', '#aa0000', '#00aa00', '#aa5500', '#0000aa', '#aa00aa', '#00aaaa',
+  '#aaaaaa', '#555555', '#ff5555', '#55ff55', '#ffff55', '#5555ff', '#ff55ff',
+  '#55ffff', '#ffffff'
+];
+
+/**
+ * Characters and colors of a text screen.
+ */
+class TextScreen {
+  constructor() {
+    /** @private {number} */
+    this.rows_ = 0;
+    /** @private {number} */
+    this.columns_ = 0;
+    /** @private {!Uint8Array} */
+    this.chars_ = new Uint8Array(0);
+    /** @private {!Uint8Array} */
+    this.colors_ = new Uint8Array(0);
+  }
+
+  /**
+   * Applies a keyframe or a delta payload to the screen.
+   *
+   * @param {!Uint8Array} data Payload.
+   * @return {boolean} False if the payload is a delta that doesn't match the
+   *     screen.
+   */
+  update(data) {
+    const view = new DataView(data.buffer, data.byteOffset, data.byteLength);
+    const kind = view.getUint8(4);
+    const rows = view.getUint16(5, true);
+    const columns = view.getUint16(7, true);
+    const size = rows * columns;
+    if (kind == KEYFRAME) {
+      this.rows_ = rows;
+      this.columns_ = columns;
+      this.chars_ = data.slice(HEADER_SIZE, HEADER_SIZE + size);
+      this.colors_ = data.slice(HEADER_SIZE + size, HEADER_SIZE + 2 * size);
+      return true;
+    }
+    if (kind != DELTA || rows != this.rows_ || columns != this.columns_) {
+      return false;
+    }
+    let offset = HEADER_SIZE;
+    while (offset < data.length) {
+      const index = view.getUint16(offset, true) * columns +
+          view.getUint16(offset + 2, true);
+      const length = view.getUint16(offset + 4, true);
+      offset += RUN_SIZE;
+      this.chars_.set(data.subarray(offset, offset + length), index);
+      offset += length;
+      this.colors_.set(data.subarray(offset, offset + length), index);
+      offset += length;
+    }
+    return true;
+  }
+
+  /**
+   * Draws the screen on the canvas, resizing it to fit the screen.
+   *
+   * @param {!HTMLCanvasElement} canvas A canvas.
+   */
+  draw(canvas) {
+    // Also clears the canvas.
+    canvas.width = this.columns_ * CELL_WIDTH;
+    canvas.height = this.rows_ * CELL_HEIGHT;
+    const ctx = dom.getCanvasContext2D(canvas);
+    ctx.fillStyle = '#000000';
+    ctx.fillRect(0, 0, canvas.width, canvas.height);
+    ctx.font = FONT;
+    ctx.textBaseline = 'top';
+    // Each character is drawn in its cell, independent of the metrics of the
+    // font. Blank cells are skipped and the fill style is changed only when
+    // the color changes.
+    let fillColor = -1;
+    for (let row = 0; row < this.rows_; row++) {
+      for (let column = 0; column < this.columns_; column++) {
+        const index = row * this.columns_ + column;
+        const ch = this.chars_[index];
+        if (ch <= SPACE) {
+          continue;
+        }
+        const color = this.colors_[index] & 15;
+        if (color != fillColor) {
+          ctx.fillStyle = COLORS[color];
+          fillColor = color;
+        }
+        ctx.fillText(
+            String.fromCharCode(ch), column * CELL_WIDTH, row * CELL_HEIGHT);
+      }
+    }
+  }
+}
+
+exports = {TEXT_MIME_TYPE, TextScreen};
@@ -21,6 +21,15 @@ const OperationResponse = goog.require('proto.rlds_creator.client.OperationRespo
 const events = goog.require('goog.events');
 const {App} = goog.require('rlds_creator.app');
 
+/** @const {number} Initial delay before reconnecting in milliseconds. */
+const RECONNECT_DELAY_MS = 500;
+
+/** @const {number} Maximum delay between reconnect attempts. */
+const MAX_RECONNECT_DELAY_MS = 8000;
+
+/** @const {number} Maximum number of consecutive reconnect attempts. */
+const MAX_RECONNECT_ATTEMPTS = 10;
+
 class AppImpl extends App {
   sendRequest(request) {
     // We use the binary wire-format.
@@ -35,31 +44,82 @@ class AppImpl extends App {
   constructor() {
     super();
 
-    // Open the socket connection.
+    /**
+     * Token to resume the session if the connection is lost.
+     * @private {string}
+     */
+    this.resumeToken_ = '';
+
+    /** @private {number} Number of consecutive reconnect attempts. */
+    this.reconnectAttempts_ = 0;
+
+    /** @private {boolean} */
+    this.unloading_ = false;
+
+    /** @private {!WebSocket} */
+    this.socket_ = this.connect_();
+
+    events.listen(window, events.EventType.UNLOAD, e => {
+      // Close the socket on unload.
+      this.unloading_ = true;
+      this.socket_.close();
+    });
+  }
+
+  /**
+   * Opens the socket connection, resuming the session if there is a token.
+   *
+   * @return {!WebSocket}
+   * @private
+   */
+  connect_() {
     const protocol = location.protocol == 'https:' ? 'wss://' : 'ws://';
-    const socket =
-        new WebSocket(protocol + location.host + '/channel/environment');
+    let url = protocol + location.host + '/channel/environment';
+    if (this.resumeToken_) {
+      url += '?resume_token=' + encodeURIComponent(this.resumeToken_);
+    }
+    const socket = new WebSocket(url);
     // Change binary type from "blob" to "arraybuffer". Deserialization on the
     // server side requires the latter.
     socket.binaryType = 'arraybuffer';
-    /** @private @const @type {!WebSocket} */
-    this.socket_ = socket;
+
+    socket.addEventListener(events.EventType.OPEN, e => {
+      this.reconnectAttempts_ = 0;
+    });
 
     socket.addEventListener(events.EventType.MESSAGE, e => {
       const response = OperationResponse.deserializeBinary(
           /** @type {!MessageEvent} */ (e).data);
+      if (response.getTypeCase() == OperationResponse.TypeCase.CONFIG) {
+        this.resumeToken_ = response.getConfig().getResumeToken();
+      }
       this.handleResponse(response);
     });
 
-    socket.addEventListener(events.EventType.ERROR, e => {
-      // Channel errors are not recoverable.
-      this.showError('Session error. Please refresh the page.');
+    socket.addEventListener(events.EventType.CLOSE, e => {
+      if (this.unloading_) {
+        return;
+      }
+      const reason = /** @type {!CloseEvent} */ (e).reason;
+      if (!this.resumeToken_ || reason ||
+          this.reconnectAttempts_ >= MAX_RECONNECT_ATTEMPTS) {
+        // The session can't be resumed, e.g. it has expired.
+        this.showError('Session error. Please refresh the page.');
+        return;
+      }
+      // Reconnect with exponential backoff. The environment is paused by the
+      // server until the session is resumed.
+      const delay = Math.min(
+          RECONNECT_DELAY_MS * Math.pow(2, this.reconnectAttempts_),
+          MAX_RECONNECT_DELAY_MS);
+      this.reconnectAttempts_++;
+      this.showError('Connection is lost. Reconnecting...');
+      setTimeout(() => {
+        this.socket_ = this.connect_();
+      }, delay);
     });
 
-    events.listen(window, events.EventType.UNLOAD, e => {
-      // Close the socket on unload.
-      socket.close();
-    });
+    return socket;
   }
 }
 
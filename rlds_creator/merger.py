@@ -26,7 +26,8 @@ from rlds_creator import episode_storage
 from rlds_creator import study_pb2
 
 INTERNAL_STEP_METADATA_KEYS = frozenset([
-    constants.METADATA_IMAGE, constants.METADATA_INFO, constants.METADATA_KEYS
+    constants.METADATA_IMAGE, constants.METADATA_INFO, constants.METADATA_KEYS,
+    constants.METADATA_NUM_ACTIONS
 ])
 
 
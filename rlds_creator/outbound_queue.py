@@ -0,0 +1,119 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Queue of the outbound messages of a connection."""
+
+import collections
+import threading
+from typing import Any, Dict, Optional
+
+
+class _Message(object):
+  """An outbound message."""
+
+  __slots__ = ('data', 'is_frame')
+
+  def __init__(self, data: bytes, is_frame: bool):
+    self.data = data
+    self.is_frame = is_frame
+
+
+class OutboundQueue(object):
+  """Thread-safe queue of serialized messages waiting to be sent.
+
+  Frames, e.g. the steps of an asynchronous environment, are coalesced: there is
+  at most one unsent frame in the queue and it is replaced by the newer one. A
+  slow client will see fewer frames, but always the latest one, instead of an
+  increasing lag. Other (control) messages are never dropped and are sent in the
+  order they are added.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._messages = collections.deque()
+    # Unsent frame in the queue, if any.
+    self._frame = None
+    self._closed = False
+    # Statistics.
+    self._max_depth = 0
+    self._num_sent = 0
+    self._num_dropped_frames = 0
+
+  def put(self, data: bytes, is_frame: bool = False) -> bool:
+    """Adds a message to the queue.
+
+    Args:
+      data: Serialized message.
+      is_frame: Whether the message is a frame. An unsent frame in the queue is
+        dropped.
+
+    Returns:
+      True if the message is added, i.e. the queue is not closed.
+    """
+    message = _Message(data, is_frame)
+    with self._lock:
+      if self._closed:
+        return False
+      if is_frame:
+        if self._frame:
+          # The new frame is added to the end to preserve the order with respect
+          # to the control messages that are added after the dropped frame.
+          self._messages.remove(self._frame)
+          self._num_dropped_frames += 1
+        self._frame = message
+      self._messages.append(message)
+      self._max_depth = max(self._max_depth, len(self._messages))
+    return True
+
+  def get(self) -> Optional[bytes]:
+    """Removes and returns the next message or None if the queue is empty."""
+    with self._lock:
+      if not self._messages:
+        return None
+      message = self._messages.popleft()
+      if message is self._frame:
+        self._frame = None
+      self._num_sent += 1
+      return message.data
+
+  def has_pending_frame(self) -> bool:
+    """Returns true if there is an unsent frame in the queue."""
+    return self._frame is not None
+
+  @property
+  def depth(self) -> int:
+    """Number of messages in the queue."""
+    return len(self._messages)
+
+  @property
+  def num_dropped_frames(self) -> int:
+    return self._num_dropped_frames
+
+  def close(self):
+    """Closes the queue and drops the unsent messages."""
+    with self._lock:
+      self._closed = True
+      self._messages.clear()
+      self._frame = None
+
+  def stats(self) -> Dict[str, Any]:
+    """Returns the statistics of the queue."""
+    with self._lock:
+      return {
+          'depth': len(self._messages),
+          'max_depth': self._max_depth,
+          'num_sent': self._num_sent,
+          'num_dropped_frames': self._num_dropped_frames,
+      }
@@ -0,0 +1,78 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.outbound_queue."""
+
+from absl.testing import absltest
+from rlds_creator import outbound_queue
+
+
+def _get_all(queue):
+  messages = []
+  while True:
+    data = queue.get()
+    if data is None:
+      return messages
+    messages.append(data)
+
+
+class OutboundQueueTest(absltest.TestCase):
+
+  def test_control_messages(self):
+    queue = outbound_queue.OutboundQueue()
+    for data in [b'a', b'b', b'c']:
+      self.assertTrue(queue.put(data))
+    self.assertEqual(3, queue.depth)
+    self.assertSequenceEqual([b'a', b'b', b'c'], _get_all(queue))
+    self.assertEqual(0, queue.depth)
+
+  def test_latest_frame_wins(self):
+    queue = outbound_queue.OutboundQueue()
+    queue.put(b'frame1', is_frame=True)
+    queue.put(b'control1')
+    self.assertTrue(queue.has_pending_frame())
+    queue.put(b'frame2', is_frame=True)
+    queue.put(b'control2')
+    queue.put(b'frame3', is_frame=True)
+    # Only the latest frame is kept and control messages are not dropped.
+    self.assertSequenceEqual([b'control1', b'control2', b'frame3'],
+                             _get_all(queue))
+    self.assertFalse(queue.has_pending_frame())
+    self.assertEqual(2, queue.num_dropped_frames)
+    # A frame is not dropped once it is removed from the queue.
+    queue.put(b'frame4', is_frame=True)
+    self.assertEqual(b'frame4', queue.get())
+    queue.put(b'frame5', is_frame=True)
+    self.assertEqual(b'frame5', queue.get())
+    self.assertEqual(
+        {
+            'depth': 0,
+            'max_depth': 3,
+            'num_sent': 5,
+            'num_dropped_frames': 2
+        }, queue.stats())
+
+  def test_close(self):
+    queue = outbound_queue.OutboundQueue()
+    queue.put(b'a')
+    queue.put(b'frame', is_frame=True)
+    queue.close()
+    self.assertIsNone(queue.get())
+    self.assertFalse(queue.has_pending_frame())
+    self.assertFalse(queue.put(b'b'))
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,157 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Multi-stage processing pipeline that runs each stage in its own thread."""
+
+import queue
+import threading
+from typing import Any, Callable, Dict, Sequence
+
+from absl import logging
+
+# Default maximum number of items waiting to be processed by a stage.
+DEFAULT_MAX_QUEUE_SIZE = 2
+
+# A stage receives an item and returns the item for the next stage.
+Stage = Callable[[Any], Any]
+
+# Sentinel to stop the worker threads.
+_STOP = object()
+
+
+class Pipeline(object):
+  """Processes items by a sequence of stages.
+
+  Each stage runs in a separate thread and consumes the items from a bounded
+  queue. The output of a stage is passed to the next one. Items are processed in
+  the order they are submitted. If a stage raises an exception, then the item
+  and the ones submitted after it are dropped, until the exception is raised by
+  the next submit() or flush() call.
+
+  The queues are bounded; submit() blocks if the first stage is lagging behind
+  and the slowest stage determines the throughput.
+  """
+
+  def __init__(self,
+               stages: Sequence[Stage],
+               max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+               name: str = 'pipeline'):
+    """Creates a Pipeline.
+
+    Args:
+      stages: List of stages.
+      max_queue_size: Maximum number of pending items for each stage.
+      name: Name of the pipeline, used for the worker threads.
+    """
+    if not stages:
+      raise ValueError('Pipeline should have at least one stage.')
+    self._queues = [queue.Queue(maxsize=max_queue_size) for _ in stages]
+    self._closed = False
+    # Items are submitted with the current epoch, which is incremented when a
+    # stage fails. _dropped has the index of the last stage that drops the items
+    # of a failed epoch; the items that are already past it were submitted
+    # before the failed one. The exception is kept until it is raised.
+    self._lock = threading.Lock()
+    self._epoch = 0
+    self._dropped: Dict[int, int] = {}
+    self._error = None
+    self._threads = []
+    for index, stage in enumerate(stages):
+      next_queue = (
+          self._queues[index + 1] if index + 1 < len(stages) else None)
+      thread = threading.Thread(
+          target=self._run,
+          args=(index, stage, self._queues[index], next_queue),
+          name=f'{name}-{index}',
+          daemon=True)
+      thread.start()
+      self._threads.append(thread)
+
+  def _run(self, index: int, stage: Stage, input_queue: queue.Queue,
+           next_queue):
+    """Processes the items in the input queue by the stage."""
+    while True:
+      item = input_queue.get()
+      try:
+        if item is _STOP:
+          if next_queue:
+            next_queue.put(_STOP)
+          return
+        epoch, item = item
+        if index <= self._dropped.get(epoch, -1):
+          # Submitted after a failed item.
+          continue
+        try:
+          output = stage(item)
+        except Exception as e:  # pylint: disable=broad-except
+          logging.exception('Pipeline stage failed.')
+          with self._lock:
+            if epoch == self._epoch:
+              self._epoch += 1
+            self._dropped[epoch] = max(index, self._dropped.get(epoch, -1))
+            if self._error is None:
+              self._error = e
+          continue
+        if next_queue:
+          # The item should be passed to the next stage before marking it as
+          # done to make flush() work.
+          next_queue.put((epoch, output))
+      finally:
+        input_queue.task_done()
+
+  def submit(self, item: Any):
+    """Submits an item to the pipeline.
+
+    Blocks if the queue of the first stage is full.
+
+    Args:
+      item: Item to process.
+
+    Raises:
+      ValueError: If the pipeline is closed.
+      Exception: Raised by a stage since the last submit() or flush() call. The
+        item is not submitted.
+    """
+    if self._closed:
+      raise ValueError('Pipeline is closed.')
+    self._queues[0].put((self._check_error(), item))
+
+  def flush(self):
+    """Blocks until all submitted items are processed.
+
+    Raises:
+      Exception: Raised by a stage since the last submit() or flush() call.
+    """
+    for q in self._queues:
+      q.join()
+    self._check_error()
+
+  def _check_error(self) -> int:
+    """Raises the exception of a failed stage once, or returns the epoch."""
+    with self._lock:
+      error, self._error = self._error, None
+      epoch = self._epoch
+    if error:
+      raise error
+    return epoch
+
+  def close(self):
+    """Processes the pending items and stops the worker threads."""
+    if self._closed:
+      return
+    self._closed = True
+    self._queues[0].put(_STOP)
+    for thread in self._threads:
+      thread.join()
@@ -0,0 +1,138 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.pipeline."""
+
+import threading
+import time
+
+from absl.testing import absltest
+from rlds_creator import pipeline
+
+
+def _wait_for(condition, timeout_secs: float = 5.0):
+  deadline = time.monotonic() + timeout_secs
+  while not condition():
+    if time.monotonic() > deadline:
+      raise TimeoutError('Condition is not satisfied.')
+    time.sleep(0.01)
+
+
+class PipelineTest(absltest.TestCase):
+
+  def test_process(self):
+    outputs = []
+    p = pipeline.Pipeline([lambda x: x * 2, lambda x: x + 1, outputs.append])
+    for i in range(10):
+      p.submit(i)
+    p.flush()
+    # Items should be processed in order.
+    self.assertSequenceEqual([2 * i + 1 for i in range(10)], outputs)
+    p.close()
+
+  def test_stages_overlap(self):
+    # Each stage takes 50ms. If the stages are executed in parallel, processing
+    # 10 items should take considerably less than 10 * 3 * 50ms.
+    def stage(x):
+      time.sleep(0.05)
+      return x
+
+    p = pipeline.Pipeline([stage, stage, stage])
+    start = time.perf_counter()
+    for i in range(10):
+      p.submit(i)
+    p.flush()
+    self.assertLess(time.perf_counter() - start, 1.0)
+    p.close()
+
+  def test_submit_blocks(self):
+    event = threading.Event()
+    p = pipeline.Pipeline([lambda x: event.wait()], max_queue_size=1)
+    # First item is being processed and the second one is in the queue.
+    p.submit(0)
+    p.submit(1)
+    blocked = threading.Event()
+
+    def submit():
+      p.submit(2)
+      blocked.set()
+
+    thread = threading.Thread(target=submit)
+    thread.start()
+    self.assertFalse(blocked.wait(0.1))
+    event.set()
+    thread.join()
+    p.close()
+
+  def test_failure(self):
+    outputs = []
+
+    def stage(x):
+      if x == 1:
+        raise ValueError('Failure.')
+      return x
+
+    p = pipeline.Pipeline([stage, outputs.append])
+    p.submit(0)
+    p.submit(1)
+    # The exception is raised once.
+    with self.assertRaisesRegex(ValueError, 'Failure.'):
+      p.flush()
+    p.flush()
+    self.assertSequenceEqual([0], outputs)
+    # The pipeline can be used after the failure.
+    p.submit(2)
+    p.flush()
+    self.assertSequenceEqual([0, 2], outputs)
+    p.close()
+
+  def test_failure_drops_pending_items(self):
+    outputs = []
+    event = threading.Event()
+
+    def stage(x):
+      if x == 0:
+        event.wait()
+        raise ValueError('Failure.')
+      return x
+
+    p = pipeline.Pipeline([stage, outputs.append])
+    p.submit(0)
+    p.submit(1)
+    event.set()
+    # Item that is submitted before the exception is raised is dropped.
+    _wait_for(lambda: p._error is not None)
+    with self.assertRaisesRegex(ValueError, 'Failure.'):
+      p.submit(2)
+    p.flush()
+    self.assertEmpty(outputs)
+    p.submit(3)
+    p.flush()
+    self.assertSequenceEqual([3], outputs)
+    p.close()
+
+  def test_close(self):
+    outputs = []
+    p = pipeline.Pipeline([outputs.append])
+    p.submit(1)
+    p.close()
+    # Pending items should be processed before closing.
+    self.assertSequenceEqual([1], outputs)
+    with self.assertRaises(ValueError):
+      p.submit(2)
+
+
+if __name__ == '__main__':
+  absltest.main()
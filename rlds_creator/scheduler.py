@@ -0,0 +1,153 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Scheduler that executes the callbacks at the specified times."""
+
+from concurrent import futures
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Optional
+
+from absl import logging
+
+Callback = Callable[[], None]
+
+
+def now() -> float:
+  """Returns the current time of the scheduler clock in seconds."""
+  return time.perf_counter()
+
+
+class Handle(object):
+  """Handle of a scheduled callback."""
+
+  __slots__ = ('deadline', '_callback', '_cancelled')
+
+  def __init__(self, deadline: float, callback: Callback):
+    self.deadline = deadline
+    self._callback = callback
+    self._cancelled = False
+
+  def cancel(self):
+    """Cancels the callback if it is not executed yet."""
+    self._cancelled = True
+
+  def cancelled(self) -> bool:
+    return self._cancelled
+
+  def _run(self):
+    if self._cancelled:
+      return
+    try:
+      self._callback()
+    except Exception:  # pylint: disable=broad-except
+      logging.exception('Scheduled callback failed.')
+
+
+class Scheduler(object):
+  """Executes the callbacks at their deadlines.
+
+  A single thread keeps the pending callbacks in a heap ordered by their
+  deadlines and dispatches them to a pool of worker threads when they are due.
+  The deadlines are in terms of the clock returned by now().
+  """
+
+  def __init__(self,
+               max_workers: Optional[int] = None,
+               name: str = 'scheduler'):
+    """Creates a Scheduler.
+
+    Args:
+      max_workers: Maximum number of worker threads that execute the callbacks.
+        See concurrent.futures.ThreadPoolExecutor for the default value.
+      name: Name of the scheduler, used for the threads.
+    """
+    self._heap = []
+    # Used to break the ties between the callbacks with the same deadline.
+    self._counter = itertools.count()
+    self._condition = threading.Condition()
+    self._closed = False
+    self._executor = futures.ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix=f'{name}-worker')
+    self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+    self._thread.start()
+
+  def call_at(self, deadline: float, callback: Callback) -> Handle:
+    """Schedules the callback to be executed at the deadline.
+
+    Args:
+      deadline: Time of the execution. See now().
+      callback: Function to call.
+
+    Returns:
+      Handle of the callback that can be used to cancel it.
+    """
+    handle = Handle(deadline, callback)
+    with self._condition:
+      if self._closed:
+        raise ValueError('Scheduler is closed.')
+      heapq.heappush(self._heap, (deadline, next(self._counter), handle))
+      # Wake up the scheduler thread if this is the earliest callback.
+      if self._heap[0][2] is handle:
+        self._condition.notify()
+    return handle
+
+  def call_later(self, delay: float, callback: Callback) -> Handle:
+    """Schedules the callback to be executed after the delay in seconds."""
+    return self.call_at(now() + delay, callback)
+
+  def _run(self):
+    """Dispatches the callbacks that are due to the workers."""
+    with self._condition:
+      while not self._closed:
+        if not self._heap:
+          self._condition.wait()
+          continue
+        deadline, _, handle = self._heap[0]
+        if handle.cancelled():
+          heapq.heappop(self._heap)
+          continue
+        timeout = deadline - now()
+        if timeout > 0:
+          self._condition.wait(timeout)
+          continue
+        heapq.heappop(self._heap)
+        self._executor.submit(handle._run)  # pylint: disable=protected-access
+
+  def close(self):
+    """Stops the scheduler. Pending callbacks are not executed."""
+    with self._condition:
+      if self._closed:
+        return
+      self._closed = True
+      self._heap.clear()
+      self._condition.notify()
+    self._thread.join()
+    self._executor.shutdown(wait=True)
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default() -> Scheduler:
+  """Returns the process-wide scheduler."""
+  global _default_scheduler
+  with _default_scheduler_lock:
+    if _default_scheduler is None:
+      _default_scheduler = Scheduler()
+    return _default_scheduler
@@ -0,0 +1,87 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.scheduler."""
+
+import threading
+
+from absl.testing import absltest
+from rlds_creator import scheduler
+
+
+class SchedulerTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.scheduler = scheduler.Scheduler(max_workers=2)
+
+  def tearDown(self):
+    self.scheduler.close()
+    super().tearDown()
+
+  def test_call_at(self):
+    calls = []
+    done = threading.Event()
+    start = scheduler.now()
+
+    def callback(name):
+      calls.append((name, scheduler.now()))
+      if len(calls) == 3:
+        done.set()
+
+    # Callbacks are executed in the order of their deadlines.
+    self.scheduler.call_at(start + 0.1, lambda: callback('c'))
+    self.scheduler.call_later(0.05, lambda: callback('b'))
+    self.scheduler.call_at(start, lambda: callback('a'))
+    self.assertTrue(done.wait(5))
+    self.assertSequenceEqual(['a', 'b', 'c'], [name for name, _ in calls])
+    self.assertGreaterEqual(calls[1][1], start + 0.05)
+    self.assertGreaterEqual(calls[2][1], start + 0.1)
+
+  def test_cancel(self):
+    called = threading.Event()
+    done = threading.Event()
+    handle = self.scheduler.call_later(0.05, called.set)
+    self.scheduler.call_later(0.1, done.set)
+    handle.cancel()
+    self.assertTrue(handle.cancelled())
+    self.assertTrue(done.wait(5))
+    self.assertFalse(called.is_set())
+
+  def test_failure(self):
+    done = threading.Event()
+
+    def fail():
+      raise ValueError('Failure.')
+
+    # Failing callbacks should not stop the scheduler.
+    self.scheduler.call_later(0, fail)
+    self.scheduler.call_later(0.01, done.set)
+    self.assertTrue(done.wait(5))
+
+  def test_close(self):
+    called = threading.Event()
+    self.scheduler.call_later(0.1, called.set)
+    self.scheduler.close()
+    self.assertFalse(called.wait(0.2))
+    with self.assertRaises(ValueError):
+      self.scheduler.call_later(0, called.set)
+
+  def test_get_default(self):
+    self.assertIs(scheduler.get_default(), scheduler.get_default())
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -15,12 +15,15 @@
 
 """Basic RLDS Creator server."""
 
-import asyncio
 import os
-from typing import Awaitable, Optional, Sequence
+import threading
+from typing import Any, Dict, Optional, Sequence, Set, Tuple
 
 from absl import app
 from absl import flags
+from absl import logging
+import dm_env
+from rlds_creator import broadcast
 from rlds_creator import client_pb2
 from rlds_creator import config
 from rlds_creator import environment
@@ -28,9 +31,13 @@ from rlds_creator import environment_factory
 from rlds_creator import environment_handler
 from rlds_creator import episode_storage
 from rlds_creator import episode_storage_factory
+from rlds_creator import outbound_queue
 from rlds_creator import pickle_episode_storage
 from rlds_creator import sqlalchemy_storage
+from rlds_creator import storage as study_storage
+from rlds_creator import stream_controller
 from rlds_creator import study_pb2
+from rlds_creator import video_recorder
 import sqlalchemy
 import sqlite3
 from tornado import web
@@ -51,25 +58,169 @@ flags.DEFINE_string('db_path', 'sqlite:///:memory:', 'Path of the database.')
 flags.DEFINE_string('static_files_path', 'static',
                     'Relative path of the static files.')
 flags.DEFINE_boolean('record_videos', False, 'Enables video recording.')
+flags.DEFINE_integer(
+    'video_queue_size',
+    video_recorder.DEFAULT_MAX_QUEUE_SIZE,
+    'Maximum number of frames waiting to be encoded by the video recorder.',
+    lower_bound=1)
+flags.DEFINE_enum_class(
+    'video_drop_policy', video_recorder.DropPolicy.BLOCK,
+    video_recorder.DropPolicy,
+    'What to do with a new frame when the queue of the video recorder is '
+    'full.')
+flags.DEFINE_boolean(
+    'pipelined', False,
+    'If true, then the steps of the asynchronous environments will be encoded '
+    'and recorded while the environment advances to the next step.')
+flags.DEFINE_boolean(
+    'use_actor', True,
+    'If true, then the requests and the steps of each session will be '
+    'processed by a dedicated thread instead of the IO loop.')
+flags.DEFINE_float(
+    'stream_fps', None,
+    'If set, then the images of the asynchronous environments are sent to the '
+    'client at most at this rate, while the environments step at the rate '
+    'selected by the user. Otherwise, each step is sent.',
+    lower_bound=0.1)
+flags.DEFINE_float(
+    'action_window_secs', 0.0,
+    'If positive, then the gamepad inputs of the synchronous environments that '
+    'arrive within this window are merged and at most one step is taken per '
+    'window.',
+    lower_bound=0.0)
+flags.DEFINE_boolean(
+    'adaptive_streaming', False,
+    'If true, then the frame rate and the JPEG quality of the stream will be '
+    'adjusted based on the step and encoding times and the send backlog.')
+flags.DEFINE_float('adaptive_min_fps', 5.0,
+                   'Minimum frame rate of the adaptive stream.')
+flags.DEFINE_integer(
+    'adaptive_min_quality',
+    20,
+    'Minimum JPEG quality of the adaptive stream.',
+    lower_bound=1,
+    upper_bound=95)
+flags.DEFINE_integer(
+    'adaptive_max_quality',
+    80,
+    'Maximum JPEG quality of the adaptive stream.',
+    lower_bound=1,
+    upper_bound=95)
+flags.DEFINE_boolean(
+    'tiled_streaming', False,
+    'If true, then only the changed tiles of the images will be sent to the '
+    'client, except the periodic keyframes.')
+flags.DEFINE_boolean(
+    'env_pool', False,
+    'If true, then the environments of the enabled studies are created in '
+    'advance and the released ones are reused, to reduce the time to start an '
+    'environment.')
+flags.DEFINE_integer(
+    'env_pool_min_size', environment_factory.DEFAULT_POOL_MIN_SIZE,
+    'Number of the idle environments that are kept for each environment.',
+    lower_bound=0)
+flags.DEFINE_integer(
+    'env_pool_max_size', environment_factory.DEFAULT_POOL_MAX_SIZE,
+    'Maximum number of the idle environments for each environment.',
+    lower_bound=0)
+flags.DEFINE_list(
+    'env_pool_sizes', [],
+    'Minimum and maximum number of the idle environments of the environment '
+    'types as type:min:max, e.g. robosuite:1:4. They override '
+    '--env_pool_min_size and --env_pool_max_size.')
+flags.DEFINE_float(
+    'env_pool_ttl_secs', environment_factory.DEFAULT_POOL_TTL_SECS,
+    'Idle environments above the minimum number are closed after this time.',
+    lower_bound=0.0)
+flags.DEFINE_boolean(
+    'zygote', False,
+    'If true, then the proxied environments, e.g. Robosuite and NetHack, are '
+    'forked from long-lived processes that have already imported their '
+    'modules, instead of starting a new process for each environment.')
+flags.DEFINE_boolean(
+    'proxy_shared_memory', False,
+    'If true, then the images and the observations of the proxied '
+    'environments are passed from their processes in shared memory instead of '
+    'being pickled.')
+flags.DEFINE_boolean(
+    'text_stream', False,
+    'If true, then the text screens of the text based environments, e.g. '
+    'NetHack, will be sent to the client and drawn with a monospace font '
+    'instead of the rendered images. It is ignored if --record_videos is set.')
+flags.DEFINE_boolean(
+    'websocket_compression', False,
+    'If true, then the messages will be compressed with permessage-deflate if '
+    'the client supports it. This reduces the size of the large non-image '
+    'messages, e.g. the lists of episodes, but the images are compressed '
+    'again as well.')
+flags.DEFINE_float(
+    'resume_grace_secs', 60.0,
+    'Duration to keep the environment of a disconnected client, so that it '
+    'can reconnect and resume the session. If 0, then the environment is '
+    'closed immediately.')
 
 # Path to the static resources.
 _RESOURCES_PATH = os.path.dirname(__file__)
-# Default timeout in seconds for the socket operations.
-_DEFAULT_TIMEOUT_SECS = 60
+
+
+async def _write_queued_messages(
+    outbound: outbound_queue.OutboundQueue,
+    web_socket: tornado.websocket.WebSocketHandler):
+  """Writes the queued messages to the websocket one by one."""
+  try:
+    while True:
+      data = outbound.get()
+      if data is None:
+        return
+      # The next message is written only after this one is flushed. In the
+      # meantime, newer frames replace the older unsent ones in the queue.
+      await web_socket.write_message(data, binary=True)
+  except tornado.websocket.WebSocketClosedError:
+    outbound.close()
 
 
 class EnvironmentHandler(environment_handler.EnvironmentHandler):
   """Environment handler that creates the environments using the factory."""
 
-  def __init__(self, web_socket, *args, **kwargs):
+  def __init__(self,
+               web_socket,
+               *args,
+               env_pool: Optional[environment_factory.EnvironmentPool] = None,
+               **kwargs):
     self._web_socket = web_socket
+    self._env_pool = env_pool
     self._ioloop = tornado.ioloop.IOLoop.current()
+    # Serialized responses waiting to be written to the websocket. They are
+    # written one by one by the IO loop.
+    self._outbound = outbound_queue.OutboundQueue()
+    # Guards adding the step responses to the queue.
+    self._outbound_lock = threading.Lock()
+    # Image of the last step response added to the queue.
+    self._last_step_image = None
+    # Whether the IO loop is writing the responses.
+    self._writing = False
+    # Spectators of the session.
+    self._broadcast = broadcast.Broadcast()
     super().__init__(*args, **kwargs)
 
   def create_env_from_spec(
       self, env_spec: study_pb2.EnvironmentSpec) -> environment.Environment:
+    if self._env_pool:
+      return self._env_pool.acquire(env_spec)
     return environment_factory.create_env_from_spec(env_spec)
 
+  def take_reset_timestep(
+      self, env: environment.Environment) -> Optional[dm_env.TimeStep]:
+    if self._env_pool:
+      return self._env_pool.take_reset_timestep(env)
+    return None
+
+  def release_env(self, env: environment.Environment):
+    if self._env_pool:
+      self._env_pool.release(env)
+    else:
+      super().release_env(env)
+
   def get_url_for_path(self, path: str) -> str:
     return 'file://' + path
 
@@ -81,31 +232,121 @@ class EnvironmentHandler(environment_handler.EnvironmentHandler):
   ) -> episode_storage.EpisodeWriter:
     return pickle_episode_storage.PickleEpisodeWriter(env, path, metadata)
 
-  def _write_message(self,
-                     response: client_pb2.OperationResponse) -> Awaitable[None]:
-    """Writes the response to the websocket and returns the future."""
-    return self._web_socket.write_message(
-        response.SerializeToString(), binary=True)
+  async def _write_messages(self):
+    """Writes the queued responses to the websocket."""
+    if self._writing:
+      return
+    self._writing = True
+    outbound = self._outbound
+    try:
+      await _write_queued_messages(outbound, self._web_socket)
+    finally:
+      # The client may have reconnected in the meantime with a new queue.
+      if outbound is self._outbound:
+        self._writing = False
+
+  def detach(self):
+    # Responses are dropped until the client reconnects.
+    self._outbound.close()
+    super().detach()
+
+  def attach(self, web_socket):
+    """Attaches the websocket of the reconnected client and resumes."""
+    with self._outbound_lock:
+      logging.info('Outbound queue stats: %r', self._outbound.stats())
+      self._web_socket = web_socket
+      self._outbound = outbound_queue.OutboundQueue()
+      self._last_step_image = None
+      self._writing = False
+    self.resume()
+
+  def get_send_backlog(self) -> int:
+    return self._outbound.depth + int(self._writing)
 
   def send_response(self, response: client_pb2.OperationResponse) -> bool:
-    # Send the message and wait. Unlike the regular Futures API, the result()
-    # method of the future returned by write_message() call cannot be called
-    # directly (the future may not be in done state which raises an exception).
-    try:
-      # send_response() method may be called from a different thread than the
-      # main thread of the environment handler (e.g. steps of asynchronous
-      # environments). We use call_soon_threadsafe() to ensure that the IO
-      # operation is executed by the event loop of the handler.
-      asyncio.wait_for(
-          self._ioloop.asyncio_loop.call_soon_threadsafe(
-              self._write_message, response),
-          timeout=_DEFAULT_TIMEOUT_SECS)
-    except asyncio.TimeoutError:
+    # send_response() method may be called from a different thread than the
+    # main thread of the environment handler (e.g. steps of asynchronous
+    # environments). The responses are serialized by the caller and the IO
+    # operations are executed by the event loop of the handler.
+    if response.WhichOneof('type') != 'step':
+      if not self._outbound.put(response.SerializeToString()):
+        return False
+    else:
+      with self._outbound_lock:
+        step = response.step
+        # Tiles update the image of the previous step, therefore they should
+        # not be dropped.
+        is_frame = not step.tiles
+        if step.tiles:
+          # The last image is no longer the one displayed by the client.
+          self._last_step_image = None
+        elif step.same_image and self._outbound.has_pending_frame():
+          if self._last_step_image is None:
+            is_frame = False
+          else:
+            # The pending step will be dropped and the client may not have the
+            # image; it should be sent again.
+            step.image = self._last_step_image
+            step.ClearField('same_image')
+        elif step.HasField('image'):
+          self._last_step_image = step.image
+        if not self._outbound.put(
+            response.SerializeToString(), is_frame=is_frame):
+          return False
+    self._ioloop.add_callback(self._write_messages)
+    return True
+
+  def has_spectators(self) -> bool:
+    return self._broadcast.num_subscribers > 0
+
+  def broadcast_response(self, response: client_pb2.OperationResponse):
+    # Serialized once for all the spectators.
+    self._broadcast.publish(response.SerializeToString())
+
+  def add_spectator(self, spectator: broadcast.Subscriber) -> bool:
+    """Adds a spectator and sends it the current image."""
+    if not self._broadcast.subscribe(spectator):
       return False
+    self.broadcast_current_frame()
     return True
 
+  def remove_spectator(self, spectator: broadcast.Subscriber):
+    self._broadcast.unsubscribe(spectator)
+
   def on_close(self):
-    pass
+    logging.info('Outbound queue stats: %r', self._outbound.stats())
+    logging.info('Broadcast stats: %r', self._broadcast.stats())
+    if self._env_pool:
+      logging.info('Environment pool stats: %r', self._env_pool.stats())
+    self._outbound.close()
+    self._broadcast.close()
+
+
+def _get_stream_bounds() -> Optional[stream_controller.Bounds]:
+  """Returns the bounds of the adaptive stream, if enabled."""
+  if not FLAGS.adaptive_streaming:
+    return None
+  return stream_controller.Bounds(
+      min_fps=FLAGS.adaptive_min_fps,
+      min_quality=FLAGS.adaptive_min_quality,
+      max_quality=FLAGS.adaptive_max_quality)
+
+
+# Environment handlers of the open connections. Accessed only by the IO loop.
+_handlers: Set[EnvironmentHandler] = set()
+# Handlers of the disconnected clients that can resume their sessions and the
+# timeouts to close them, keyed by the resume tokens. Accessed only by the IO
+# loop.
+_detached_handlers: Dict[str, Tuple[EnvironmentHandler, object]] = {}
+
+
+def _close_detached_handler(resume_token: str):
+  """Closes the handler if its client hasn't reconnected."""
+  handler, _ = _detached_handlers.pop(resume_token, (None, None))
+  if handler:
+    logging.info('Session is not resumed in time; closing.')
+    _handlers.discard(handler)
+    handler.close()
 
 
 class EnvironmentWebSocketHandler(tornado.websocket.WebSocketHandler):
@@ -115,7 +356,21 @@ class EnvironmentWebSocketHandler(tornado.websocket.WebSocketHandler):
     self._handler = None
     super().__init__(*args, **kwargs)
 
+  def get_compression_options(self) -> Optional[Dict[str, Any]]:
+    # Enables permessage-deflate with the default options.
+    return {} if FLAGS.websocket_compression else None
+
   def open(self):
+    resume_token = self.get_argument('resume_token', '')
+    if resume_token:
+      handler, timeout = _detached_handlers.pop(resume_token, (None, None))
+      if not handler:
+        self.close(reason='Session expired.')
+        return
+      tornado.ioloop.IOLoop.current().remove_timeout(timeout)
+      self._handler = handler
+      handler.attach(self)
+      return
     self._handler = EnvironmentHandler(
         self,
         self.application.settings.get('storage'),
@@ -123,28 +378,145 @@ class EnvironmentWebSocketHandler(tornado.websocket.WebSocketHandler):
         config.CONFIG,
         episode_storage_factory.EpisodeStorageFactory(),
         base_log_dir=FLAGS.base_log_dir,
-        record_videos=FLAGS.record_videos)
+        record_videos=FLAGS.record_videos,
+        pipelined=FLAGS.pipelined,
+        stream_bounds=_get_stream_bounds(),
+        use_actor=FLAGS.use_actor,
+        tiled=FLAGS.tiled_streaming,
+        stream_fps=FLAGS.stream_fps,
+        action_window_secs=FLAGS.action_window_secs,
+        text_stream_enabled=FLAGS.text_stream,
+        video_queue_size=FLAGS.video_queue_size,
+        video_drop_policy=FLAGS.video_drop_policy,
+        env_pool=self.application.settings.get('env_pool'))
+    _handlers.add(self._handler)
 
   def on_message(self, message):
     request = client_pb2.OperationRequest()
     request.ParseFromString(message)
+    # With an actor, the request is only queued and the IO loop is not blocked
+    # by the environment.
     self._handler.handle_request(request)
 
   def on_close(self):
     # The initialization of the environment handler might have failed.
-    if self._handler:
+    if not self._handler:
+      return
+    if FLAGS.resume_grace_secs > 0:
+      # The environment and the episode are kept for a while, e.g. in case of a
+      # network glitch.
+      resume_token = self._handler.resume_token
+      timeout = tornado.ioloop.IOLoop.current().call_later(
+          FLAGS.resume_grace_secs, _close_detached_handler, resume_token)
+      _detached_handlers[resume_token] = (self._handler, timeout)
+      self._handler.detach()
+    else:
+      _handlers.discard(self._handler)
       self._handler.close()
 
 
+class SpectatorWebSocketHandler(tornado.websocket.WebSocketHandler,
+                                broadcast.Subscriber):
+  """Handler for the web socket of a spectator of a live session.
+
+  The spectator receives the steps of the session, each with the whole image.
+  Messages from the spectator are ignored.
+  """
+
+  def __init__(self, *args, **kwargs):
+    self._handler = None
+    self._ioloop = tornado.ioloop.IOLoop.current()
+    # Only the latest step is kept if the spectator is slow.
+    self._outbound = outbound_queue.OutboundQueue()
+    self._writing = False
+    super().__init__(*args, **kwargs)
+
+  def open(self):
+    session_id = self.get_argument('session_id', '')
+    for handler in _handlers:
+      if session_id and handler.session_id == session_id:
+        self._handler = handler
+        break
+    if not self._handler or not self._handler.add_spectator(self):
+      self.close(reason='Unknown session.')
+
+  def deliver(self, data: bytes, is_frame: bool) -> bool:
+    # Called by the thread of the session.
+    if not self._outbound.put(data, is_frame=is_frame):
+      return False
+    self._ioloop.add_callback(self._write_messages)
+    return True
+
+  def on_broadcast_end(self):
+    self._ioloop.add_callback(self.close, reason='Session is closed.')
+
+  async def _write_messages(self):
+    if self._writing:
+      return
+    self._writing = True
+    try:
+      await _write_queued_messages(self._outbound, self)
+    finally:
+      self._writing = False
+
+  def on_message(self, message):
+    pass
+
+  def on_close(self):
+    if self._handler:
+      self._handler.remove_spectator(self)
+    self._outbound.close()
+
+
+class SpectatorSessionsHandler(web.RequestHandler):
+  """Lists the live sessions that can be watched by the spectators."""
+
+  def get(self):
+    self.write({
+        'session_ids': [
+            h.session_id for h in _handlers if h.session_id is not None
+        ]
+    })
+
+
+def _create_env_pool(
+    storage: study_storage.Storage
+) -> Optional[environment_factory.EnvironmentPool]:
+  """Creates the environment pool and warms it with the enabled studies."""
+  if not FLAGS.env_pool:
+    return None
+  sizes = {}
+  for value in FLAGS.env_pool_sizes:
+    env_type, min_size, max_size = value.split(':')
+    sizes[env_type] = environment_factory.PoolSize(
+        min_size=int(min_size), max_size=int(max_size))
+  pool = environment_factory.EnvironmentPool(
+      default_size=environment_factory.PoolSize(
+          min_size=FLAGS.env_pool_min_size, max_size=FLAGS.env_pool_max_size),
+      sizes=sizes,
+      ttl_secs=FLAGS.env_pool_ttl_secs)
+  for study_spec in storage.get_studies(
+      state=study_pb2.StudySpec.STATE_ENABLED):
+    for env_spec in study_spec.environment_specs:
+      pool.warm(env_spec)
+  return pool
+
+
 def main(argv: Sequence[str]) -> None:
   if len(argv) > 1:
     raise app.UsageError('Too many command-line arguments.')
 
+  environment_factory.set_proxy_shared_memory(FLAGS.proxy_shared_memory)
+  if FLAGS.zygote:
+    # Started before the storage and the server, so that their connections are
+    # not inherited by the environments.
+    environment_factory.start_zygotes()
 
   # Create the storage.
   engine = sqlalchemy.create_engine(FLAGS.db_path)
   storage = sqlalchemy_storage.Storage(engine=engine, create_tables=True)
 
+  env_pool = _create_env_pool(storage)
   web_app = web.Application([
       (r'/static/(.*)', web.StaticFileHandler, {
           'path': os.path.join(_RESOURCES_PATH, FLAGS.static_files_path)
@@ -153,11 +525,19 @@ def main(argv: Sequence[str]) -> None:
           'url': '/static/app.html'
       }),
       (r'/channel/environment', EnvironmentWebSocketHandler),
+      (r'/channel/spectate', SpectatorWebSocketHandler),
+      (r'/spectate/sessions', SpectatorSessionsHandler),
   ],
-                            storage=storage)
+                            storage=storage,
+                            env_pool=env_pool)
 
   web_app.listen(FLAGS.port)
-  tornado.ioloop.IOLoop.current().start()
+  try:
+    tornado.ioloop.IOLoop.current().start()
+  finally:
+    if env_pool:
+      env_pool.close()
+    environment_factory.stop_zygotes()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,295 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ring of shared memory slots to pass arrays between processes.
+
+The writer copies the large arrays of a value, e.g. a rendered image or the
+observation of a time step, to a free slot and replaces them with their
+locations. The reader, which maps the same memory, replaces the locations with
+the views of the slot. A slot is free again once all its views are garbage
+collected.
+
+The memory is created with memfd_create() and the writer passes its file
+descriptor to the reader, e.g. over a Unix socket. It is released when both of
+them unmap it, even if they exit unexpectedly.
+"""
+
+import dataclasses
+import mmap
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Default number of the slots of a ring.
+DEFAULT_NUM_SLOTS = 8
+# Smaller arrays are passed with the rest of the value.
+DEFAULT_MIN_ARRAY_SIZE = 4096
+
+# Arrays are aligned to the cache lines.
+_ALIGNMENT = 64
+
+
+def is_supported() -> bool:
+  """Returns true if the shared memory rings are supported by the platform."""
+  return hasattr(os, 'memfd_create')
+
+
+@dataclasses.dataclass(frozen=True)
+class SharedArray:
+  """Location of an array in a slot."""
+  offset: int
+  shape: Tuple[int, ...]
+  dtype: str
+
+
+class RingInfo(NamedTuple):
+  """Layout of a ring, sent to the reader with the file descriptor."""
+  ring_id: int
+  slot_size: int
+  num_slots: int
+
+
+class SharedValue(NamedTuple):
+  """Value whose large arrays are replaced with their locations in a slot."""
+  ring_id: int
+  slot: int
+  value: Any
+
+
+def map_arrays(fn: Callable[[Any], Any], value: Any) -> Any:
+  """Applies the function to the arrays in the nested value.
+
+  Args:
+    fn: Function that is applied to the arrays and the shared arrays.
+    value: Nested dicts, lists, tuples and dataclasses, including the named
+      tuples, e.g. dm_env.TimeStep.
+
+  Returns:
+    Value of the same structure.
+  """
+  if isinstance(value, (np.ndarray, SharedArray)):
+    return fn(value)
+  if isinstance(value, dict):
+    return type(value)((k, map_arrays(fn, v)) for k, v in value.items())
+  if isinstance(value, tuple) and hasattr(value, '_fields'):
+    return type(value)(*[map_arrays(fn, v) for v in value])
+  if isinstance(value, (list, tuple)):
+    return type(value)(map_arrays(fn, v) for v in value)
+  if dataclasses.is_dataclass(value) and not isinstance(value, type):
+    return dataclasses.replace(
+        value, **{
+            field.name: map_arrays(fn, getattr(value, field.name))
+            for field in dataclasses.fields(value)
+            if field.init
+        })
+  return value
+
+
+def _align(size: int) -> int:
+  return (size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def get_spec_size(spec: Any) -> int:
+  """Returns the slot size for the arrays of the nested dm_env specs."""
+  sizes = []
+
+  def add_size(spec: Any):
+    if hasattr(spec, 'shape') and hasattr(spec, 'dtype'):
+      sizes.append(
+          _align(int(np.prod(spec.shape)) * np.dtype(spec.dtype).itemsize))
+
+  # Specs are not arrays; they are visited as the leaves of the value.
+  def visit(value: Any):
+    if isinstance(value, dict):
+      for v in value.values():
+        visit(v)
+    elif isinstance(value, (list, tuple)):
+      for v in value:
+        visit(v)
+    else:
+      add_size(value)
+
+  visit(spec)
+  return sum(sizes)
+
+
+def get_array_size(value: Any,
+                   min_array_size: int = DEFAULT_MIN_ARRAY_SIZE) -> int:
+  """Returns the slot size for the arrays of the value that are shared."""
+  sizes = []
+
+  def add_size(array: np.ndarray) -> np.ndarray:
+    if array.nbytes >= min_array_size:
+      sizes.append(_align(array.nbytes))
+    return array
+
+  map_arrays(add_size, value)
+  return sum(sizes)
+
+
+class RingWriter(object):
+  """Copies the arrays of the values to the slots of a ring.
+
+  The first bytes of the memory are the flags of the slots; the writer marks a
+  slot as busy and the reader marks it as free.
+  """
+
+  def __init__(self,
+               ring_id: int,
+               slot_size: int,
+               num_slots: int = DEFAULT_NUM_SLOTS,
+               min_array_size: int = DEFAULT_MIN_ARRAY_SIZE):
+    """Creates a RingWriter.
+
+    Args:
+      ring_id: ID of the ring, to distinguish it from the previous rings.
+      slot_size: Size of a slot in bytes.
+      num_slots: Number of the slots.
+      min_array_size: Minimum size of the arrays to share in bytes.
+    """
+    self.info = RingInfo(ring_id, _align(slot_size), num_slots)
+    self._min_array_size = min_array_size
+    self._fd = os.memfd_create('rlds_creator_ring')
+    size = _align(num_slots) + self.info.slot_size * num_slots
+    os.ftruncate(self._fd, size)
+    self._mmap = mmap.mmap(self._fd, size)
+    # Index of the next slot to check.
+    self._next = 0
+    self._num_shared = 0
+    self._num_full = 0
+
+  def fileno(self) -> int:
+    """Returns the file descriptor of the memory."""
+    return self._fd
+
+  def share(self, value: Any) -> Optional[SharedValue]:
+    """Copies the large arrays of the value to a free slot.
+
+    Args:
+      value: A nested value.
+
+    Returns:
+      The shared value, or None if the value doesn't have large arrays, they
+      don't fit in a slot or all the slots are busy.
+    """
+    size = get_array_size(value, self._min_array_size)
+    if not size or size > self.info.slot_size:
+      return None
+    slot = self._find_free_slot()
+    if slot is None:
+      self._num_full += 1
+      return None
+    offset = _align(self.info.num_slots) + slot * self.info.slot_size
+    start = offset
+
+    def copy(array: np.ndarray):
+      nonlocal offset
+      if array.nbytes < self._min_array_size:
+        return array
+      destination = np.ndarray(
+          array.shape, dtype=array.dtype, buffer=self._mmap, offset=offset)
+      np.copyto(destination, array)
+      shared = SharedArray(offset - start, array.shape, array.dtype.str)
+      offset += _align(array.nbytes)
+      return shared
+
+    shared_value = SharedValue(self.info.ring_id, slot, map_arrays(copy, value))
+    self._mmap[slot] = 1
+    self._num_shared += 1
+    return shared_value
+
+  def _find_free_slot(self) -> Optional[int]:
+    for i in range(self.info.num_slots):
+      slot = (self._next + i) % self.info.num_slots
+      if not self._mmap[slot]:
+        self._next = (slot + 1) % self.info.num_slots
+        return slot
+    return None
+
+  def close(self):
+    """Unmaps the memory. The reader can still use it."""
+    self._mmap.close()
+    os.close(self._fd)
+
+  def stats(self) -> Dict[str, Any]:
+    """Returns the number of the shared values and the ones that are not."""
+    return {
+        'num_shared': self._num_shared,
+        'num_full': self._num_full,
+        'num_busy': sum(self._mmap[:self.info.num_slots]),
+    }
+
+
+def _free_slot(memory: mmap.mmap, slot: int):
+  memory[slot] = 0
+
+
+class RingReader(object):
+  """Returns the values of a ring writer with the views of their slots."""
+
+  def __init__(self):
+    self._info = None
+    self._mmap = None
+    self._lock = threading.Lock()
+
+  def attach(self, info: RingInfo, fd: int):
+    """Maps the memory of a new ring and closes its file descriptor.
+
+    Views of the previous ring stay valid until they are garbage collected.
+
+    Args:
+      info: Layout of the ring.
+      fd: File descriptor of the memory.
+    """
+    try:
+      memory = mmap.mmap(fd, _align(info.num_slots) +
+                         info.slot_size * info.num_slots)
+    finally:
+      os.close(fd)
+    with self._lock:
+      self._info = info
+      self._mmap = memory
+
+  def receive(self, shared_value: SharedValue) -> Any:
+    """Returns the value with the views of the shared arrays.
+
+    Raises:
+      ValueError: If the value is not in the attached ring.
+    """
+    with self._lock:
+      info, memory = self._info, self._mmap
+    if info is None or shared_value.ring_id != info.ring_id:
+      raise ValueError(f'Unknown ring {shared_value.ring_id}.')
+    slot = shared_value.slot
+    slot_array = np.frombuffer(
+        memory,
+        dtype=np.uint8,
+        count=info.slot_size,
+        offset=_align(info.num_slots) + slot * info.slot_size)
+    # The views refer to the slot array; it is collected after all of them.
+    weakref.finalize(slot_array, _free_slot, memory, slot)
+
+    def view(array):
+      if not isinstance(array, SharedArray):
+        return array
+      dtype = np.dtype(array.dtype)
+      size = int(np.prod(array.shape)) * dtype.itemsize
+      return slot_array[array.offset:array.offset + size].view(dtype).reshape(
+          array.shape)
+
+    return map_arrays(view, shared_value.value)
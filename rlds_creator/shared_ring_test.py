@@ -0,0 +1,141 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.shared_ring."""
+
+import dataclasses
+import gc
+import os
+from typing import Any
+
+from absl.testing import absltest
+import dm_env
+from dm_env import specs
+import numpy as np
+from rlds_creator import shared_ring
+
+
+@dataclasses.dataclass
+class _Step:
+  image: Any
+  info: Any = None
+
+
+def _image(value: int = 0) -> np.ndarray:
+  return np.full((64, 64, 3), value, dtype=np.uint8)
+
+
+class SharedRingTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    if not shared_ring.is_supported():
+      self.skipTest('Shared memory rings are not supported.')
+
+  def create_ring(self, slot_size: int = 64 * 64 * 4, num_slots: int = 2):
+    writer = shared_ring.RingWriter(1, slot_size, num_slots=num_slots)
+    self.addCleanup(writer.close)
+    reader = shared_ring.RingReader()
+    reader.attach(writer.info, os.dup(writer.fileno()))
+    return writer, reader
+
+  def test_map_arrays(self):
+    timestep = dm_env.restart({'image': _image(), 'state': [np.zeros(2)]})
+    shapes = shared_ring.map_arrays(lambda x: x.shape, timestep)
+    self.assertIsInstance(shapes, dm_env.TimeStep)
+    self.assertEqual({
+        'image': (64, 64, 3),
+        'state': [(2,)]
+    }, shapes.observation)
+    self.assertIsNone(shapes.reward)
+    # Dataclasses.
+    step = _Step(image=_image(), info={'depth': np.zeros(3)})
+    shapes = shared_ring.map_arrays(lambda x: x.shape, step)
+    self.assertEqual(_Step(image=(64, 64, 3), info={'depth': (3,)}), shapes)
+
+  def test_get_spec_size(self):
+    spec = {
+        'image': specs.Array((64, 64, 3), np.uint8),
+        'state': specs.BoundedArray((3,), np.float32, 0, 1),
+    }
+    self.assertEqual(64 * 64 * 3 + 64, shared_ring.get_spec_size(spec))
+
+  def test_share(self):
+    writer, reader = self.create_ring()
+    timestep = dm_env.transition(
+        1.0, {
+            'image': _image(1),
+            'depth': np.ones((32, 32), dtype=np.float32),
+            'state': np.arange(3)
+        })
+    shared_value = writer.share(timestep)
+    self.assertIsNotNone(shared_value)
+    # Only the large arrays are moved to the slot.
+    self.assertIsInstance(shared_value.value.observation['image'],
+                          shared_ring.SharedArray)
+    self.assertIsInstance(shared_value.value.observation['state'], np.ndarray)
+    received = reader.receive(shared_value)
+    self.assertEqual(1.0, received.reward)
+    for key, value in timestep.observation.items():
+      np.testing.assert_array_equal(value, received.observation[key])
+      self.assertEqual(value.dtype, received.observation[key].dtype)
+    self.assertEqual(1, writer.stats()['num_busy'])
+    # The slot is freed once the views are collected.
+    del received
+    gc.collect()
+    self.assertEqual(0, writer.stats()['num_busy'])
+
+  def test_share_not_shared(self):
+    writer, _ = self.create_ring()
+    # Small arrays.
+    self.assertIsNone(writer.share(np.zeros(10)))
+    self.assertIsNone(writer.share({'x': 1}))
+    # Arrays that don't fit in a slot.
+    self.assertIsNone(writer.share(np.zeros((128, 128, 3), dtype=np.uint8)))
+    self.assertEqual(0, writer.stats()['num_shared'])
+
+  def test_share_full(self):
+    writer, reader = self.create_ring(num_slots=2)
+    views = [reader.receive(writer.share(_image(i))) for i in range(2)]
+    # All the slots are held by the views.
+    self.assertIsNone(writer.share(_image(2)))
+    self.assertEqual(1, writer.stats()['num_full'])
+    # Views derived from the received arrays also hold the slot.
+    row = views[0][0]
+    del views[0]
+    gc.collect()
+    self.assertIsNone(writer.share(_image(2)))
+    del row
+    gc.collect()
+    view = reader.receive(writer.share(_image(2)))
+    np.testing.assert_array_equal(_image(2), view)
+    np.testing.assert_array_equal(_image(1), views[0])
+
+  def test_receive_unknown_ring(self):
+    writer, reader = self.create_ring()
+    other_writer = shared_ring.RingWriter(2, writer.info.slot_size)
+    self.addCleanup(other_writer.close)
+    with self.assertRaises(ValueError):
+      reader.receive(other_writer.share(_image()))
+    # Views of the previous ring are valid after attaching a new one.
+    view = reader.receive(writer.share(_image(1)))
+    reader.attach(other_writer.info, os.dup(other_writer.fileno()))
+    np.testing.assert_array_equal(_image(1), view)
+    np.testing.assert_array_equal(
+        _image(3), reader.receive(other_writer.share(_image(3))))
+
+
+if __name__ == '__main__':
+  absltest.main()
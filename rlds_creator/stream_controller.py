@@ -0,0 +1,176 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Closed-loop controller for the frame rate and the quality of the stream."""
+
+import dataclasses
+from typing import Any, Dict, Optional
+
+from rlds_creator import constants
+
+# Smoothing factor of the exponential moving averages of the measurements.
+_EMA_ALPHA = 0.2
+
+
+@dataclasses.dataclass
+class Bounds:
+  """Bounds of the stream settings."""
+  # Frames per second.
+  min_fps: float = 5.0
+  max_fps: float = constants.ASYNC_FPS
+  # JPEG quality in [1, 95].
+  min_quality: int = 20
+  max_quality: int = 80
+  # Maximum number of responses waiting to be sent to the client, including the
+  # one that is being sent. A larger backlog indicates a slow connection.
+  max_backlog: int = 1
+  # Maximum number of bytes per second. If 0, then the bandwidth is not limited.
+  max_bytes_per_sec: int = 0
+
+
+class StreamController(object):
+  """Adjusts the frame rate and the JPEG quality of a session.
+
+  The controller measures the time to step the environment and encode the
+  images, size of the encoded images and the number of frames waiting to be sent
+  to the client. If the host or the connection cannot keep up, the quality is
+  reduced first, and the frame rate only if the quality is at its minimum. This
+  keeps the frame rate stable on slow links. When there is enough headroom, the
+  frame rate is restored first, followed by the quality.
+  """
+
+  def __init__(self,
+               bounds: Optional[Bounds] = None,
+               fps: Optional[float] = None,
+               quality: Optional[int] = None,
+               adjust_interval: int = 5,
+               quality_step: int = 10):
+    """Creates a StreamController.
+
+    Args:
+      bounds: Bounds of the frame rate and quality.
+      fps: Initial frame rate. Defaults to the maximum frame rate.
+      quality: Initial quality. Defaults to the maximum quality.
+      adjust_interval: Minimum number of frames between two adjustments. This
+        gives time to observe the effect of the previous adjustment.
+      quality_step: Amount to change the quality in each adjustment.
+    """
+    self._bounds = bounds or Bounds()
+    self._fps = fps or self._bounds.max_fps
+    self._quality = quality or self._bounds.max_quality
+    self._adjust_interval = adjust_interval
+    self._quality_step = quality_step
+    # Exponential moving averages of the measurements.
+    self._step_secs = None
+    self._encode_secs = None
+    self._size = None
+    self._backlog = 0
+    self._frames_since_adjustment = 0
+    self._num_frames = 0
+    self._num_adjustments = 0
+
+  @property
+  def fps(self) -> float:
+    return self._fps
+
+  @property
+  def quality(self) -> int:
+    return self._quality
+
+  def set_max_fps(self, fps: float):
+    """Sets the maximum frame rate, e.g. the one requested by the user."""
+    self._bounds.max_fps = max(fps, self._bounds.min_fps)
+    self._fps = min(self._fps, self._bounds.max_fps)
+
+  def set_max_quality(self, quality: int):
+    """Sets the maximum quality, e.g. the one requested by the user."""
+    self._bounds.max_quality = max(quality, self._bounds.min_quality)
+    self._quality = min(self._quality, self._bounds.max_quality)
+
+  def record_frame(self, step_secs: float, encode_secs: float, size: int,
+                   backlog: int) -> bool:
+    """Records the measurements of a frame and adjusts the settings.
+
+    Args:
+      step_secs: Time to step the environment and render the image.
+      encode_secs: Time to encode the image; 0 if it is not encoded.
+      size: Size of the encoded image.
+      backlog: Number of frames waiting to be sent to the client.
+
+    Returns:
+      True if the settings are changed.
+    """
+    self._step_secs = _ema(self._step_secs, step_secs)
+    self._encode_secs = _ema(self._encode_secs, encode_secs)
+    self._size = _ema(self._size, size)
+    self._backlog = backlog
+    self._num_frames += 1
+    self._frames_since_adjustment += 1
+    if self._frames_since_adjustment < self._adjust_interval:
+      return False
+    changed = self._adjust()
+    if changed:
+      self._frames_since_adjustment = 0
+      self._num_adjustments += 1
+    return changed
+
+  def _adjust(self) -> bool:
+    """Adjusts the frame rate and quality. Returns true if they are changed."""
+    bounds = self._bounds
+    budget = 1.0 / self._fps
+    cost = self._step_secs + self._encode_secs
+    over_bandwidth = (
+        bounds.max_bytes_per_sec and
+        self._size * self._fps > bounds.max_bytes_per_sec)
+    if self._backlog > bounds.max_backlog or cost > budget or over_bandwidth:
+      # Degrade the quality first to keep the frame rate stable.
+      if self._quality > bounds.min_quality:
+        self._quality = max(bounds.min_quality,
+                            self._quality - self._quality_step)
+        return True
+      if self._fps > bounds.min_fps:
+        self._fps = max(bounds.min_fps, self._fps * 0.8)
+        return True
+      return False
+    if self._backlog == 0 and cost < 0.5 * budget and not over_bandwidth:
+      # Restore the frame rate and then the quality.
+      if self._fps < bounds.max_fps:
+        self._fps = min(bounds.max_fps, self._fps * 1.25)
+        return True
+      if self._quality < bounds.max_quality:
+        self._quality = min(bounds.max_quality,
+                            self._quality + self._quality_step)
+        return True
+    return False
+
+  def stats(self) -> Dict[str, Any]:
+    """Returns the statistics of the controller."""
+    return {
+        'fps': self._fps,
+        'quality': self._quality,
+        'step_secs': self._step_secs,
+        'encode_secs': self._encode_secs,
+        'size': self._size,
+        'backlog': self._backlog,
+        'num_frames': self._num_frames,
+        'num_adjustments': self._num_adjustments,
+    }
+
+
+def _ema(average: Optional[float], value: float) -> float:
+  """Returns the updated exponential moving average."""
+  if average is None:
+    return value
+  return average + _EMA_ALPHA * (value - average)
@@ -0,0 +1,106 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.stream_controller."""
+
+from absl.testing import absltest
+from rlds_creator import stream_controller
+
+
+def _create_controller(**kwargs) -> stream_controller.StreamController:
+  bounds = stream_controller.Bounds(
+      min_fps=5, max_fps=20, min_quality=20, max_quality=80, max_backlog=2)
+  return stream_controller.StreamController(
+      bounds, adjust_interval=1, quality_step=10, **kwargs)
+
+
+def _record(controller, n, step_secs=0.001, encode_secs=0.001, size=1000,
+            backlog=0):
+  for _ in range(n):
+    controller.record_frame(step_secs, encode_secs, size, backlog)
+
+
+class StreamControllerTest(absltest.TestCase):
+
+  def test_defaults(self):
+    controller = _create_controller()
+    self.assertEqual(20, controller.fps)
+    self.assertEqual(80, controller.quality)
+
+  def test_backlog_reduces_quality_first(self):
+    controller = _create_controller()
+    _record(controller, 3, backlog=5)
+    self.assertEqual(20, controller.fps)
+    self.assertEqual(50, controller.quality)
+    # Frame rate is reduced only after the quality reaches the minimum.
+    _record(controller, 3, backlog=5)
+    self.assertEqual(20, controller.fps)
+    self.assertEqual(20, controller.quality)
+    _record(controller, 1, backlog=5)
+    self.assertLess(controller.fps, 20)
+    _record(controller, 100, backlog=5)
+    self.assertEqual(5, controller.fps)
+    self.assertEqual(20, controller.quality)
+
+  def test_slow_step_reduces_quality(self):
+    controller = _create_controller()
+    # Step and encoding take longer than 1/20 secs.
+    _record(controller, 1, step_secs=0.04, encode_secs=0.02)
+    self.assertEqual(70, controller.quality)
+
+  def test_bandwidth_limit(self):
+    bounds = stream_controller.Bounds(
+        max_fps=10, min_quality=20, max_quality=80, max_bytes_per_sec=10000)
+    controller = stream_controller.StreamController(
+        bounds, adjust_interval=1)
+    _record(controller, 1, size=2000)
+    self.assertLess(controller.quality, 80)
+    _record(controller, 50, size=500)
+    self.assertEqual(80, controller.quality)
+
+  def test_restores_fps_then_quality(self):
+    controller = _create_controller(fps=5, quality=20)
+    _record(controller, 1)
+    self.assertGreater(controller.fps, 5)
+    self.assertEqual(20, controller.quality)
+    _record(controller, 100)
+    self.assertEqual(20, controller.fps)
+    self.assertEqual(80, controller.quality)
+
+  def test_adjust_interval(self):
+    controller = stream_controller.StreamController(
+        stream_controller.Bounds(), adjust_interval=5)
+    _record(controller, 4, backlog=5)
+    self.assertEqual(stream_controller.Bounds().max_quality, controller.quality)
+    _record(controller, 1, backlog=5)
+    self.assertLess(controller.quality, stream_controller.Bounds().max_quality)
+    self.assertEqual(5, controller.stats()['num_frames'])
+    self.assertEqual(1, controller.stats()['num_adjustments'])
+
+  def test_set_max(self):
+    controller = _create_controller()
+    controller.set_max_fps(10)
+    controller.set_max_quality(50)
+    self.assertEqual(10, controller.fps)
+    self.assertEqual(50, controller.quality)
+    # Maximum values cannot be lower than the minimum ones.
+    controller.set_max_fps(1)
+    controller.set_max_quality(1)
+    self.assertEqual(5, controller.fps)
+    self.assertEqual(20, controller.quality)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,184 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Encodes the text screens of the terminal based environments, e.g. NetHack.
+
+A text screen is a uint8 array of shape (rows, columns, 2) with the character
+and the color of each cell. It is sent to the client in a compact binary format
+and drawn with a monospace font, instead of being rasterized and encoded as an
+image.
+
+All the integers in the payloads are little endian. A payload starts with a
+header of the magic bytes, the kind of the payload (uint8) and the number of
+the rows and the columns of the screen (uint16). The header of a keyframe is
+followed by the characters and then the colors of all the cells in row-major
+order. The header of a delta is followed by the runs of the changed cells; each
+run has its row, column and length (uint16), followed by the characters and
+then the colors of its cells.
+"""
+
+import struct
+from typing import Any, Dict, Iterator, Tuple
+
+import numpy as np
+
+MIME_TYPE = 'application/x-rlds-text'
+
+KEYFRAME = 0
+DELTA = 1
+
+_MAGIC = b'RLTX'
+_HEADER = struct.Struct('<4sBHH')
+_RUN = struct.Struct('<HHH')
+# Runs of the changed cells that are separated by at most this many unchanged
+# cells are merged; sending the unchanged cells is cheaper than a run header.
+_MAX_GAP = (_RUN.size - 1) // 2
+
+
+def is_text_payload(data: bytes) -> bool:
+  """Returns true if the data is a payload of a text screen."""
+  return data[:len(_MAGIC)] == _MAGIC
+
+
+def encode_keyframe(screen: np.ndarray) -> bytes:
+  """Returns the payload with all the cells of the screen."""
+  rows, columns, _ = screen.shape
+  return b''.join([
+      _HEADER.pack(_MAGIC, KEYFRAME, rows, columns),
+      np.ascontiguousarray(screen[..., 0]).tobytes(),
+      np.ascontiguousarray(screen[..., 1]).tobytes()
+  ])
+
+
+def decode(data: bytes, previous: np.ndarray = None) -> np.ndarray:
+  """Returns the screen in the payload.
+
+  Args:
+    data: A keyframe or a delta payload.
+    previous: Screen that the delta is applied to. It is not modified.
+
+  Raises:
+    ValueError: If the data is not a valid payload.
+  """
+  if not is_text_payload(data):
+    raise ValueError('Not a text screen.')
+  _, kind, rows, columns = _HEADER.unpack_from(data)
+  offset = _HEADER.size
+  size = rows * columns
+  buffer = np.frombuffer(data, dtype=np.uint8)
+  if kind == KEYFRAME:
+    chars = buffer[offset:offset + size]
+    colors = buffer[offset + size:offset + 2 * size]
+    return np.stack([chars, colors], axis=-1).reshape((rows, columns, 2))
+  if previous is None or previous.shape != (rows, columns, 2):
+    raise ValueError('Delta does not match the previous screen.')
+  screen = previous.copy()
+  while offset < len(data):
+    row, column, length = _RUN.unpack_from(data, offset)
+    offset += _RUN.size
+    screen[row, column:column + length, 0] = buffer[offset:offset + length]
+    offset += length
+    screen[row, column:column + length, 1] = buffer[offset:offset + length]
+    offset += length
+  return screen
+
+
+class TextEncoder(object):
+  """Encodes the cells of a screen that differ from the previous screen.
+
+  The adjacent changed cells in a row are encoded together. If the delta is not
+  smaller than the whole screen, or it can't be applied by the client, then a
+  keyframe is sent instead.
+  """
+
+  def __init__(self):
+    # Copy of the previous screen, i.e. the one displayed by the client.
+    self._previous = None
+    self._num_keyframes = 0
+    self._num_deltas = 0
+    self._num_runs = 0
+    self._num_bytes = 0
+
+  def reset(self):
+    """Resets the previous screen; the next screen will be a keyframe."""
+    self._previous = None
+
+  def _set_previous(self, screen: np.ndarray):
+    if self._previous is None or self._previous.shape != screen.shape:
+      self._previous = np.empty_like(screen)
+    np.copyto(self._previous, screen)
+
+  def encode(self, screen: np.ndarray, keyframe: bool = False) -> bytes:
+    """Returns the payload of the screen.
+
+    Args:
+      screen: Characters and colors of the screen.
+      keyframe: If true, then the whole screen will be sent.
+
+    Returns:
+      A delta against the previous screen, which has no runs if the screen is
+      unchanged, or a keyframe.
+    """
+    rows, columns, _ = screen.shape
+    data = None
+    if (not keyframe and self._previous is not None and
+        self._previous.shape == screen.shape):
+      parts = [_HEADER.pack(_MAGIC, DELTA, rows, columns)]
+      num_runs = 0
+      for row, start, end in _get_runs(
+          (screen != self._previous).any(axis=2)):
+        cells = screen[row, start:end]
+        parts.extend([
+            _RUN.pack(row, start, end - start), cells[:, 0].tobytes(),
+            cells[:, 1].tobytes()
+        ])
+        num_runs += 1
+      data = b''.join(parts)
+      if len(data) < _HEADER.size + 2 * rows * columns:
+        self._num_deltas += 1
+        self._num_runs += num_runs
+      else:
+        data = None
+    if data is None:
+      data = encode_keyframe(screen)
+      self._num_keyframes += 1
+    self._set_previous(screen)
+    self._num_bytes += len(data)
+    return data
+
+  def stats(self) -> Dict[str, Any]:
+    """Returns the number of the payloads and their total size."""
+    return {
+        'num_keyframes': self._num_keyframes,
+        'num_deltas': self._num_deltas,
+        'num_runs': self._num_runs,
+        'num_bytes': self._num_bytes,
+    }
+
+
+def _get_runs(changed: np.ndarray) -> Iterator[Tuple[int, int, int]]:
+  """Yields the (row, start, end) of the runs of changed cells in each row."""
+  for row in np.flatnonzero(changed.any(axis=1)):
+    # Starts and ends of the runs are where the padded row changes its value.
+    padded = np.concatenate([[False], changed[row], [False]])
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    # Merges the runs with small gaps in between; a merged run starts after a
+    # large gap and ends before the next one.
+    large_gaps = starts[1:] - ends[:-1] > _MAX_GAP
+    starts = starts[np.concatenate([[True], large_gaps])]
+    ends = ends[np.concatenate([large_gaps, [True]])]
+    for start, end in zip(starts, ends):
+      yield int(row), int(start), int(end)
@@ -0,0 +1,110 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.text_stream."""
+
+from absl.testing import absltest
+import numpy as np
+from rlds_creator import text_stream
+
+
+def _screen(rows: int = 24, columns: int = 80) -> np.ndarray:
+  screen = np.zeros((rows, columns, 2), dtype=np.uint8)
+  screen[..., 0] = ord(' ')
+  screen[..., 1] = 7
+  return screen
+
+
+def _kind(data: bytes) -> int:
+  return data[4]
+
+
+class TextStreamTest(absltest.TestCase):
+
+  def test_keyframe(self):
+    screen = _screen()
+    screen[0, :5, 0] = np.frombuffer(b'Hello', dtype=np.uint8)
+    data = text_stream.encode_keyframe(screen)
+    self.assertTrue(text_stream.is_text_payload(data))
+    self.assertEqual(text_stream.KEYFRAME, _kind(data))
+    # Header and two bytes per cell.
+    self.assertLen(data, 9 + 2 * 24 * 80)
+    np.testing.assert_array_equal(screen, text_stream.decode(data))
+
+  def test_delta(self):
+    encoder = text_stream.TextEncoder()
+    screen = _screen()
+    encoder.encode(screen)
+    previous = screen.copy()
+    # The player moves and the status line changes.
+    screen[10, 20, 0] = ord('.')
+    screen[10, 21, 0] = ord('@')
+    screen[23, 0:3, 0] = np.frombuffer(b'HP:', dtype=np.uint8)
+    screen[23, 0:3, 1] = 2
+    data = encoder.encode(screen)
+    self.assertEqual(text_stream.DELTA, _kind(data))
+    # Header and two runs of 2 and 3 cells.
+    self.assertLen(data, 9 + 2 * 6 + 2 * 5)
+    np.testing.assert_array_equal(screen, text_stream.decode(data, previous))
+
+  def test_delta_merges_small_gaps(self):
+    encoder = text_stream.TextEncoder()
+    screen = _screen()
+    encoder.encode(screen)
+    previous = screen.copy()
+    screen[0, [0, 3, 10], 0] = ord('x')
+    data = encoder.encode(screen)
+    # Cells 0-3 are sent as a single run.
+    self.assertLen(data, 9 + 2 * 6 + 4 * 2 + 2)
+    np.testing.assert_array_equal(screen, text_stream.decode(data, previous))
+
+  def test_unchanged(self):
+    encoder = text_stream.TextEncoder()
+    screen = _screen()
+    encoder.encode(screen)
+    data = encoder.encode(screen)
+    self.assertEqual(text_stream.DELTA, _kind(data))
+    self.assertLen(data, 9)
+
+  def test_keyframes(self):
+    encoder = text_stream.TextEncoder()
+    screen = _screen()
+    self.assertEqual(text_stream.KEYFRAME, _kind(encoder.encode(screen)))
+    self.assertEqual(text_stream.KEYFRAME,
+                     _kind(encoder.encode(screen, keyframe=True)))
+    # Most of the screen changes.
+    screen[..., 0] = ord('#')
+    self.assertEqual(text_stream.KEYFRAME, _kind(encoder.encode(screen)))
+    # The size changes.
+    self.assertEqual(text_stream.KEYFRAME,
+                     _kind(encoder.encode(_screen(rows=25))))
+    encoder.reset()
+    self.assertEqual(text_stream.KEYFRAME,
+                     _kind(encoder.encode(_screen(rows=25))))
+    self.assertEqual(5, encoder.stats()['num_keyframes'])
+    self.assertEqual(0, encoder.stats()['num_deltas'])
+
+  def test_decode_invalid(self):
+    with self.assertRaisesRegex(ValueError, 'Not a text screen'):
+      text_stream.decode(b'\x89PNG\r\n\x1a\n')
+    encoder = text_stream.TextEncoder()
+    encoder.encode(_screen())
+    delta = encoder.encode(_screen())
+    with self.assertRaisesRegex(ValueError, 'previous screen'):
+      text_stream.decode(delta, _screen(rows=2))
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,165 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Encodes the changed regions of the consecutive images of a stream."""
+
+import dataclasses
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from rlds_creator import frame_encoder
+from rlds_creator import image_codecs
+
+# Width and height of the tiles. It is a multiple of the JPEG block size.
+DEFAULT_TILE_SIZE = 32
+# Maximum number of consecutive frames that are sent as tiles.
+DEFAULT_KEYFRAME_INTERVAL = 100
+# If a larger fraction of the tiles changes, then the whole image is sent.
+DEFAULT_MAX_CHANGED_FRACTION = 0.5
+
+
+@dataclasses.dataclass
+class Tile:
+  """An encoded region of an image."""
+  # Position of the top left corner of the tile in the image.
+  x: int
+  y: int
+  image: bytes
+
+
+class TileEncoder(object):
+  """Encodes the tiles of an image that differ from the previous image.
+
+  Images are split into a grid of fixed size tiles. The changed tiles are
+  detected by comparing the image with the previous one, and the adjacent
+  changed tiles in a row are encoded together. Periodically, or when most of
+  the image changes, the whole image should be sent instead; i.e. a keyframe.
+  """
+
+  def __init__(self,
+               tile_size: int = DEFAULT_TILE_SIZE,
+               keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL,
+               max_changed_fraction: float = DEFAULT_MAX_CHANGED_FRACTION):
+    """Creates a TileEncoder.
+
+    Args:
+      tile_size: Width and height of the tiles.
+      keyframe_interval: Maximum number of consecutive frames that are encoded
+        as tiles.
+      max_changed_fraction: Maximum fraction of the changed tiles to encode
+        them separately.
+    """
+    self._tile_size = tile_size
+    self._keyframe_interval = keyframe_interval
+    self._max_changed_fraction = max_changed_fraction
+    # Frame encoder of the tiles. It is separate from that of the whole images
+    # as they may be encoded in different threads.
+    self.frame_encoder = frame_encoder.FrameEncoder()
+    self._codec_encoder = image_codecs.CodecEncoder(self.frame_encoder)
+    # Copy of the previous image, i.e. the one displayed by the client.
+    self._previous = None
+    self._frames_since_keyframe = 0
+    self._num_delta_frames = 0
+    self._num_keyframes = 0
+    self._num_tiles = 0
+
+  def reset(self):
+    """Resets the previous image; the next image will be a keyframe."""
+    self._previous = None
+
+  def _set_previous(self, image: np.ndarray):
+    if self._previous is None or self._previous.shape != image.shape:
+      self._previous = np.empty_like(image)
+    np.copyto(self._previous, image)
+
+  def _set_keyframe(self, image: np.ndarray):
+    self._set_previous(image)
+    self._num_keyframes += 1
+    self._frames_since_keyframe = 0
+
+  def encode(self,
+             image: np.ndarray,
+             codec_name: str,
+             quality: int,
+             keyframe: bool = False) -> Optional[List[Tile]]:
+    """Encodes the changed tiles of the image.
+
+    Args:
+      image: An RGB or grayscale image with uint8 values.
+      codec_name: Name of the image codec.
+      quality: Quality of the lossy codecs (0-100).
+      keyframe: If true, then the whole image will be sent.
+
+    Returns:
+      List of changed tiles, which is empty if the image is the same as the
+      previous one, or None if the whole image should be sent.
+    """
+    if (keyframe or self._previous is None or
+        self._previous.shape != image.shape or
+        self._frames_since_keyframe >= self._keyframe_interval):
+      self._set_keyframe(image)
+      return None
+    changed = self._get_changed_tiles(image)
+    if changed.mean() > self._max_changed_fraction:
+      self._set_keyframe(image)
+      return None
+    tiles = []
+    size = self._tile_size
+    for row, start, end in _get_runs(changed):
+      y, x = int(row) * size, int(start) * size
+      region = image[y:y + size, x:end * size]
+      name, data = self._codec_encoder.encode(codec_name, region, quality)
+      if name != codec_name:
+        # The tiles should have the same format as the whole image.
+        self._set_keyframe(image)
+        return None
+      tiles.append(Tile(x=x, y=y, image=data))
+    self._set_previous(image)
+    self._num_delta_frames += 1
+    self._frames_since_keyframe += 1
+    self._num_tiles += len(tiles)
+    return tiles
+
+  def _get_changed_tiles(self, image: np.ndarray) -> np.ndarray:
+    """Returns a boolean matrix of the tiles that are changed."""
+    changed = image != self._previous
+    if changed.ndim == 3:
+      changed = changed.any(axis=2)
+    # Reduces the rows and then the columns of each tile. The tiles at the
+    # right and bottom edges may be smaller.
+    height, width = changed.shape
+    changed = np.logical_or.reduceat(
+        changed, np.arange(0, height, self._tile_size), axis=0)
+    return np.logical_or.reduceat(
+        changed, np.arange(0, width, self._tile_size), axis=1)
+
+  def stats(self) -> Dict[str, Any]:
+    """Returns the number of frames and tiles and the codec stats."""
+    return {
+        'num_keyframes': self._num_keyframes,
+        'num_delta_frames': self._num_delta_frames,
+        'num_tiles': self._num_tiles,
+        'codecs': self._codec_encoder.stats(),
+    }
+
+
+def _get_runs(changed: np.ndarray) -> Iterator[Tuple[int, int, int]]:
+  """Yields the (row, start, end) of the runs of changed tiles in each row."""
+  for row in np.flatnonzero(changed.any(axis=1)):
+    # Starts and ends of the runs are where the padded row changes its value.
+    padded = np.concatenate([[False], changed[row], [False]])
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    for start, end in zip(edges[::2], edges[1::2]):
+      yield row, start, end
@@ -0,0 +1,77 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.tile_encoder."""
+
+import io
+
+from absl.testing import absltest
+import numpy as np
+import PIL.Image
+from rlds_creator import image_codecs
+from rlds_creator import tile_encoder
+
+
+def _decode(data: bytes) -> np.ndarray:
+  return np.asarray(PIL.Image.open(io.BytesIO(data)).convert('RGB'))
+
+
+class TileEncoderTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.encoder = tile_encoder.TileEncoder(tile_size=8, keyframe_interval=3)
+    self.image = np.zeros((20, 36, 3), dtype=np.uint8)
+
+  def encode(self, image, **kwargs):
+    return self.encoder.encode(image, image_codecs.PNG, 50, **kwargs)
+
+  def test_encode(self):
+    # First image is a keyframe.
+    self.assertIsNone(self.encode(self.image))
+    self.assertEmpty(self.encode(self.image))
+
+    image = self.image.copy()
+    # Two adjacent tiles in the first row and a partial tile at the bottom
+    # right corner.
+    image[1, 7:9] = 255
+    image[19, 35] = 128
+    tiles = self.encode(image)
+    self.assertLen(tiles, 2)
+    self.assertEqual((0, 0), (tiles[0].x, tiles[0].y))
+    np.testing.assert_array_equal(image[:8, :16], _decode(tiles[0].image))
+    self.assertEqual((32, 16), (tiles[1].x, tiles[1].y))
+    np.testing.assert_array_equal(image[16:, 32:], _decode(tiles[1].image))
+
+  def test_keyframes(self):
+    self.assertIsNone(self.encode(self.image))
+    for _ in range(3):
+      self.assertEmpty(self.encode(self.image))
+    # Keyframe interval is reached.
+    self.assertIsNone(self.encode(self.image))
+    self.assertIsNone(self.encode(self.image, keyframe=True))
+    # Most of the image is changed.
+    self.assertIsNone(self.encode(self.image + 1))
+    # Shape is changed.
+    self.assertIsNone(self.encode(self.image[:16]))
+    self.encoder.reset()
+    self.assertIsNone(self.encode(self.image[:16]))
+    stats = self.encoder.stats()
+    self.assertEqual(6, stats['num_keyframes'])
+    self.assertEqual(3, stats['num_delta_frames'])
+
+
+if __name__ == '__main__':
+  absltest.main()
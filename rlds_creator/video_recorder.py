@@ -0,0 +1,214 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Records the videos of the episodes in a background thread."""
+
+import collections
+import enum
+import threading
+from typing import Any, Dict, List, Tuple
+
+from absl import logging
+import cv2
+import numpy as np
+
+# Default maximum number of frames waiting to be encoded.
+DEFAULT_MAX_QUEUE_SIZE = 32
+
+
+class DropPolicy(enum.Enum):
+  """What to do with a new frame when the queue of the recorder is full."""
+  # Wait until there is space in the queue. Videos have all the frames, but the
+  # stepping thread may be slowed down.
+  BLOCK = 'block'
+  # Drop the new frame.
+  DROP_NEWEST = 'drop_newest'
+  # Drop the oldest pending frame.
+  DROP_OLDEST = 'drop_oldest'
+
+
+# Kinds of the items in the queue.
+_START = 'start'
+_FRAME = 'frame'
+_FINISH = 'finish'
+_STOP = 'stop'
+
+
+class VideoRecorder(object):
+  """Encodes the frames of the videos in a dedicated thread.
+
+  The frames are converted to BGR channel order in the caller thread, into
+  reused buffers, and encoded by the recorder thread. Only a single video is
+  recorded at a time; start() and finish() should be called from the same
+  thread.
+  """
+
+  def __init__(self,
+               max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+               drop_policy: DropPolicy = DropPolicy.BLOCK,
+               name: str = 'video_recorder'):
+    """Creates a VideoRecorder.
+
+    Args:
+      max_queue_size: Maximum number of frames waiting to be encoded.
+      drop_policy: What to do with a new frame when the queue is full.
+      name: Name of the recorder thread.
+    """
+    self._max_queue_size = max_queue_size
+    self._drop_policy = drop_policy
+    self._cond = threading.Condition()
+    self._items = collections.deque()
+    self._num_pending_frames = 0
+    # Buffers of the encoded frames that can be reused.
+    self._free_buffers: List[np.ndarray] = []
+    self._recording = False
+    self._closed = False
+    # Statistics.
+    self._num_frames = 0
+    self._num_dropped_frames = 0
+    self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+    self._thread.start()
+
+  @property
+  def recording(self) -> bool:
+    """True if a video is being recorded."""
+    return self._recording
+
+  def _put(self, kind: str, payload: Any = None):
+    with self._cond:
+      self._items.append((kind, payload))
+      self._cond.notify_all()
+
+  def start(self, path: str, fps: float, size: Tuple[int, int]):
+    """Starts recording a video.
+
+    Args:
+      path: Path of the video file in MP4 format.
+      fps: Frame rate of the video.
+      size: Width and height of the frames.
+    """
+    if self._closed:
+      raise ValueError('Video recorder is closed.')
+    if self._recording:
+      self.finish()
+    self._recording = True
+    self._put(_START, (path, fps, size))
+
+  def write(self, image: np.ndarray) -> bool:
+    """Adds a frame to the video.
+
+    Args:
+      image: An RGB image. It is copied and can be reused by the caller.
+
+    Returns:
+      True if the frame is added, false if it is dropped or no video is being
+      recorded.
+    """
+    if not self._recording:
+      return False
+    with self._cond:
+      if self._num_pending_frames >= self._max_queue_size:
+        if self._drop_policy == DropPolicy.DROP_NEWEST:
+          self._num_dropped_frames += 1
+          return False
+        elif self._drop_policy == DropPolicy.DROP_OLDEST:
+          self._drop_oldest_frame()
+        else:
+          self._cond.wait_for(
+              lambda: self._num_pending_frames < self._max_queue_size)
+      buffer = self._get_buffer(image.shape)
+      self._num_pending_frames += 1
+    # CV2 expects the image in BGR channel order. Copying from the reversed view
+    # works for any strides without a temporary contiguous copy of the image.
+    np.copyto(buffer, image[..., ::-1])
+    self._put(_FRAME, buffer)
+    return True
+
+  def _get_buffer(self, shape: Tuple[int, ...]) -> np.ndarray:
+    """Returns a free buffer with the shape. Should be called with the lock."""
+    while self._free_buffers:
+      buffer = self._free_buffers.pop()
+      if buffer.shape == shape:
+        return buffer
+    return np.empty(shape, dtype=np.uint8)
+
+  def _drop_oldest_frame(self):
+    """Drops the oldest pending frame. Should be called with the lock."""
+    for item in self._items:
+      kind, buffer = item
+      if kind == _FRAME:
+        self._items.remove(item)
+        self._free_buffers.append(buffer)
+        self._num_pending_frames -= 1
+        self._num_dropped_frames += 1
+        return
+
+  def finish(self):
+    """Blocks until the pending frames are encoded and the video is closed."""
+    if not self._recording:
+      return
+    self._recording = False
+    done = threading.Event()
+    self._put(_FINISH, done)
+    done.wait()
+
+  def close(self):
+    """Finishes the current video and stops the recorder thread."""
+    if self._closed:
+      return
+    self.finish()
+    self._closed = True
+    self._put(_STOP)
+    self._thread.join()
+
+  def _run(self):
+    """Encodes the frames in the queue."""
+    writer = None
+    while True:
+      with self._cond:
+        self._cond.wait_for(lambda: self._items)
+        kind, payload = self._items.popleft()
+      if kind == _STOP:
+        return
+      try:
+        if kind == _START:
+          path, fps, size = payload
+          fcc = cv2.VideoWriter_fourcc(*'avc1')
+          writer = cv2.VideoWriter(path, fcc, fps, size)
+        elif kind == _FRAME and writer:
+          writer.write(payload)
+          self._num_frames += 1
+        elif kind == _FINISH and writer:
+          writer.release()
+          writer = None
+      except Exception:  # pylint: disable=broad-except
+        logging.exception('Video recorder failed.')
+      finally:
+        if kind == _FRAME:
+          with self._cond:
+            self._num_pending_frames -= 1
+            self._free_buffers.append(payload)
+            self._cond.notify_all()
+        elif kind == _FINISH:
+          payload.set()
+
+  def stats(self) -> Dict[str, Any]:
+    """Returns the statistics of the recorder."""
+    with self._cond:
+      return {
+          'num_frames': self._num_frames,
+          'num_dropped_frames': self._num_dropped_frames,
+          'num_pending_frames': self._num_pending_frames,
+      }
@@ -0,0 +1,89 @@
+# coding=utf-8
+# Copyright 2021 RLDSCreator Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rlds_creator.video_recorder."""
+
+import threading
+
+from absl.testing import absltest
+import mock
+import numpy as np
+from rlds_creator import video_recorder
+
+
+class VideoRecorderTest(absltest.TestCase):
+
+  def _create_recorder(self, **kwargs):
+    recorder = video_recorder.VideoRecorder(**kwargs)
+    self.addCleanup(recorder.close)
+    return recorder
+
+  @mock.patch('cv2.VideoWriter')
+  def test_record(self, mock_writer_cls):
+    recorder = self._create_recorder()
+    writer = mock_writer_cls.return_value
+    frames = []
+    writer.write.side_effect = lambda frame: frames.append(frame.copy())
+    # Not recording yet.
+    image = np.zeros((4, 6, 3), dtype=np.uint8)
+    self.assertFalse(recorder.write(image))
+
+    recorder.start('video.mp4', 15, (6, 4))
+    self.assertTrue(recorder.recording)
+    for i in range(3):
+      image[:] = (i, 0, 255)
+      self.assertTrue(recorder.write(image))
+    recorder.finish()
+    self.assertFalse(recorder.recording)
+
+    mock_writer_cls.assert_called_once_with('video.mp4', mock.ANY, 15, (6, 4))
+    writer.release.assert_called_once()
+    # Frames should be copied and in BGR channel order.
+    self.assertLen(frames, 3)
+    for i, frame in enumerate(frames):
+      np.testing.assert_array_equal(np.full((4, 6, 3), (255, 0, i)), frame)
+    self.assertEqual(3, recorder.stats()['num_frames'])
+
+  @mock.patch('cv2.VideoWriter')
+  def test_drop_policy(self, mock_writer_cls):
+    event = threading.Event()
+    mock_writer_cls.return_value.write.side_effect = lambda frame: event.wait()
+    image = np.zeros((4, 6, 3), dtype=np.uint8)
+    for policy in (video_recorder.DropPolicy.DROP_NEWEST,
+                   video_recorder.DropPolicy.DROP_OLDEST):
+      event.clear()
+      recorder = self._create_recorder(max_queue_size=2, drop_policy=policy)
+      recorder.start('video.mp4', 15, (6, 4))
+      for _ in range(5):
+        recorder.write(image)
+      # At most 2 frames are pending, including the one being encoded.
+      self.assertEqual(3, recorder.stats()['num_dropped_frames'])
+      event.set()
+      recorder.finish()
+      self.assertEqual(2, recorder.stats()['num_frames'])
+
+  @mock.patch('cv2.VideoWriter')
+  def test_failure(self, mock_writer_cls):
+    mock_writer_cls.return_value.write.side_effect = ValueError('Failure.')
+    recorder = self._create_recorder(max_queue_size=1)
+    recorder.start('video.mp4', 15, (6, 4))
+    for _ in range(3):
+      self.assertTrue(recorder.write(np.zeros((4, 6, 3), dtype=np.uint8)))
+    # Should not block.
+    recorder.finish()
+
+
+if __name__ == '__main__':
+  absltest.main()